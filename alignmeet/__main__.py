@@ -1,8 +1,18 @@
+import time
+_start = time.perf_counter()
+
 import os
 import sys
 import struct
 import math, argparse
-from .autoalign import Aligner, Embedder
+
+if '--startup-profile' in sys.argv:
+    # installed before the remaining imports so that they are measured too
+    from .startup_profile import StartupProfile
+    profile = StartupProfile(_start).install()
+else:
+    profile = None
+
 from .annotation import *
 
 if os.name == 'nt':
@@ -12,7 +22,7 @@ if os.name == 'nt':
     plugin_path = os.path.join(dirname, 'plugins', 'platforms')
     os.environ['QT_QPA_PLATFORM_PLUGIN_PATH'] = plugin_path
 
-from PySide2.QtCore import QCoreApplication
+from PySide2.QtCore import QCoreApplication, QTimer
 from PySide2.QtWidgets import QApplication
 
 
@@ -44,42 +54,86 @@ def main():
             a.open_minutes(filename)
         else:
             assert False
-        embeds = e.embed(a._das if type == TR else a._minutes)
-        return embeds
+        from .embed_store import text_hash
+        lines = a._das if type == TR else a._minutes
+        return e.embed(lines), [text_hash(l.text) for l in lines]
     
     parser = argparse.ArgumentParser(prog='Alignmeet', description="Annotation Tool for Meeting Minuting", epilog="Or run without arguments for annotation GUI.")
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--autoembed', dest='autoembed', action='store_true', help='Run GUI with autoembed.')
     group.add_argument('-et', dest='et', metavar='Filename', type=str, nargs='+', help='Generate embeddings for given transcripts.')
     group.add_argument('-em', dest='em', metavar='Filename', type=str, nargs='+', help='Generate embeddings for given minutes files.')
+    group.add_argument('-ec', '--embed-corpus', dest='ec', metavar='Path', type=str, nargs='+', help='Generate embeddings for all transcripts and minutes in given directories or globs.')
+    group.add_argument('-aa', '--align-corpus', dest='aa', metavar='Path', type=str, nargs='+', help='Autoalign every transcript with every minutes file of the meetings in given directories or globs (needs embeddings from -ec).')
+    group.add_argument('--calibrate', dest='calibrate', metavar='Path', type=str, nargs='+', help='Find the F1-optimal autoalign threshold on the final alignments of the meetings in given directories or globs (needs embeddings from -ec) and store it as the default, per meeting type (the folder holding the meeting) and overall.')
+    group.add_argument('--pack', dest='pack', metavar=('Folder', 'Container'), type=str, nargs=2, help='Import a meeting folder into a single-file meeting container (.alignmeet), which the GUI opens as the folder.')
+    group.add_argument('--unpack', dest='unpack', metavar=('Container', 'Folder'), type=str, nargs=2, help='Export a meeting container back to the folder layout, files as they were imported or saved.')
     group.add_argument('-a', '--align', dest='a', metavar=('Minutes_Embed', 'Transcript_Embed'), type=str, nargs=2, help='Generate alignment based on given file embeddings.')
-    parser.add_argument('--thr', type=float, help="Threshold for alignment (0.0 to 1.0).", required=False, default=0.5)
+    parser.add_argument('--workers', type=int, help="Worker processes for -ec and -aa.", required=False, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--batch-size', dest='batch_size', type=int, help="Lines encoded in one batch by -ec.", required=False, default=64)
+    parser.add_argument('--progress', type=str, help="Resume manifest for -ec and -aa (default .alignmeet-embed-progress.json and .alignmeet-align-progress.json).", required=False, default=None)
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true', help="List what -aa would align without aligning, or report what --calibrate finds without storing it.")
+    parser.add_argument('--model', type=str, help="Embedding model: a SentenceTransformer name, or lexical-ngram-v1 for the fast model-free backend.", required=False, default=None)
+    parser.add_argument('--fp16', action='store_true', help="Store embeddings generated by -et/-em/-ec as float16.")
+    parser.add_argument('--thr', type=float, help="Threshold for alignment (0.0 to 1.0), the calibrated one by default.", required=False, default=None)
+    parser.add_argument('--monotonic', action='store_true', help="Keep the order of minutes when aligning (allows only --back-jumps jumps back).")
+    parser.add_argument('--back-jumps', dest='back_jumps', type=int, help="Number of jumps back to an earlier minute allowed with --monotonic.", required=False, default=2)
+    parser.add_argument('--band', type=float, help="Fraction of minutes around the diagonal searched with --monotonic.", required=False, default=0.25)
     parser.add_argument('-nf', '--not-final', dest='final', action='store_false' , help="Store alignment as tentative (to be confirmed by hand in GUI).")
+    parser.add_argument('--startup-profile', dest='startup_profile', action='store_true', help="Open the GUI, report time to the first window by phase and imported module and quit.")
     args=parser.parse_args()
+    dtype = 'float16' if args.fp16 else 'float32'
+    from .embed_service import DEFAULT_MODEL
+    model = args.model or DEFAULT_MODEL
     
+    if args.et or args.em or args.a:
+        from .autoalign import Aligner, Embedder
+
     if args.et:
         print("Preparing embedder...")
-        e = Embedder()
+        e = Embedder(model)
+        e.service.prewarm()
         a = Annotation(None, False)
         a.set_path('.') #TODO: make sure this actually works lmao, will need to implement abs. paths
         for file in args.et:
             print(f"Embedding {file}...")
-            Embedder.saveEmbed(embed(file, TR), file + '.embed')
+            embeds, hashes = embed(file, TR)
+            Embedder.saveEmbed(embeds, file + '.embed', hashes, model, dtype)
     elif args.em:
         print("Preparing embedder...")
-        e = Embedder()
+        e = Embedder(model)
+        e.service.prewarm()
         a = Annotation(None, False)
         a.set_path('.')
         for file in args.em:
             print(f"Embedding {file}...")
-            Embedder.saveEmbed(embed(file, MIN), file + '.embed')
+            embeds, hashes = embed(file, MIN)
+            Embedder.saveEmbed(embeds, file + '.embed', hashes, model, dtype)
+    elif args.ec:
+        from .corpus import embed_corpus, PROGRESS_FILE
+        embed_corpus(args.ec, args.workers, args.batch_size, dtype, args.progress or PROGRESS_FILE, model)
+    elif args.aa:
+        from .corpus import align_corpus, ALIGN_PROGRESS_FILE
+        align_corpus(args.aa, args.workers, args.thr, args.monotonic, args.back_jumps, args.band, args.final,
+            args.progress or ALIGN_PROGRESS_FILE, args.dry_run, model)
+    elif args.calibrate:
+        from .calibrate import calibrate_corpus
+        calibrate_corpus(args.calibrate, model, not args.dry_run)
+    elif args.pack:
+        from .container import import_folder
+        import_folder(*args.pack)
+    elif args.unpack:
+        from .container import export_folder
+        export_folder(*args.unpack)
     elif args.a:
         print(f"Loading {args.a[0]}...")
         trems = Embedder.loadEmbed(args.a[0])
         print(f"Loading {args.a[1]}...")
         minems = Embedder.loadEmbed(args.a[1])
         print("Aligning...")
-        alignments = Aligner.align(trems, minems, args.thr)
+        from .calibrate import default_threshold
+        thr = args.thr if args.thr is not None else default_threshold(os.path.dirname(os.path.dirname(os.path.abspath(args.a[0]))), model)
+        alignments = Aligner.align(trems, minems, thr, args.monotonic, args.back_jumps, args.band)
         tr_name = os.path.basename(args.a[0])
         if str.endswith(tr_name, '.embed'):
             tr_name = tr_name[:-6]
@@ -97,15 +151,34 @@ def main():
                         f.write(f"{i+1} {math.floor(alignment)}? None\n")
         #TODO ask if overwrite (event. add -y switch)
     else:
+        if args.autoembed:
+            # load the model while the window opens, it is shared by all embedding threads
+            from .embed_service import EmbeddingService
+            EmbeddingService.get(model).prewarm()
+        if profile:
+            profile.phase('imports')
         app = QApplication(sys.argv)
         app.setStyle("Fusion")    
+        if profile:
+            profile.phase('QApplication')
 
 
         Settings.apply_settings()
         a = Annotations()
         a.setAutoembed(args.autoembed)
+        a.annotation.embed_model = model
+        if profile:
+            profile.phase('main window')
             
         a.show()
+        if profile:
+            profile.phase('show')
+            def first_window():
+                profile.phase('first event loop turn')
+                profile.uninstall()
+                profile.report()
+                app.quit()
+            QTimer.singleShot(0, first_window)
 
         exit(app.exec_())
 
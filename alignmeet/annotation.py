@@ -1,43 +1,90 @@
 from os import path, listdir
 import os
+import io
 import re
+import gc
 import glob
+import time
 
-from PySide2.QtCore import Signal, Slot, QObject, QThread
+from PySide2.QtCore import Qt, Signal, Slot, QObject, QTimer
 from PySide2.QtGui import QColor
 from PySide2.QtWidgets import QMessageBox, QUndoStack, QUndoView, QUndoCommand
-from .autoalign import Aligner, Embedder
+
+from .calibrate import default_threshold
+from .embed_service import DEFAULT_MODEL
+from .jobs import JobScheduler
+from .journal import Journal
 
 SEPARATOR = '^'
 TRANSCRIPT_FOLDER = 'transcripts'
 MINUTES_FOLDER = 'minutes'
 ANNOTATIONS_FOLDER = 'annotations'
 EVALUATIONS_FOLDER = 'evaluations'
-
-class MinuteEmbedThread(QThread):
-        finished = Signal(list, str)
-        def __init__(self, annotation, filename):
-            super().__init__()
-            self.annotation = annotation
-            self.filename = filename
-            
-        def run(self):
-            e = Embedder()
-            embeds = e.embed(self.annotation._minutes)
-            if embeds:
-                self.finished.emit(list(embeds), self.filename)
-            
-class TranscriptEmbedThread(QThread):
-        finished = Signal(list, str)
-        def __init__(self, annotation, filename):
-            super().__init__()
-            self.annotation = annotation
-            self.filename = filename
-            
-        def run(self):
-            e = Embedder()
-            embeds = e.embed(self.annotation._das)
-            self.finished.emit(list(embeds), self.filename)
+REEMBED_DELAY = 500 # ms without edits before edited lines are re-embedded
+EMBED_TRANSCRIPT_JOB = 'Embedding transcript'
+EMBED_MINUTES_JOB = 'Embedding minutes'
+# files of an opened meeting, in the order save() writes them
+ALIGNMENT_FILE = 'annotation'
+EVALUATION_FILE = 'evaluation'
+MINUTES_FILE = 'minutes'
+TRANSCRIPT_FILE = 'transcript'
+SAVED_FILES = (ALIGNMENT_FILE, EVALUATION_FILE, MINUTES_FILE, TRANSCRIPT_FILE)
+INDEX_ROWS = 16 # lines journaled or repainted at once above which their rows are looked up in a map
+# roles of the cells of a line changed by an edit of its text or of its alignment, for mark_changed
+TEXT_ROLES = (Qt.DisplayRole, Qt.EditRole)
+COLOR_ROLES = (Qt.BackgroundRole, Qt.ForegroundRole)
+READ_BLOCK = 1 << 20 # bytes of a transcript decoded and split at once
+_SPEAKER_PREFIX = re.compile(r'\s*\([^)]+\)') # '(speaker) text'
+# (speaker prefix, text) of every line with a letter (others are skipped), matched over a whole block
+_LINE = re.compile(r'^(?=[^\n]*?[^\W\d_])([^\S\n]*\([^)\n]+\))?([^\n]*)$', re.M)
+
+def embed_job(token, progress, model, filename, lines, texts, embeds, rows):
+    # background job (see jobs.JobScheduler): embeds texts[rows], returns what is needed
+    # to update the lines and to write the sidecar of filename; lines, texts and embeds
+    # are snapshots taken when the job was submitted
+    from .autoalign import Embedder
+    from .embed_store import text_hash
+    embeds = list(embeds)
+    for i, embed in zip(rows, Embedder(model).embed_texts([texts[i] for i in rows], token, progress)):
+        embeds[i] = embed
+    token.check()
+    return filename, lines, embeds, [text_hash(t) for t in texts]
+
+def file_bytes(content):
+    # what a file of the text content holds
+    return content.replace('\n', os.linesep).encode('utf-8')
+
+def write_atomic(full_path, content):
+    # the content (text or bytes) is written next to the file and renamed over it, so that
+    # a crash leaves either the old or the new file, never a truncated one; returns bytes written
+    data = content if isinstance(content, bytes) else file_bytes(content)
+    tmp = full_path + '.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, full_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return len(data)
+
+def save_job(token, progress, files, container = None):
+    # background job (see jobs.JobScheduler) of Annotation.save writing [(path, content)],
+    # into the meeting container if the meeting is one
+    start = time.perf_counter()
+    written = 0
+    if container is not None:
+        # in one transaction
+        written = container.write_files(files)
+        progress(len(files), len(files))
+    else:
+        for i, (full_path, content) in enumerate(files):
+            written += write_atomic(full_path, content)
+            progress(i + 1, len(files))
+    return dict(files=[f for f, _ in files], bytes=written, seconds=time.perf_counter() - start)
 
 class Minute:
     # class for data of a single minute line
@@ -66,13 +113,14 @@ class Minute:
 class DialogAct:
     # class for data of a single transcript segment
     speakers = set()
+
     def __init__(self,  text = '', speaker = '',start = -1, end = -1, minute : Minute = None, problem = None, is_final = True):
         self._speaker = speaker
         if speaker is None or len(speaker) < 1:
-            for f in re.findall('^\s*\([^)]+\)', text):
-                speaker = f[1:-1]
-                text = text.replace(f, '', 1)
-                break
+            prefix = _SPEAKER_PREFIX.match(text)
+            if prefix is not None:
+                speaker = prefix.group()[1:-1]
+                text = text[prefix.end():]
         self.speaker = speaker
         self.text = text
         self.minute = minute
@@ -82,6 +130,22 @@ class DialogAct:
         self.end = float(end)
         self.embed = None
 
+    @classmethod
+    def fast(cls, text, speaker, start = -1.0, end = -1.0):
+        # as DialogAct(text, speaker, start, end) for loaders that parsed the line already:
+        # no speaker prefix check, float times, and the speaker is not added to speakers
+        # (they add those of the whole transcript at once)
+        da = cls.__new__(cls)
+        da._speaker = speaker
+        da.text = text
+        da.minute = None
+        da.is_final = True
+        da.problem = None
+        da.start = start
+        da.end = end
+        da.embed = None
+        return da
+
     def time_valid(self):
         return self.start > -1 and self.end > -1
 
@@ -93,6 +157,208 @@ class DialogAct:
         DialogAct.speakers.add(value)
         self._speaker = value
 
+def _parse_block(text, speakers):
+    # DialogActs of the lines of text (whole lines, '\n' separated)
+    # one regex pass over the block; plain '(speaker) text' lines are built by
+    # DialogAct.fast (its checks are done by the pattern) and their speakers are
+    # registered at once, lines with fields go through __init__
+    fast = DialogAct.fast
+    fields = SEPARATOR in text
+    das = []
+    for prefix, line in _LINE.findall(text):
+        if fields and (SEPARATOR in line or SEPARATOR in prefix):
+            das.append(DialogAct(*(prefix + line).split(SEPARATOR)))
+            continue
+        speaker = prefix[1:-1]
+        das.append(fast(line, speaker))
+        speakers.add(speaker)
+    return das
+
+def iter_transcript(full_path, progress = None):
+    # DialogAct per line with a letter, read in blocks of whole lines (decoded and
+    # parsed at once); progress(bytes read, file size) is called after every block
+    total = os.path.getsize(full_path)
+    done = 0
+    rest = b''
+    with open(full_path, 'rb') as f:
+        while True:
+            block = f.read(READ_BLOCK)
+            done += len(block)
+            if block:
+                end = block.rfind(b'\n') + 1
+                if end == 0:
+                    rest += block
+                    continue
+                text, rest = (rest + block[:end]).decode('utf-8'), block[end:]
+            else:
+                text, rest = rest.decode('utf-8'), b''
+            if '\r' in text:
+                text = text.replace('\r\n', '\n')
+            speakers = set()
+            yield from _parse_block(text, speakers)
+            DialogAct.speakers.update(speakers)
+            if progress is not None:
+                progress(done, total)
+            if not block:
+                return
+
+def parse_transcript(text):
+    # DialogActs of a whole transcript in memory (see iter_transcript)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    speakers = set()
+    das = _parse_block(text, speakers)
+    DialogAct.speakers.update(speakers)
+    return das
+
+def read_transcript(full_path, progress = None):
+    # the collector is paused while the DAs are allocated: none of them is garbage,
+    # yet their number would trigger a collection every few hundred lines
+    collect = gc.isenabled()
+    gc.disable()
+    try:
+        return list(iter_transcript(full_path, progress))
+    finally:
+        if collect:
+            gc.enable()
+
+def text_lines(data):
+    # lines of file content as readlines() of the file opened as text
+    return io.StringIO(data.decode('utf-8'), newline=None).readlines()
+
+def parse_minutes(lines):
+    return [Minute(line[:-1]) for line in lines] #remove newline
+
+def read_minutes(full_path):
+    data = []
+    try:
+        with open(full_path, 'r', encoding='utf-8') as f:
+            data = parse_minutes(f.readlines())
+    except:
+        pass
+    return data
+
+def read_alignment(full_path):
+    with open(full_path, 'r', encoding='utf-8') as f:
+        return parse_alignment(f.readlines())
+
+def parse_alignment(lines):
+    # [(DA index, minute index or None, final, problem)] of an annotations file (0-based);
+    # problem is an index to PROBLEMS, a custom remark or None
+    data = []
+    for line in lines:
+        line = line.strip().split(' ')
+        idx = int(line[0]) - 1
+        
+        final = True
+        if line[1].isdigit():
+            minute = int(line[1]) - 1
+        elif str.endswith(line[1], '?') and line[1][:-1].isdigit():
+            minute = int(line[1][:-1]) - 1
+            final = False
+        else:
+            minute = None
+        
+        if line[2].isdigit():
+            num = int(line[2])-1
+            problem = int(line[2]) - 1 if num >= 0 else None
+        elif len(line[2]) >= 2 and line[2][:2] == '0:':
+            #custom problem
+            if len(line) > 3: # space in custom problem
+                problem = line[2][2:] + ' ' + ' '.join(line[3:])
+            else:
+                problem = line[2][2:]
+        else:
+            problem = None
+        data.append((idx, minute, final, problem))
+    return data
+
+def format_alignment(das, minutes_index_map):
+    # content of an annotations file (see read_alignment)
+    lines = []
+    for idx, da in enumerate(das):
+        if da.minute != None or da.problem != None:
+            midx = minutes_index_map[da.minute]
+            if isinstance(da.problem, str):
+                problem = f'0:{da.problem}'
+            elif not da.problem is None:
+                problem = da.problem + 1
+            else:
+                problem = None
+            lines.append('{} {}{} {}\n'.format(
+                idx + 1,
+                midx + 1 if midx is not None else midx,
+                '?' if not da.is_final else '',
+                problem
+            ))
+    return ''.join(lines)
+
+def write_alignment(full_path, das, minutes_index_map):
+    return write_atomic(full_path, format_alignment(das, minutes_index_map))
+
+def replay_journal(records, das, minutes):
+    # applies the records of a journal (see journal.py) to das and minutes in place;
+    # returns the lines whose text may have changed, the files changed and the
+    # evaluation of the whole minutes if it was changed
+    edited, files, evaluation = [], set(), None
+    def restore_da(da, text, speaker, minute, final, problem):
+        da.text, da.speaker = text, speaker
+        da.minute = minutes[minute] if minute is not None else None
+        da.is_final, da.problem = final, problem
+    def restore_minute(m, text, adequacy, grammaticality, fluency, relevance):
+        m.text = text
+        m.adequacy, m.grammaticality, m.fluency, m.relevance = adequacy, grammaticality, fluency, relevance
+
+    for record in records:
+        op = record[0]
+        if op == 'd':
+            restore_da(das[record[1]], *record[2:])
+            edited.append(das[record[1]])
+        elif op == 'd+':
+            da = DialogAct()
+            restore_da(da, *record[2:])
+            das.insert(record[1], da)
+            edited.append(da)
+        elif op == 'd-':
+            del das[record[1]:record[1] + record[2]]
+        elif op == 'm':
+            restore_minute(minutes[record[1]], *record[2:])
+            edited.append(minutes[record[1]])
+        elif op == 'm+':
+            m = Minute()
+            restore_minute(m, *record[2:])
+            minutes.insert(record[1], m)
+            edited.append(m)
+        elif op == 'm-':
+            removed = set(minutes[record[1]:record[1] + record[2]])
+            for da in das:
+                if da.minute in removed:
+                    da.minute = None
+            del minutes[record[1]:record[1] + record[2]]
+        elif op == 'e':
+            evaluation = tuple(record[1:])
+        else:
+            raise ValueError(f'Unknown journal record {op}')
+        if op[0] == 'd':
+            files.update((TRANSCRIPT_FILE, ALIGNMENT_FILE, EVALUATION_FILE))
+        elif op[0] == 'm':
+            files.update((MINUTES_FILE, ALIGNMENT_FILE, EVALUATION_FILE))
+        else:
+            files.add(EVALUATION_FILE)
+    return edited, files, evaluation
+
+def changed_ranges(rows):
+    # [(first, last, roles)] of the runs of consecutive rows with the same roles in
+    # {row: roles}, each run is one dataChanged of a model
+    ranges = []
+    for row in sorted(rows):
+        roles = rows[row]
+        if ranges and ranges[-1][1] == row - 1 and ranges[-1][2] == roles:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row, roles])
+    return [(first, last, sorted(int(r) for r in roles)) for first, last, roles in ranges]
+
 class Annotation(QObject):
     #class that all widgets link to, stores data for the overall app
     visible_minutes_changed = Signal()
@@ -102,6 +368,12 @@ class Annotation(QObject):
     undo_toggle = Signal(bool)
     redo_toggle = Signal(bool)
     problems_changed = Signal()
+    preview_changed = Signal()
+    selection_changed = Signal()
+    saved = Signal(object) # report of save_job
+    # {line: roles} of the DAs and of the minutes changed since the last turn of the event
+    # loop (no roles: all of them), None for lines replaced by others (another file opened)
+    lines_changed = Signal(object, object)
 
     def __init__(self, annotations, undo = True, parent = None):
         super(Annotation, self).__init__(parent)
@@ -109,6 +381,7 @@ class Annotation(QObject):
         self.annotations = annotations
         
         self._path = ""
+        self.container = None # container.Container if the meeting is a single file
         self._modified = False
         self._transcript_file = None
         self._minutes_file = None
@@ -117,6 +390,7 @@ class Annotation(QObject):
         self.minutes_files = []
         self.transcript_files = []
         self.minutes_index_map = dict()
+        self.minute_das = dict() # minute -> set of the transcript's DAs aligned to it
 
         self._visible_minutes = set()
 
@@ -127,12 +401,46 @@ class Annotation(QObject):
         self._fluency = 1.0
         self._relevance = 1.0
         
-        self.tr_thread = None
-        self.min_thread = None
+        self.jobs = JobScheduler(self)
+        self.saver = JobScheduler(self, 1) # one thread, saves are written in order
+        self._save_count = 0
+        self.unsaved = set() # SAVED_FILES with changes since they were read or saved
+        self.journal = None # edits since the last save, replayed when the meeting is reopened
+        self._journal_timer = QTimer(self)
+        self._journal_timer.setSingleShot(True)
+        self._journal_timer.setInterval(0)
+        self._journal_timer.timeout.connect(self._open_journal)
+        # lines to repaint, the models are told once per turn of the event loop
+        self._changed = dict()
+        self._das_replaced = False
+        self._minutes_replaced = False
+        self._changes_timer = QTimer(self)
+        self._changes_timer.setSingleShot(True)
+        self._changes_timer.setInterval(0)
+        self._changes_timer.timeout.connect(self._emit_changes)
+        # bumped whenever another file is opened, results of older jobs are not applied
+        self._tr_generation = 0
+        self._min_generation = 0
         self.tr_embed_done = False
         self.min_embed_done = False
+        self._transcript_path = None
+        self._minutes_path = None
+        # lines edited since they were embedded, re-embedded after REEMBED_DELAY
+        self._dirty_das = set()
+        self._dirty_minutes = set()
+        self._reembed_timer = QTimer(self)
+        self._reembed_timer.setSingleShot(True)
+        self._reembed_timer.setInterval(REEMBED_DELAY)
+        self._reembed_timer.timeout.connect(self._reembed)
+        self._similarity = None # autoalign.SimilarityCache, created by the first autoalign
+        self._best_stale = True # lines or embeddings changed since the best matches were computed
+        self.preview = None # 1-based minute per DA that autoalign would pick at the previewed threshold
+        self._minute_engine = None # (AlignmentEngine, minutes) for suggestions, rebuilt after changes
         
-        self.threshold = 0.5 #for autoalign
+        self.embed_model = DEFAULT_MODEL
+        self.threshold = default_threshold(model=self.embed_model) #for autoalign
+        self.monotonic = False
+        self.back_jumps = 2
 
         self.remarks_backup = None
 
@@ -151,6 +459,11 @@ class Annotation(QObject):
         return self._modified
     @modified.setter
     def modified(self, value):
+        # modified = True marks every file as unsaved, mark_modified only some of them
+        if not value:
+            self.unsaved.clear()
+        elif not self.unsaved:
+            self.unsaved.update(SAVED_FILES)
         self.modified_changed.emit(value)
         self._modified = value
 
@@ -168,11 +481,20 @@ class Annotation(QObject):
 
     def insert_da(self, i, da):
         self._das.insert(i, da)
-        self.modified = True
+        self._journal_append(['d+', i] + self._da_state(da))
+        if da.minute is not None:
+            self.minute_das.setdefault(da.minute, set()).add(da)
+        self._similarity_changed()
+        self.mark_modified(TRANSCRIPT_FILE, ALIGNMENT_FILE, EVALUATION_FILE)
 
     def remove_das(self, i, count):
+        self._journal_append(['d-', i, count])
+        for da in self._das[i:i + count]:
+            self._unindex_da(da)
+            self._changed.pop(da, None)
         del self._das[i:i + count]
-        self.modified = True
+        self._similarity_changed()
+        self.mark_modified(TRANSCRIPT_FILE, ALIGNMENT_FILE, EVALUATION_FILE)
 
     def _make_minutes_index_map(self):
         self.minutes_index_map = dict([(m, idx) for idx, m in enumerate(self._minutes)])
@@ -181,20 +503,68 @@ class Annotation(QObject):
     def insert_minute(self, i, da):
         self._minutes.insert(i, da)
         self._make_minutes_index_map()
-        self.modified = True
+        # the colors are by the index of the minute
+        self.mark_changed(self._minutes, COLOR_ROLES)
+        self.mark_changed(self._das, COLOR_ROLES)
+        self._journal_append(['m+', i] + self._minute_state(da))
+        self._similarity_changed()
+        self.mark_modified(MINUTES_FILE, ALIGNMENT_FILE, EVALUATION_FILE)
 
     def remove_minutes(self, i, count):
-        to_rm = set(self._minutes[i:i + count])
-        for da in self._das:
-            if da.minute in to_rm:
+        self._journal_append(['m-', i, count])
+        for m in self._minutes[i:i + count]:
+            for da in self.minute_das.pop(m, ()):
                 da.minute = None
+            self._changed.pop(m, None)
         del self._minutes[i:i + count]
         self._make_minutes_index_map()
-        self.modified = True
+        self.mark_changed(self._minutes, COLOR_ROLES)
+        self.mark_changed(self._das, COLOR_ROLES)
+        self._similarity_changed()
+        self.mark_modified(MINUTES_FILE, ALIGNMENT_FILE, EVALUATION_FILE)
     
+    def _unindex_da(self, da):
+        das = self.minute_das.get(da.minute)
+        if das is not None:
+            das.discard(da)
+            if not das:
+                del self.minute_das[da.minute]
+                self.mark_changed([da.minute], TEXT_ROLES) # evaluated only when aligned
+
+    def _index_alignment(self):
+        self.minute_das = dict()
+        for da in self._das:
+            if da.minute is not None:
+                self.minute_das.setdefault(da.minute, set()).add(da)
+        self.mark_changed(self._das, COLOR_ROLES)
+        self.mark_changed(self._minutes, TEXT_ROLES)
+
+    def set_da_minute(self, da, minute):
+        # every change of the alignment of the transcript's DAs goes through here (or
+        # is followed by _index_alignment) to keep minute_das up to date
+        self._unindex_da(da)
+        da.minute = minute
+        self.mark_changed([da], COLOR_ROLES)
+        if minute is not None:
+            if minute not in self.minute_das:
+                self.mark_changed([minute], TEXT_ROLES)
+            self.minute_das.setdefault(minute, set()).add(da)
+
+    def is_minute_aligned(self, minute):
+        return minute in self.minute_das
+
     def set_path(self, p):
         self.modified = False
+        self.saver.wait()
+        self.close_journal()
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+        from .container import Container, is_container
+        if is_container(p):
+            self.container = Container(p)
         self._path = p
+        self.threshold = default_threshold(p, self.embed_model)
         self._refresh_files()
         self.path_changed.emit()
 
@@ -205,17 +575,32 @@ class Annotation(QObject):
     def _refresh_files(self):
         def clean_glob(files):
             return list(map(lambda f: f.split('/')[-1].split('\\')[-1], files))
-        if os.path.exists(path.normpath(path.join(self._path, MINUTES_FOLDER))):
-            self.minutes_files = listdir(path.normpath(path.join(self._path, MINUTES_FOLDER)))
+        container = self.container
+        if self._exists(path.normpath(path.join(self._path, MINUTES_FOLDER))):
+            folder = path.normpath(path.join(self._path, MINUTES_FOLDER))
+            self.minutes_files = container.listdir(folder) if container else listdir(folder)
         else:
             folder = path.normpath(path.join(self._path, 'minutes*.txt'))
-            self.minutes_files = clean_glob(glob.glob(folder))
+            self.minutes_files = clean_glob(container.glob(folder) if container else glob.glob(folder))
 
-        if os.path.exists(path.normpath(path.join(self._path, TRANSCRIPT_FOLDER))):
-            self.transcript_files = listdir(path.normpath(path.join(self._path, TRANSCRIPT_FOLDER)))
+        if self._exists(path.normpath(path.join(self._path, TRANSCRIPT_FOLDER))):
+            folder = path.normpath(path.join(self._path, TRANSCRIPT_FOLDER))
+            self.transcript_files = container.listdir(folder) if container else listdir(folder)
         else:
             folder = path.normpath(path.join(self._path, 'transcript*.txt'))
-            self.transcript_files = clean_glob(glob.glob(folder))
+            self.transcript_files = clean_glob(container.glob(folder) if container else glob.glob(folder))
+
+    def _exists(self, full_path):
+        # paths in a meeting container are under the container file
+        if self.container is not None:
+            return self.container.exists(full_path)
+        return os.path.exists(full_path)
+
+    def _read_lines(self, full_path):
+        if self.container is not None:
+            return text_lines(self.container.read_file(full_path))
+        with open(full_path, 'r', encoding='utf-8') as f:
+            return f.readlines()
 
 
     def _prevent(self):
@@ -227,104 +612,176 @@ class Annotation(QObject):
             msg.exec_()
             raise Exception('save changes first')
 
-    @Slot(list, str)
-    def finalize_tr_embed(self, embeds, filename, save=True):
-        if save:
-            Embedder.saveEmbed(embeds, filename + '.embed')
-        
-        # tr_ver = self.annotations.transcripts.transcript_ver
-        # print(tr_ver.itemData(tr_ver.currentIndex()))
-        # print(filename)
-        # if filename == tr_ver.itemData(tr_ver.currentIndex()):
-        for da, embed in zip(self._das, embeds):
-            da.embed = embed
-        self.tr_embed_done = True
-        self.check_aa_action()
+    @Slot(object, int)
+    def finalize_tr_embed(self, result, generation):
+        if self._finalize_embed(result, generation == self._tr_generation, self._dirty_das):
+            self.tr_embed_done = True
+            self.check_aa_action()
                 
-    @Slot(list, str)
-    def finalize_min_embed(self, embeds, filename, save=True):
-        if save:
-            Embedder.saveEmbed(embeds, filename + '.embed')
-        
-        # min_ver = self.annotations.minutes.minutes_ver
-        # if filename == min_ver.itemData(min_ver.currentIndex()):
-        for min, embed in zip(self._minutes, embeds):
-            min.embed = embed
-        self.min_embed_done = True
-        self.check_aa_action()
+    @Slot(object, int)
+    def finalize_min_embed(self, result, generation):
+        if self._finalize_embed(result, generation == self._min_generation, self._dirty_minutes):
+            self.min_embed_done = True
+            self.check_aa_action()
+
+    def _finalize_embed(self, result, current, dirty):
+        # the sidecar is written even if its file was closed meanwhile, the lines are only
+        # updated if they still belong to the open file; lines edited again while they
+        # were being embedded wait for the next round
+        filename, lines, embeds, hashes = result
+        if all(e is not None for e in embeds):
+            self._save_embed(filename + '.embed', embeds, hashes)
+        if not current:
+            return False
+        for line, embed in zip(lines, embeds):
+            if line not in dirty:
+                line.embed = embed
+        self._similarity_changed()
+        return True
+
+    def _save_embed(self, filename, embeds, hashes):
+        if self.container is not None and self.container.owns(filename):
+            self.container.write_embed(filename, embeds, self.embed_model, hashes)
+        elif path.isdir(path.dirname(filename)):
+            # (not in a container closed meanwhile)
+            from .autoalign import Embedder
+            Embedder.saveEmbed(embeds, filename, hashes, self.embed_model)
+
+    def mark_dirty(self, lines):
+        # called by edit commands for lines whose text changed (or which are new),
+        # they are re-embedded once there were no edits for REEMBED_DELAY
+        self.mark_changed(lines, TEXT_ROLES)
+        for line in lines:
+            line.embed = None
+            if isinstance(line, Minute):
+                self._dirty_minutes.add(line)
+            else:
+                self._dirty_das.add(line)
+        self.journal_lines(lines)
+        if lines:
+            self._similarity_changed()
+            self._reembed_timer.start()
+
+    @Slot()
+    def _reembed(self):
+        if not (self.annotations and self.annotations.autoembed):
+            return
+        if (self._dirty_das and self.jobs.running(EMBED_TRANSCRIPT_JOB)) or (self._dirty_minutes and self.jobs.running(EMBED_MINUTES_JOB)):
+            # wait for the running embedding to finish
+            self._reembed_timer.start()
+            return
+        if self._dirty_das:
+            rows = [i for i, d in enumerate(self._das) if d in self._dirty_das]
+            self._dirty_das.clear()
+            if rows:
+                self._embed_transcript(rows)
+        if self._dirty_minutes:
+            rows = [i for i, m in enumerate(self._minutes) if m in self._dirty_minutes]
+            self._dirty_minutes.clear()
+            if rows:
+                self._embed_minutes(rows)
+
+    def _embed_transcript(self, rows):
+        das = list(self._das)
+        self.jobs.submit(EMBED_TRANSCRIPT_JOB, embed_job, self.embed_model, self._transcript_path,
+            das, [d.text for d in das], [d.embed for d in das], rows,
+            ident=(self._tr_generation, tuple(rows)), generation=self._tr_generation,
+            finished=self.finalize_tr_embed, failed=lambda e: self._job_failed(EMBED_TRANSCRIPT_JOB, e))
+
+    def _embed_minutes(self, rows):
+        minutes = list(self._minutes)
+        self.jobs.submit(EMBED_MINUTES_JOB, embed_job, self.embed_model, self._minutes_path,
+            minutes, [m.text for m in minutes], [m.embed for m in minutes], rows,
+            ident=(self._min_generation, tuple(rows)), generation=self._min_generation,
+            finished=self.finalize_min_embed, failed=lambda e: self._job_failed(EMBED_MINUTES_JOB, e))
         
+    def _job_failed(self, name, error):
+        # the status bar showed the progress of the job until now, autoalign stays
+        # disabled until the lines are embedded
+        if self.annotations:
+            self.annotations.statusBar().showMessage(f'{name} failed: {error}')
+        else:
+            print(f'{name} failed: {error}')
+
     def check_aa_action(self):
         if self.annotations:
             self.annotations.autoalignAction.setEnabled(self.tr_embed_done and self.min_embed_done)
 
+    def _restore_embeds(self, lines, filename):
+        # the embedding stack is only imported when there is a sidecar to read
+        if not self._exists(filename):
+            for line in lines:
+                line.embed = None
+            return list(range(len(lines)))
+        from .autoalign import Embedder
+        if self.container is not None:
+            return Embedder.restore_file(lines, self.container.read_embed(filename), self.embed_model)
+        return Embedder.restore(lines, filename, self.embed_model)
+
     def open_transcript(self, file):
+        self.saver.wait() # a save still being written
+        self.close_journal()
         self.tr_embed_done = False
         if self.annotations:
             self.annotations.autoalignAction.setEnabled(False)
         self._prevent()
         self._transcript_file = file
-        full_path = path.normpath(path.join(self._path, TRANSCRIPT_FOLDER, file))
-        if not os.path.exists(full_path):
-            full_path = path.normpath(path.join(self._path, file))
-        data = []
-
-        with open(full_path, 'r', encoding='utf-8') as f:
-            for line in f.readlines():
-                if line is None or len(line) < 1 or not any(map(lambda x: x.isalpha(), list(line))):
-                    continue
-                line = line[:-1] #remove newline
-                s = line.split(SEPARATOR)
-                data.append(DialogAct(*s))
-
-        self._das = data
+        full_path = self._transcript_full_path()
+        self._transcript_path = full_path
+        self._tr_generation += 1
+        self.jobs.cancel(EMBED_TRANSCRIPT_JOB)
+        if self.container is not None:
+            self._das = self.container.read_das(full_path)
+        else:
+            self._das = read_transcript(full_path)
+        self.mark_replaced(das=True, minutes=True)
+        self._dirty_das.clear()
+        self._similarity_changed()
         
-        if os.path.exists(full_path + '.embed'):
-            embeds = Embedder.loadEmbed(full_path + '.embed')
-            self.finalize_tr_embed(embeds, full_path, False)
-        elif self.annotations.autoembed:
-            if self.tr_thread:
-                self.tr_thread.terminate()
-            self.tr_thread = TranscriptEmbedThread(self, full_path)
-            self.tr_thread.finished.connect(self.finalize_tr_embed)
-            self.tr_thread.start()
+        stale = self._restore_embeds(self._das, full_path + '.embed')
+        if not stale:
+            self.tr_embed_done = True
+            self.check_aa_action()
+        elif self.annotations and self.annotations.autoembed:
+            self._embed_transcript(stale)
         
         self.open_annotation()
         self.open_evaluation()
         self.modified = False
+        self._journal_timer.start()
 
     def open_minutes(self, file):
+        self.saver.wait()
+        self.close_journal()
         self.min_embed_done = False
         if self.annotations:
             self.annotations.autoalignAction.setEnabled(False)
         #self._prevent()
         self._minutes_file = file
-        full_path = path.normpath(path.join(self._path, MINUTES_FOLDER, file))
-        if not os.path.exists(full_path):
-            full_path = path.normpath(path.join(self._path, file))
-        data = []
-        try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                for line in f.readlines():
-                    line = line[:-1] #remove newline
-                    data.append(Minute(line))
-        except:
-            pass
-        self._minutes = data
+        full_path = self._minutes_full_path()
+        self._minutes_path = full_path
+        self._min_generation += 1
+        self.jobs.cancel(EMBED_MINUTES_JOB)
+        if self.container is not None:
+            self._minutes = self.container.read_minutes(full_path)
+        else:
+            self._minutes = read_minutes(full_path)
+        self.mark_replaced(das=True, minutes=True)
+        self._dirty_minutes.clear()
+        self._similarity_changed()
         
-        if os.path.exists(full_path + '.embed'):
-            embeds = Embedder.loadEmbed(full_path + '.embed')
-            self.finalize_min_embed(embeds, full_path, False)
-        elif self.annotations.autoembed:
-            if self.min_thread:
-                self.min_thread.terminate()
-            self.min_thread = MinuteEmbedThread(self, full_path)
-            self.min_thread.finished.connect(self.finalize_min_embed)
-            self.min_thread.start()
+        stale = self._restore_embeds(self._minutes, full_path + '.embed')
+        if not stale:
+            self.min_embed_done = True
+            self.check_aa_action()
+        elif self.annotations and self.annotations.autoembed:
+            self._embed_minutes(stale)
         
         self._make_minutes_index_map()
         self.open_annotation()
         self.open_evaluation()
         self.modified = False
+        self._journal_timer.start()
 
     def open_annotation(self):
         if not self._das == []:
@@ -333,51 +790,23 @@ class Annotation(QObject):
         for d in self._das:
             d.problem = None
             d.minute = None
-        annotations_path = path.normpath(path.join(self._path, ANNOTATIONS_FOLDER))
-        annotations_prefix = '' if os.path.exists(annotations_path) else 'alignment+'
-        af = "{}{}+{}".format(
-            annotations_prefix,
-            self._transcript_file,
-            self._minutes_file
-        )
-        self._annotation_file = af
-        full_path = path.join(self._path, ANNOTATIONS_FOLDER, af) if os.path.exists(annotations_path) else path.join(self._path, af)
-        full_path = path.normpath(full_path)
-        if path.exists(full_path):
-            with open(full_path, 'r', encoding='utf-8') as f:
-                for line in f.readlines():
-                    line = line.strip().split(' ')
-                    idx = int(line[0]) - 1
-                    d = self._das[idx]
-                    
-                    final = True
-                    if line[1].isdigit():
-                        minute = int(line[1]) - 1
-                    elif str.endswith(line[1], '?') and line[1][:-1].isdigit():
-                        minute = int(line[1][:-1]) - 1
-                        final = False
-                    else:
-                        minute = None
-                    
-                    if line[2].isdigit():
-                        num = int(line[2])-1
-                        problem = int(line[2]) - 1 if num >= 0 else None
-                    elif len(line[2]) >= 2 and line[2][:2] == '0:':
-                        #custom problem
-                        if len(line) > 3: # space in custom problem
-                            problem = line[2][2:] + ' ' + ' '.join(line[3:])
-                        else:
-                            problem = line[2][2:]
-                    else:
-                        problem = None
-
-                    d.problem = problem
-                    d.is_final = final
-                    try:
-                        d.minute = self._minutes[minute]
-                    except:
-                        d.minute = None
+        full_path = self._annotation_full_path()
+        self._annotation_file = path.basename(full_path)
+        if self._exists(full_path):
+            if self.container is not None:
+                alignment = self.container.read_alignment(full_path)
+            else:
+                alignment = read_alignment(full_path)
+            for idx, minute, final, problem in alignment:
+                d = self._das[idx]
+                d.problem = problem
+                d.is_final = final
+                try:
+                    d.minute = self._minutes[minute]
+                except:
+                    d.minute = None
             self.problems_changed.emit()
+        self._index_alignment()
             
     def copy_problems_if_none_presend(self):
         if not self.remarks_backup or not len(self._das) == len(self.remarks_backup):
@@ -386,134 +815,327 @@ class Annotation(QObject):
         if True in untouched and not False in untouched:
             for i, d in enumerate(self._das):
                 d.problem = self.remarks_backup[i]
+            self.mark_changed(self._das, (Qt.DisplayRole,))
             self.problems_changed.emit()
-            self.modified = True
+            self.journal_lines(self._das)
+            self.mark_modified(ALIGNMENT_FILE)
 
     def open_evaluation(self):
         self._adequacy = 1.0
         self._grammaticality = 1.0
         self._fluency = 1.0
         self._relevance = 1.0
-        evaluation_path = path.normpath(path.join(self._path, EVALUATIONS_FOLDER))
-        evaluation_prefix = '' if os.path.exists(evaluation_path) else 'evaluation+'
-        af = "{}{}+{}".format(
-            evaluation_prefix,
-            self._transcript_file,
-            self._minutes_file
-        )
-        self._annotation_file = af
-        full_path = path.join(self._path, EVALUATIONS_FOLDER, af) if os.path.exists(evaluation_path) else path.join(self._path, af)
-        full_path = path.normpath(full_path)
-        if path.exists(full_path):
-            with open(full_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                if SEPARATOR not in lines[0]:
-                    self._adequacy = float(lines[0].strip())
-                    self._grammaticality = 1.0
-                    self._fluency = 1.0
-                    self._relevance = 1.0
-                else:
-                    doclevel = list(map(float, lines[0].strip().split(SEPARATOR)))
-                    self._adequacy = doclevel[0]
-                    self._grammaticality = doclevel[1]
-                    self._fluency = doclevel[2]
-                    self._relevance = doclevel[3]
-                
-                for m, e in zip(self._minutes, lines[1:]):
-                    e = list(map(float, e.split(SEPARATOR)))
-                    if all(map(lambda x: x > 0, e)):
-                        m.adequacy = e[0]
-                        m.grammaticality = e[1]
-                        m.fluency = e[2]
-                        m.relevance = e[3] if len(e) > 3 else 1.0
-
-    def _save_transcript(self):
+        full_path = self._evaluation_full_path()
+        if self._exists(full_path):
+            lines = self._read_lines(full_path)
+            if SEPARATOR not in lines[0]:
+                self._adequacy = float(lines[0].strip())
+                self._grammaticality = 1.0
+                self._fluency = 1.0
+                self._relevance = 1.0
+            else:
+                doclevel = list(map(float, lines[0].strip().split(SEPARATOR)))
+                self._adequacy = doclevel[0]
+                self._grammaticality = doclevel[1]
+                self._fluency = doclevel[2]
+                self._relevance = doclevel[3]
+            
+            for m, e in zip(self._minutes, lines[1:]):
+                e = list(map(float, e.split(SEPARATOR)))
+                if all(map(lambda x: x > 0, e)):
+                    m.adequacy = e[0]
+                    m.grammaticality = e[1]
+                    m.fluency = e[2]
+                    m.relevance = e[3] if len(e) > 3 else 1.0
+
+    def _transcript_full_path(self):
         full_path = path.normpath(path.join(self._path, TRANSCRIPT_FOLDER, self._transcript_file))
-        if not os.path.exists(full_path):
+        if not self._exists(full_path):
             full_path = path.normpath(path.join(self._path, self._transcript_file))
-        with open(full_path, 'w', encoding='utf-8') as f:
-            for da in self._das:
-                try:
-                    if da.speaker == '':
-                        f.write("".join([
-                            da.text,
-                            '\n'
-                        ]))
-                    else:
-                        f.write("".join([
-                            '(',
-                            da.speaker,
-                            ')',
-                            da.text,
-                            '\n'
-                        ]))
-                except:
-                    pass
+        return full_path
 
-    def _save_minutes(self):
+    def _minutes_full_path(self):
         full_path = path.normpath(path.join(self._path, MINUTES_FOLDER, self._minutes_file))
-        if not os.path.exists(full_path):
+        if not self._exists(full_path):
             full_path = path.normpath(path.join(self._path, self._minutes_file))
-        with open(full_path, 'w', encoding='utf-8') as f:
-            for m in self._minutes:
-                f.write('{}\n'.format(m.text))
+        return full_path
 
-    def _save_annotation(self):
+    def _annotation_full_path(self):
         annotations_path = path.normpath(path.join(self._path, ANNOTATIONS_FOLDER))
-        annotations_prefix = '' if os.path.exists(annotations_path) else 'alignment+'
+        annotations_prefix = '' if self._exists(annotations_path) else 'alignment+'
         af = "{}{}+{}".format(
             annotations_prefix,
             self._transcript_file,
             self._minutes_file
         )
-        full_path = path.join(self._path, ANNOTATIONS_FOLDER, af) if os.path.exists(annotations_path) else path.join(self._path, af)
-        full_path = path.normpath(full_path)
-        with open(full_path, 'w', encoding='utf-8') as f:
-            for idx, da in enumerate(self._das):
-                if da.minute != None or da.problem != None:
-                    midx = self.minutes_index_map[da.minute]
-                    if isinstance(da.problem, str):
-                        problem = f'0:{da.problem}'
-                    elif not da.problem is None:
-                        problem = da.problem + 1
-                    else:
-                        problem = None
-                    f.write('{} {}{} {}\n'.format(
-                        idx + 1,
-                        midx + 1 if midx is not None else midx,
-                        '?' if not da.is_final else '',
-                        problem
-                    ))
-
-    def _save_evaluation(self):
+        full_path = path.join(self._path, ANNOTATIONS_FOLDER, af) if self._exists(annotations_path) else path.join(self._path, af)
+        return path.normpath(full_path)
+
+    def _evaluation_full_path(self):
         evaluation_path = path.normpath(path.join(self._path, EVALUATIONS_FOLDER))
-        evaluation_prefix = '' if os.path.exists(evaluation_path) else 'evaluation+'
+        evaluation_prefix = '' if self._exists(evaluation_path) else 'evaluation+'
         af = "{}{}+{}".format(
             evaluation_prefix,
             self._transcript_file,
             self._minutes_file
         )
         self._annotation_file = af
-        full_path = path.join(self._path, EVALUATIONS_FOLDER, af) if os.path.exists(evaluation_path) else path.join(self._path, af)
-        full_path = path.normpath(full_path)
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(f'{self._adequacy}{SEPARATOR}{self._grammaticality}{SEPARATOR}{self._fluency}{SEPARATOR}{self._relevance}\n')
-            for m in self._minutes:
-                if any([d.minute == m for d in self._das]):
-                    f.write(f'{m.adequacy}{SEPARATOR}{m.grammaticality}{SEPARATOR}{m.fluency}{SEPARATOR}{m.relevance}\n')
+        full_path = path.join(self._path, EVALUATIONS_FOLDER, af) if self._exists(evaluation_path) else path.join(self._path, af)
+        return path.normpath(full_path)
+
+    def _transcript_content(self):
+        full_path = self._transcript_full_path()
+        lines = []
+        for da in self._das:
+            try:
+                if da.speaker == '':
+                    lines.append(da.text + '\n')
                 else:
-                    f.write(f'{-1}{SEPARATOR}{-1}{SEPARATOR}{-1}\n')
+                    lines.append(''.join(['(', da.speaker, ')', da.text, '\n']))
+            except:
+                pass
+        return full_path, ''.join(lines)
+
+    def _minutes_content(self):
+        full_path = self._minutes_full_path()
+        return full_path, ''.join('{}\n'.format(m.text) for m in self._minutes)
+
+    def _annotation_content(self):
+        return self._annotation_full_path(), format_alignment(self._das, self.minutes_index_map)
+
+    def _evaluation_content(self):
+        full_path = self._evaluation_full_path()
+        lines = [f'{self._adequacy}{SEPARATOR}{self._grammaticality}{SEPARATOR}{self._fluency}{SEPARATOR}{self._relevance}\n']
+        for m in self._minutes:
+            if self.is_minute_aligned(m):
+                lines.append(f'{m.adequacy}{SEPARATOR}{m.grammaticality}{SEPARATOR}{m.fluency}{SEPARATOR}{m.relevance}\n')
+            else:
+                lines.append(f'{-1}{SEPARATOR}{-1}{SEPARATOR}{-1}\n')
+        return full_path, ''.join(lines)
 
     def autoalign(self):
-        Aligner.align_inbuilt(self._das, self._minutes, self.threshold)
-        self.modified = True
-
-    def save(self):
-        self._save_annotation()
-        self._save_evaluation()
-        self._save_minutes()
-        self._save_transcript()
+        command = AutoalignCommand(self, "Autoalign")
+        self.push_to_undo_stack(command)
+
+    def _similarity_changed(self):
+        # rows, minutes or embeddings changed: the best matches have to be refreshed
+        # and an ongoing preview no longer matches the rows
+        self._best_stale = True
+        self._minute_engine = None
+        self.clear_preview()
+
+    def preview_threshold(self, threshold):
+        # (aligned, unaligned) row counts an autoalign with threshold would give by the
+        # closest minutes (monotonic alignment aside), previewed in the transcript;
+        # None until both files are embedded
+        if not (self.tr_embed_done and self.min_embed_done):
+            return None
+        import numpy as np
+        from .autoalign import SimilarityCache
+        if self._similarity is None:
+            self._similarity = SimilarityCache()
+        if self._best_stale:
+            self._similarity.update(self._das, self._minutes)
+            self._best_stale = False
+        self.preview = self._similarity.preview(threshold)
+        self.preview_changed.emit()
+        aligned = int(np.count_nonzero(self.preview))
+        return aligned, len(self.preview) - aligned
+
+    def suggest_minutes(self, k = 5):
+        # [(minute, similarity)] of the k minutes closest to the selected DAs
+        embeds = [d.embed for d in self.selected_das if d.embed is not None]
+        if not embeds or not self._minutes:
+            return []
+        if self._minute_engine is None:
+            from .autoalign import AlignmentEngine
+            self._minute_engine = (AlignmentEngine([m.embed for m in self._minutes]), list(self._minutes))
+        engine, minutes = self._minute_engine
+        idx, dist = engine.suggest(embeds, k)
+        return [(minutes[i], 1.0 - float(d)) for i, d in zip(idx, dist)]
+
+    def preview_minute(self, i):
+        m = self.preview[i]
+        return self._minutes[m - 1] if m else None
+
+    def clear_preview(self):
+        if self.preview is not None:
+            self.preview = None
+            self.preview_changed.emit()
+
+    def _autoalign(self):
+        # distances of lines not edited since the last autoalign come from the cache
+        from .autoalign import Aligner, SimilarityCache
+        if self._similarity is None:
+            self._similarity = SimilarityCache()
+        Aligner.align_cached(self._similarity, self._das, self._minutes, self.threshold, monotonic=self.monotonic, back_jumps=self.back_jumps)
+        self._best_stale = False
+        self._index_alignment()
+
+    def save(self, background = True):
+        # writes the files with unsaved changes: their content is taken now, the writing
+        # (each file atomically) is done by the saver thread unless background is False;
+        # saved is emitted with the report
+        contents = {
+            ALIGNMENT_FILE: self._annotation_content,
+            EVALUATION_FILE: self._evaluation_content,
+            MINUTES_FILE: self._minutes_content,
+            TRANSCRIPT_FILE: self._transcript_content,
+        }
+        unsaved = [f for f in SAVED_FILES if f in self.unsaved]
+        files = [contents[f]() for f in unsaved]
+        # the journal records up to now are in the files once they are written
+        journal = self.journal
+        records = journal.count if journal is not None else 0
         self.modified = False
+        if not background:
+            self.saver.wait()
+            self._saved(save_job(None, lambda done, total: None, files, self.container), journal, records)
+            return
+        self._save_count += 1
+        self.saver.submit(f'Saving {self._save_count}', save_job, files, self.container,
+            finished=lambda report, generation: self._saved(report, journal, records),
+            failed=lambda e: self._save_failed(e, unsaved))
+
+    def _saved(self, report, journal, records):
+        # a journal closed since (another meeting opened) is dropped when next read,
+        # its header no longer matching the saved files
+        if journal is not None and journal is self.journal:
+            journal.compact(records)
+        self.saved.emit(report)
+
+    def _save_failed(self, error, unsaved):
+        self.mark_modified(*unsaved)
+        msg = QMessageBox()
+        msg.setText(f'Saving failed: {error}')
+        msg.setIcon(QMessageBox.Critical)
+        msg.setWindowTitle("Error")
+        msg.exec_()
+
+    def _journal_path(self):
+        name = f'.{self._transcript_file}+{self._minutes_file}.journal'
+        if self.container is not None:
+            # next to the container
+            container = path.normpath(self._path)
+            return path.join(path.dirname(container), '.' + path.basename(container) + name)
+        return path.normpath(path.join(self._path, name))
+
+    @Slot()
+    def _open_journal(self):
+        # run once the transcript and the minutes opened together are read: the edits
+        # of this pair not saved before are replayed on top of the files, all at once
+        # and without the signals of the individual edits
+        self.close_journal()
+        if not (self._transcript_file and self._minutes_file):
+            return
+        saved = [self._transcript_full_path(), self._minutes_full_path(), self._annotation_full_path(), self._evaluation_full_path()]
+        journal = Journal(self._journal_path(), saved, self.container.stat if self.container is not None else None, self)
+        records = journal.read()
+        if records:
+            edited, files, evaluation = replay_journal(records, self._das, self._minutes)
+            if evaluation is not None:
+                self._adequacy, self._grammaticality, self._fluency, self._relevance = evaluation
+            self._make_minutes_index_map()
+            self._index_alignment()
+            self.mark_replaced(das=True, minutes=True) # rows may have been inserted or removed
+            self.mark_dirty(edited)
+            self.problems_changed.emit()
+            self.mark_modified(*files)
+        self.journal = journal
+
+    def _journal_append(self, record):
+        if self.journal is not None:
+            self.journal.append(record)
+
+    def _da_state(self, da):
+        return [da.text, da.speaker, self.minutes_index_map.get(da.minute), da.is_final, da.problem]
+
+    def _minute_state(self, m):
+        return [m.text, m.adequacy, m.grammaticality, m.fluency, m.relevance]
+
+    def journal_lines(self, lines):
+        # records the current state of the lines (DAs or minutes) after an edit
+        if self.journal is None or not lines:
+            return
+        das = [l for l in lines if not isinstance(l, Minute)]
+        minutes = [l for l in lines if isinstance(l, Minute)]
+        for kind, changed, all_lines, state in (('d', das, self._das, self._da_state), ('m', minutes, self._minutes, self._minute_state)):
+            if not changed:
+                continue
+            for row, line in zip(self._rows(changed, all_lines), changed):
+                if row is not None:
+                    self.journal.append([kind, row] + state(line))
+
+    def _rows(self, lines, all_lines):
+        # row of each of lines in all_lines, None for lines no longer there
+        if len(lines) > INDEX_ROWS:
+            index = {id(l): i for i, l in enumerate(all_lines)}
+            return [index.get(id(l)) for l in lines]
+        rows = []
+        for l in lines:
+            try:
+                rows.append(all_lines.index(l))
+            except ValueError:
+                rows.append(None)
+        return rows
+
+    def da_rows(self, das):
+        return self._rows(das, self._das)
+
+    def minute_rows(self, minutes):
+        return self._rows(minutes, self._minutes)
+
+    def mark_changed(self, lines, roles = ()):
+        # lines (DAs or minutes) whose cells of roles (all if none are given) changed,
+        # the views repaint them at the next turn of the event loop
+        roles = frozenset(roles)
+        for line in lines:
+            old = self._changed.get(line)
+            if old is None:
+                self._changed[line] = roles
+            elif old and old != roles:
+                self._changed[line] = old | roles if roles else roles
+        if lines and not self._changes_timer.isActive():
+            self._changes_timer.start()
+
+    def mark_replaced(self, das = False, minutes = False):
+        # the DAs or the minutes were replaced (or rows inserted or removed other than
+        # through the models), the views reread all of them at once: they must not
+        # paint rows that are no longer there
+        self._das_replaced |= das
+        self._minutes_replaced |= minutes
+        self._emit_changes()
+
+    @Slot()
+    def _emit_changes(self):
+        self._changes_timer.stop()
+        das = None if self._das_replaced else dict()
+        minutes = None if self._minutes_replaced else dict()
+        for line, roles in self._changed.items():
+            changed = minutes if isinstance(line, Minute) else das
+            if changed is not None:
+                changed[line] = roles
+        self._changed = dict()
+        self._das_replaced = self._minutes_replaced = False
+        self.lines_changed.emit(das, minutes)
+
+    def journal_evaluation(self):
+        self._journal_append(['e', self._adequacy, self._grammaticality, self._fluency, self._relevance])
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def discard_journal(self):
+        # the unsaved edits were discarded
+        if self.journal is not None:
+            self.journal.discard()
+
+    def mark_modified(self, *files):
+        # files (of SAVED_FILES) with changes to save, all of them if none are given
+        self.unsaved.update(files or SAVED_FILES)
+        self.modified = True
 
     def set_minute(self, minute = None):
         same = True
@@ -529,8 +1151,7 @@ class Annotation(QObject):
             command = AlignCommand(self, self.selected_das, minute, "Align transcript")
             self.push_to_undo_stack(command)
         else:
-            print("no das selected, modified=false")
-            self.modified = False
+            print("no das selected")
 
     @Slot(object)
     def set_problem(self, problem = None):
@@ -542,8 +1163,6 @@ class Annotation(QObject):
         if len(self.selected_das) > 0 and not same:
             command = SetProblemCommand(self, self.selected_das, problem, f"Set problem {problem}")
             self.push_to_undo_stack(command)
-        else:
-            self.modified = False
 
     def push_to_undo_stack(self, command : QUndoCommand):
         self.undo_stack.push(command)
@@ -561,7 +1180,9 @@ class Annotation(QObject):
         return self._visible_minutes
     @visible_minutes.setter
     def visible_minutes(self, value):
-        self._visible_minutes = set(value)
+        value = set(value)
+        self.mark_changed(self._visible_minutes ^ value, COLOR_ROLES)
+        self._visible_minutes = value
         self.visible_minutes_changed.emit()
 
     def get_minute_color(self, minute):
@@ -583,7 +1204,9 @@ class Annotation(QObject):
                 da.speaker = last_speaker
             else:
                 last_speaker = da.speaker
-        self.modified = True
+        self.mark_changed(self._das, TEXT_ROLES)
+        self.journal_lines(self._das)
+        self.mark_modified(TRANSCRIPT_FILE)
         
     def finalize(self):
         final = True
@@ -620,13 +1243,17 @@ class FinalizeCommand(QUndoCommand):
             if row.minute:
                 row.is_final = True
         
-        self.annotation.modified = True
+        self.annotation.mark_changed(self.transcript_rows, COLOR_ROLES)
+        self.annotation.journal_lines(self.transcript_rows)
+        self.annotation.mark_modified(ALIGNMENT_FILE)
 
     def undo(self):
         for row in self.transcript_rows:
             row.is_final = self.original_final[row]
 
-        self.annotation.modified = True
+        self.annotation.mark_changed(self.transcript_rows, COLOR_ROLES)
+        self.annotation.journal_lines(self.transcript_rows)
+        self.annotation.mark_modified(ALIGNMENT_FILE)
 
 class AlignCommand(QUndoCommand):
     def __init__(self, annotation, transcript_rows : set, minute : Minute, text: str) -> None:
@@ -639,17 +1266,19 @@ class AlignCommand(QUndoCommand):
         
     def redo(self):
         for row in self.transcript_rows:
-            row.minute = self.new_minute
+            self.annotation.set_da_minute(row, self.new_minute)
             row.is_final = True
         
-        self.annotation.modified = True
+        self.annotation.journal_lines(self.transcript_rows)
+        self.annotation.mark_modified(ALIGNMENT_FILE, EVALUATION_FILE)
 
     def undo(self):
         for row in self.transcript_rows:
-            row.minute = self.original_minutes[row]
+            self.annotation.set_da_minute(row, self.original_minutes[row])
             row.is_final = self.original_final[row]
 
-        self.annotation.modified = True
+        self.annotation.journal_lines(self.transcript_rows)
+        self.annotation.mark_modified(ALIGNMENT_FILE, EVALUATION_FILE)
 
 class SetProblemCommand(QUndoCommand):
     def __init__(self, annotation, transcript_rows : set, problem, text: str) -> None:
@@ -663,15 +1292,48 @@ class SetProblemCommand(QUndoCommand):
         for row in self.transcript_rows:
             row.problem = self.new_problem
         
+        self.annotation.mark_changed(self.transcript_rows, (Qt.DisplayRole,))
         self.annotation.problems_changed.emit()
-        self.annotation.modified = True
+        self.annotation.journal_lines(self.transcript_rows)
+        self.annotation.mark_modified(ALIGNMENT_FILE)
 
     def undo(self):
         for row in self.transcript_rows:
             row.problem = self.original_problems[row]
 
+        self.annotation.mark_changed(self.transcript_rows, (Qt.DisplayRole,))
         self.annotation.problems_changed.emit()
-        self.annotation.modified = True
+        self.annotation.journal_lines(self.transcript_rows)
+        self.annotation.mark_modified(ALIGNMENT_FILE)
         
 class AutoalignCommand(QUndoCommand):
-    pass
\ No newline at end of file
+    def __init__(self, annotation, text: str) -> None:
+        super().__init__(text)
+        self.annotation = annotation
+        self.transcript_rows = list(annotation._das)
+        self.original_minutes = {tr : tr.minute for tr in self.transcript_rows}
+        self.original_final = {tr : tr.is_final for tr in self.transcript_rows}
+        self.new_minutes = None
+        self.new_final = None
+
+    def redo(self):
+        self.annotation.clear_preview()
+        if self.new_minutes is None:
+            self.annotation._autoalign()
+            self.new_minutes = {tr : tr.minute for tr in self.transcript_rows}
+            self.new_final = {tr : tr.is_final for tr in self.transcript_rows}
+        else:
+            for row in self.transcript_rows:
+                self.annotation.set_da_minute(row, self.new_minutes[row])
+                row.is_final = self.new_final[row]
+
+        self.annotation.journal_lines(self.transcript_rows)
+        self.annotation.mark_modified(ALIGNMENT_FILE, EVALUATION_FILE)
+
+    def undo(self):
+        for row in self.transcript_rows:
+            self.annotation.set_da_minute(row, self.original_minutes[row])
+            row.is_final = self.original_final[row]
+
+        self.annotation.journal_lines(self.transcript_rows)
+        self.annotation.mark_modified(ALIGNMENT_FILE, EVALUATION_FILE)
\ No newline at end of file
@@ -5,8 +5,8 @@ import glob
 import subprocess
 from subprocess import Popen
 
-from PySide2.QtWidgets import QApplication, QMainWindow, QHBoxLayout, QWidget, QFileDialog, QMessageBox, QSplitter, QSizePolicy, QVBoxLayout, QProgressDialog, QAction, QToolBar, QDialog, QDialogButtonBox, QLabel, QLineEdit, QDoubleSpinBox
-from PySide2.QtCore import Slot, Qt, QSettings, Signal, QThread # QRunnable, QThreadPool
+from PySide2.QtWidgets import QApplication, QMainWindow, QHBoxLayout, QWidget, QFileDialog, QMessageBox, QSplitter, QSizePolicy, QVBoxLayout, QProgressDialog, QAction, QToolBar, QDialog, QDialogButtonBox, QLabel, QLineEdit, QDoubleSpinBox, QCheckBox, QSpinBox
+from PySide2.QtCore import Slot, Qt, QSettings, Signal, QThread, QTimer # QRunnable, QThreadPool
 from PySide2.QtGui import QIcon
 
 from .transcripts.transcripts import Transcripts
@@ -16,7 +16,8 @@ from .annotation import Annotation
 from .problems import Problems
 from .settings import Settings
 from .evaluation import Evaluation
-from .autoalign import Aligner
+
+PREVIEW_TIMEOUT = 3000 # ms after the last threshold change before its preview is cleared
 
 class Annotations(QMainWindow):
     # main app window class 
@@ -48,6 +49,8 @@ class Annotations(QMainWindow):
         self.annotation = annotation
         self.annotation.undo_stack.canRedoChanged.connect(self._redo_toggle)
         self.annotation.undo_stack.canUndoChanged.connect(self._undo_toggle)
+        self.annotation.jobs.progress.connect(self._jobProgress)
+        self.annotation.saved.connect(self._saved)
 
         transcripts = Transcripts(annotation, self)
         transcripts.setDisabled(True)
@@ -92,6 +95,7 @@ class Annotations(QMainWindow):
         # create all menu and toolbar actions
         self.newAction              = self._createAction('&New', 'Ctrl+n', self.new)
         self.openMeetingAction      = self._createAction('&Open meeting', 'Ctrl+o', self.open_existing)
+        self.openContainerAction    = self._createAction('Open meeting &file', 'Ctrl+Shift+o', self.open_container)
         self.openRepositoryAction   = self._createAction('&Open repository', 'Ctrl+g', self.open_repository)
         self.evalModeAction         = self._createAction('Evaluation mode', 'Ctrl+e', self.set_evaluation_mode)
         self.evalModeAction.setCheckable(True)
@@ -122,6 +126,7 @@ class Annotations(QMainWindow):
         file_menu = menu.addMenu('&File')
         file_menu.addAction(self.newAction)
         file_menu.addAction(self.openMeetingAction)
+        file_menu.addAction(self.openContainerAction)
         file_menu.addAction(self.openRepositoryAction)
         file_menu.addSeparator()
 
@@ -190,12 +195,40 @@ class Annotations(QMainWindow):
         thr = QDoubleSpinBox(self)
         thr.setMinimum(0)
         thr.setMaximum(1)
-        thr.setDecimals(1)
-        thr.setSingleStep(0.1)
-        thr.setValue(0.5)
+        thr.setDecimals(2)
+        thr.setSingleStep(0.05)
+        thr.setValue(self.annotation.threshold)
+        thr.setToolTip('Autoalign threshold (defaults to the one calibrated for the type of the meeting)')
         thr.valueChanged.connect(self._setThr)
+        thr.editingFinished.connect(self.annotation.clear_preview) # focus lost or Enter pressed
+        self.annotation.path_changed.connect(lambda: thr.setValue(self.annotation.threshold))
         
         toolbar.addWidget(thr)
+
+        preview = QLabel(self)
+        preview.setToolTip('Rows the closest minute would align at this threshold (previewed in the transcript)')
+        self.annotation.preview_changed.connect(self._previewChanged)
+        self.thr_preview = preview
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(PREVIEW_TIMEOUT)
+        self._preview_timer.timeout.connect(self.annotation.clear_preview)
+        toolbar.addWidget(preview)
+
+        monotonic = QCheckBox('monotonic', self)
+        monotonic.setToolTip('Keep the order of minutes, allowing only a few jumps back')
+        monotonic.stateChanged.connect(self._setMonotonic)
+        toolbar.addWidget(monotonic)
+
+        back_jumps = QSpinBox(self)
+        back_jumps.setMinimum(0)
+        back_jumps.setMaximum(20) # the monotonic path keeps four bytes per row, minute of its band and back-jump
+        back_jumps.setValue(2)
+        back_jumps.setToolTip('Allowed jumps back to an earlier minute')
+        back_jumps.setEnabled(False)
+        back_jumps.valueChanged.connect(self._setBackJumps)
+        self.back_jumps = back_jumps
+        toolbar.addWidget(back_jumps)
         
         toolbar.addSeparator()
         toolbar.addAction(self.aaFinalizeAction)
@@ -232,6 +265,7 @@ class Annotations(QMainWindow):
                 self.save()
                 return True
             elif QMessageBox.Discard == msg.result():
+                self.annotation.discard_journal()
                 self.annotation.modified = False
                 return True
             else:
@@ -351,43 +385,62 @@ class Annotations(QMainWindow):
                 self.aaFinalizeAllAction.setEnabled(True)
                 self.problems.addProblemAction.setEnabled(True)
                 self.problems.refreshProblemsAction.setEnabled(True)
-            if self._check_path(path):
-                self.annotation.set_path(path)
-                self.transcripts.setEnabled(True)
-                self.minutes.setEnabled(True)
-                self.problems.setEnabled(True)
-                self.evaluation.setEnabled(True)
-                self.evaluation.open_evaluation(self.annotation)
-                exts = ['wav', 'mp3', 'flac', 'mp4']
-                self.player.open_audio(None)
-                for e in exts:
-                    for f in glob.glob(os.path.normpath(os.path.join(path, '*.' + e))):
-                        if os.path.isfile(os.path.normpath(os.path.join(path, f))):
-                            if self.player.open_audio(os.path.normpath(os.path.join(path, f))):
-                                break
-                self.is_git = False
-                self.saveAction.setEnabled(True)
-                self.aaFinalizeAction.setEnabled(True)
-                self.aaFinalizeAllAction.setEnabled(True)
-                self.problems.addProblemAction.setEnabled(True)
-                self.problems.refreshProblemsAction.setEnabled(True)
-                
-                return True
-            else:
-                msg = QMessageBox()
-                msg.setText('Invalid directory!')
-                msg.setIcon(QMessageBox.Critical)
-                msg.setWindowTitle("Error")
-                msg.exec_()
+            return self._open_path(path)
         return False
 
+    @Slot()
+    def open_container(self):
+        if self.annotation.modified and not self._discard_dialog():
+            return
+        path, _ = QFileDialog.getOpenFileName(self, 'Select meeting file', filter='Meeting files (*.alignmeet)')
+        if path:
+            return self._open_path(path)
+        return False
+
+    def _open_path(self, path):
+        # a meeting folder, or a meeting container opened as one
+        if self._check_path(path):
+            self.annotation.set_path(path)
+            self.transcripts.setEnabled(True)
+            self.minutes.setEnabled(True)
+            self.problems.setEnabled(True)
+            self.evaluation.setEnabled(True)
+            self.evaluation.open_evaluation(self.annotation)
+            exts = ['wav', 'mp3', 'flac', 'mp4']
+            self.player.open_audio(None)
+            # the audio of a meeting container is next to it
+            folder = os.path.dirname(path) if os.path.isfile(path) else path
+            for e in exts:
+                for f in glob.glob(os.path.normpath(os.path.join(folder, '*.' + e))):
+                    if os.path.isfile(os.path.normpath(os.path.join(folder, f))):
+                        if self.player.open_audio(os.path.normpath(os.path.join(folder, f))):
+                            break
+            self.is_git = False
+            self.saveAction.setEnabled(True)
+            self.aaFinalizeAction.setEnabled(True)
+            self.aaFinalizeAllAction.setEnabled(True)
+            self.problems.addProblemAction.setEnabled(True)
+            self.problems.refreshProblemsAction.setEnabled(True)
+        
+            return True
+        else:
+            msg = QMessageBox()
+            msg.setText('Invalid directory!')
+            msg.setIcon(QMessageBox.Critical)
+            msg.setWindowTitle("Error")
+            msg.exec_()
+        return False
 
     def _check_path(self, path):
         return True
 
     @Slot()
     def save(self):
-        self.annotation.save()
+        self._save(background=True)
+
+    def _save(self, background):
+        # committing to the repository needs the files written first
+        self.annotation.save(background=background and not self.is_git)
         if self.is_git:
             s = QSettings(self)
             annotator = s.value('annotator', 'annonymous')
@@ -460,19 +513,57 @@ class Annotations(QMainWindow):
             msg.setDefaultButton(QMessageBox.Cancel)
             if msg.exec_():
                 if QMessageBox.Save == msg.result():
-                    self.save()
-                    self.annotation.undo_view.close()
+                    # written before closing, the journal is compacted with it
+                    self._save(background=False)
+                    self.annotation.close_journal()
+                elif QMessageBox.Discard == msg.result():
+                    self.annotation.discard_journal()
                 elif QMessageBox.Cancel == msg.result():
                     event.ignore()
                 self.annotation.undo_view.close()
                 return
 
         self.annotation.undo_view.close()
+        self.annotation.jobs.cancel_all()
+        self.annotation.saver.wait()
+        self.annotation.close_journal()
         return super().closeEvent(event)
     
-    @Slot(int)
+    @Slot(float)
     def _setThr(self, thr):
         self.annotation.threshold = thr
+        counts = self.annotation.preview_threshold(thr)
+        if counts is not None:
+            self.thr_preview.setText(f' {counts[0]} aligned, {counts[1]} unaligned ')
+            self._preview_timer.start()
+
+    @Slot(str, int, int)
+    def _jobProgress(self, name, done, total):
+        if done >= total:
+            self.statusBar().clearMessage()
+        else:
+            self.statusBar().showMessage(f'{name}: {done}/{total} lines')
+
+    @Slot(object)
+    def _saved(self, report):
+        if not report['files']:
+            self.statusBar().showMessage('Nothing to save', 3000)
+            return
+        self.statusBar().showMessage(f'Saved {len(report["files"])} files, {report["bytes"] / 1024:.1f} kB in {report["seconds"] * 1000:.0f} ms', 5000)
+
+    @Slot()
+    def _previewChanged(self):
+        if self.annotation.preview is None:
+            self.thr_preview.setText('')
+    
+    @Slot(int)
+    def _setMonotonic(self, state):
+        self.annotation.monotonic = state == Qt.Checked
+        self.back_jumps.setEnabled(self.annotation.monotonic)
+
+    @Slot(int)
+    def _setBackJumps(self, back_jumps):
+        self.annotation.back_jumps = back_jumps
     
     @Slot()
     def _autoalign(self):
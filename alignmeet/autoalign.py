@@ -1,78 +1,456 @@
+import os
+
 import numpy as np
-from scipy.spatial.distance import cosine
-from sentence_transformers import SentenceTransformer
-import pickle
+
+from .embed_service import EmbeddingService, DEFAULT_MODEL
+from .embed_store import EmbedStore, normalize_text, text_hash
+from .embed_file import EmbedFile
+
+BLOCK_SIZE = 1024 # transcript rows per tile of the similarity matrix
+ENCODE_CHUNK = 256 # lines encoded between two cancellation checks
 
 class Embedder:
-    def __init__(self, model = 'stsb-mpnet-base-v2'):
+    def __init__(self, model = DEFAULT_MODEL, store = None):
         self.model_name = model
-        self.model = SentenceTransformer(model)
-        
-    def embed(self, lines):
-        return
-        embeds = self.model.encode([l.text for l in lines])
-        return embeds
-    
+        self.service = EmbeddingService.get(model)
+        self.store = store if store is not None else EmbedStore.default()
+
+    def embed(self, lines, token = None, progress = None):
+        return self.embed_texts([l.text for l in lines], token, progress)
+
+    def embed_texts(self, texts, token = None, progress = None):
+        # looks every line up in the store first, only the misses are encoded, in chunks
+        # of ENCODE_CHUNK lines between which the job can be cancelled (jobs.CancelToken)
+        texts = [normalize_text(t) for t in texts]
+        hashes = [text_hash(t) for t in texts]
+        found = self.store.get_many(self.model_name, hashes)
+        missing = dict()
+        for h, t in zip(hashes, texts):
+            if h not in found:
+                missing[h] = t
+        keys = list(missing.keys())
+        for start in range(0, len(keys), ENCODE_CHUNK):
+            if token is not None:
+                token.check()
+            chunk = keys[start:start + ENCODE_CHUNK]
+            embeds = self.service.encode([missing[h] for h in chunk])
+            computed = dict(zip(chunk, embeds))
+            self.store.put_many(self.model_name, computed)
+            found.update(computed)
+            if progress is not None:
+                progress(start + len(chunk), len(keys))
+        return [found[h] for h in hashes]
+
     @staticmethod
-    def saveEmbed(embeds, filename):
-        with open(filename, 'wb') as f:
-            pickle.dump(embeds, f)
-    
+    def saveEmbed(embeds, filename, hashes, model = DEFAULT_MODEL, dtype = np.float32):
+        EmbedFile.write(filename, embeds, model, hashes, dtype)
+
     @staticmethod
     def loadEmbed(filename):
-        with open(filename, 'rb') as f:
-            embeds = pickle.load(f)
-        return embeds
-    
+        return EmbedFile.read(filename).matrix
+
+    @staticmethod
+    def restore(lines, filename, model = DEFAULT_MODEL):
+        # sets line.embed from the sidecar for lines whose text did not change,
+        # returns indices of lines that have to be (re-)embedded
+        if not os.path.exists(filename):
+            for line in lines:
+                line.embed = None
+            return list(range(len(lines)))
+        ef = EmbedFile.read(filename)
+        stale = Embedder.restore_file(lines, ef, model)
+        if ef.legacy and not stale:
+            # migrate pickled sidecars to the current format
+            EmbedFile.write(filename, [l.embed for l in lines], model, [text_hash(l.text) for l in lines])
+        return stale
+
+    @staticmethod
+    def restore_file(lines, ef, model = DEFAULT_MODEL):
+        # as restore, from a read EmbedFile; the rows restored are copied out of it at
+        # once: lines must not keep views of a memory-mapped sidecar, it is replaced
+        # when they are embedded again (and a mapped file cannot be replaced on Windows)
+        hashes = [text_hash(l.text) for l in lines]
+        rows = ef.rows(hashes, model)
+        matrix = ef.matrix # pickled list of vectors for a legacy sidecar, taken as is
+        if isinstance(matrix, np.ndarray):
+            found = [row for row in rows if row is not None]
+            matrix = np.array(matrix[found])
+            positions = iter(range(len(found)))
+            rows = [None if row is None else next(positions) for row in rows]
+        stale = []
+        for i, (line, row) in enumerate(zip(lines, rows)):
+            if row is None:
+                line.embed = None
+                stale.append(i)
+            else:
+                line.embed = matrix[row]
+        return stale
+
+def normalize(embeds, dim = None):
+    # stacks embeddings into a row-normalized float32 matrix
+    # rows without (or with zero) embedding are left as zeros and marked invalid
+    matrix = None
+    if isinstance(embeds, np.ndarray) and embeds.ndim == 2:
+        matrix = np.array(embeds, dtype=np.float32)
+    else:
+        embeds = list(embeds)
+        if embeds and all(isinstance(e, np.ndarray) for e in embeds):
+            try:
+                # a single copy when all rows have the same length
+                matrix = np.array(embeds, dtype=np.float32)
+            except ValueError:
+                matrix = None
+    if matrix is not None and matrix.ndim == 2 and (dim is None or matrix.shape[1] == dim):
+        valid = np.ones(len(matrix), dtype=bool)
+    else:
+        embeds = list(embeds)
+        if dim is None:
+            dim = next((len(e) for e in embeds if isinstance(e, np.ndarray)), 0)
+        matrix = np.zeros((len(embeds), dim), dtype=np.float32)
+        valid = np.zeros(len(embeds), dtype=bool)
+        for i, e in enumerate(embeds):
+            if isinstance(e, np.ndarray) and e.shape[-1] == dim:
+                matrix[i] = e
+                valid[i] = True
+    norms = np.linalg.norm(matrix, axis=1)
+    valid &= norms > 0
+    if valid.all():
+        matrix /= norms[:, None]
+    else:
+        matrix[valid] /= norms[valid, None]
+    return matrix, valid
+
+class AlignmentEngine:
+    # cosine distances between transcript rows and minutes computed tile by tile,
+    # so only BLOCK_SIZE x len(minutes) distances are held in memory at once
+    def __init__(self, minutes_emb, block_size = BLOCK_SIZE):
+        self.minutes, self.minutes_valid = normalize(minutes_emb)
+        self.block_size = block_size
+
+    @property
+    def dim(self):
+        return self.minutes.shape[1]
+
+    def blocks(self, transcript_emb):
+        # yields (start row, distance tile); missing embeddings have distance 1.0
+        transcript, valid = normalize(transcript_emb, self.dim)
+        for start in range(0, len(transcript), self.block_size):
+            end = start + self.block_size
+            dist = 1.0 - transcript[start:end] @ self.minutes.T
+            dist[~valid[start:end]] = 1.0
+            dist[:, ~self.minutes_valid] = 1.0
+            yield start, dist
+
+    def distances(self, transcript_emb):
+        dist = np.ones((len(transcript_emb), len(self.minutes)), dtype=np.float32)
+        for start, block in self.blocks(transcript_emb):
+            dist[start:start + len(block)] = block
+        return dist
+
+    def best(self, transcript_emb):
+        # index of the closest minute and its distance for every transcript row
+        n = len(transcript_emb)
+        idx = np.zeros(n, dtype=np.int64)
+        dist = np.ones(n, dtype=np.float32)
+        if len(self.minutes) == 0:
+            return idx, dist
+        for start, block in self.blocks(transcript_emb):
+            end = start + len(block)
+            idx[start:end] = block.argmin(axis=1)
+            dist[start:end] = block[np.arange(len(block)), idx[start:end]]
+        return idx, dist
+
+    def top_k(self, transcript_emb, k):
+        # k closest minutes per row (sorted by distance) and their distances
+        n = len(transcript_emb)
+        k = min(k, len(self.minutes))
+        idx = np.zeros((n, k), dtype=np.int64)
+        dist = np.ones((n, k), dtype=np.float32)
+        if k == 0:
+            return idx, dist
+        for start, block in self.blocks(transcript_emb):
+            end = start + len(block)
+            part = np.argpartition(block, k - 1, axis=1)[:, :k]
+            part_dist = np.take_along_axis(block, part, axis=1)
+            order = np.argsort(part_dist, axis=1, kind='stable')
+            idx[start:end] = np.take_along_axis(part, order, axis=1)
+            dist[start:end] = np.take_along_axis(part_dist, order, axis=1)
+        return idx, dist
+
+    def suggest(self, transcript_emb, k):
+        # k minutes closest to the mean direction of the given rows (each row normalized
+        # first, so long rows do not dominate) and their distances
+        rows, valid = normalize(transcript_emb, self.dim)
+        if not valid.any():
+            return np.zeros(0, dtype=np.int64), np.ones(0, dtype=np.float32)
+        idx, dist = self.top_k(rows[valid].mean(axis=0, keepdims=True), k)
+        keep = self.minutes_valid[idx[0]]
+        return idx[0][keep], dist[0][keep]
+
+    def align(self, transcript_emb, threshold = 0.5):
+        # 1-based minute index per row, 0 if no minute is closer than threshold
+        idx, dist = self.best(transcript_emb)
+        return np.where(dist < threshold, idx + 1, 0)
+
+    def align_monotonic(self, transcript_emb, threshold = 0.5, back_jumps = 2, band = 0.25):
+        return monotonic_path(self.distances(transcript_emb), threshold, back_jumps, band)
+
+def best_alignment(dist, threshold = 0.5):
+    # closest minute per row of a full distance matrix, 1-based, 0 if not closer than threshold
+    n, m = dist.shape
+    if m == 0:
+        return np.zeros(n, dtype=np.int64)
+    idx = dist.argmin(axis=1)
+    return np.where(dist[np.arange(n), idx] < threshold, idx + 1, 0)
+
+def monotonic_path(dist, threshold = 0.5, back_jumps = 2, band = 0.25):
+    # best near-monotonic path through the distance matrix:
+    # every row is either skipped (left unaligned) or aligned to a minute with gain
+    # threshold - distance; going back to an earlier minute than the last aligned one
+    # uses up one of back_jumps; only minutes within band * len(minutes) of the
+    # diagonal are considered
+    n, m = dist.shape
+    alignments = np.zeros(n, dtype=np.int64)
+    if n == 0 or m == 0:
+        return alignments
+    gain = threshold - dist
+    # aligning with a non-positive gain never beats skipping the row
+    gain[gain <= 0] = -np.inf
+    # minutes lo[i]:hi[i] of row i's band (both never decrease)
+    if band is not None:
+        width = max(1.0, band * m)
+        centers = (np.arange(n) + 0.5) * m / n
+        offsets = np.arange(m) + 0.5
+        lo = np.searchsorted(offsets, centers - width)
+        hi = np.searchsorted(offsets, centers + width, side='right')
+    else:
+        lo, hi = np.zeros(n, dtype=np.int64), np.full(n, m)
+    # rows with a positive gain within their band
+    counts = np.zeros((n, m + 1), dtype=np.int32)
+    np.cumsum(gain > 0, axis=1, out=counts[:, 1:])
+    rows = np.flatnonzero(counts[np.arange(n), hi] > counts[np.arange(n), lo])
+    lo, hi = lo[rows], hi[rows]
+    del counts
+
+    # score[b, j]: best total gain so far with b back-jumps used and minute j aligned last;
+    # minutes before a row's band keep their score from then on, the best of them per
+    # b is left, minutes after it are not reached yet
+    B = back_jumps + 1
+    score = np.full((B, m), -np.inf, dtype=np.float32)
+    score[0, 0] = 0.0
+    left = np.full(B, -np.inf, dtype=np.float32)
+    # per row and state of its band (all layers at once): aligned (otherwise skipped),
+    # aligned after a back-jump, and for the backtrace whether the state was the first
+    # best of the minutes up to it (forward moves) or of those after it (backward moves)
+    W = max(hi - lo, default=0)
+    aligned_to = np.zeros((len(rows), B, W), dtype=bool)
+    jumped = np.zeros((len(rows), B, W), dtype=bool)
+    first_fwd = np.zeros((len(rows), B, W), dtype=bool)
+    first_bwd = np.zeros((len(rows), B - 1, W), dtype=bool)
+    fwd = np.empty((B, W + 1), dtype=np.float32)
+    bwd = np.full((B, m), -np.inf, dtype=np.float32)
+    frozen = 0
+    for k, i in enumerate(rows):
+        l, h = lo[k], hi[k]
+        w = h - l
+        if l > frozen:
+            np.maximum(left, score[:, frozen:l].max(axis=1), out=left)
+            frozen = l
+        g = gain[i, l:h]
+        current = score[:, l:h]
+        # best state with last minute <= j (forward move)
+        fwd[:, 0] = left
+        fwd[:, 1:w + 1] = current
+        np.maximum.accumulate(fwd[:, :w + 1], axis=1, out=fwd[:, :w + 1])
+        np.greater(fwd[:, 1:w + 1], fwd[:, :w], out=first_fwd[k, :, :w])
+        aligned = fwd[:, 1:w + 1]
+        aligned += g
+        # best state with last minute > j, one back-jump less (backward move); the
+        # last minute of the band was never after an earlier band, it stays -inf
+        suffix = np.maximum.accumulate(current[:-1, :0:-1], axis=1)
+        np.greater_equal(current[:-1, :0:-1], suffix, out=first_bwd[k, :, w - 1:0:-1])
+        back = bwd[:, l:h]
+        back[1:, :-1] = suffix[:, ::-1]
+        back += g
+        np.greater(back, aligned, out=jumped[k, :, :w])
+        np.maximum(aligned, back, out=aligned)
+        better = np.greater(aligned, current, out=aligned_to[k, :, :w])
+        np.copyto(current, aligned, where=better)
+
+    b, j = np.unravel_index(np.argmax(score), score.shape)
+    for k in range(len(rows) - 1, -1, -1):
+        l = lo[k]
+        if not l <= j < hi[k] or not aligned_to[k, b, j - l]:
+            continue
+        alignments[rows[k]] = j + 1
+        if jumped[k, b, j - l]:
+            # first best state after j
+            b -= 1
+            j = j + 1 + np.argmax(first_bwd[k, b, j + 1 - l:hi[k] - l])
+        else:
+            # last first best state up to j, in the band or before it
+            firsts = first_fwd[k, b, :j + 1 - l]
+            j = l + len(firsts) - 1 - np.argmax(firsts[::-1]) if firsts.any() else np.argmax(score[b, :l])
+    return alignments
+
+def _unchanged(lines, old_lines, old_embeds):
+    # previous row of every line whose embedding is still the same object, -1 otherwise
+    old = None
+    rows = []
+    for i, l in enumerate(lines):
+        if i < len(old_lines) and old_lines[i] is l:
+            j = i
+        else:
+            if old is None:
+                old = {id(o): k for k, o in enumerate(old_lines)}
+            j = old.get(id(l))
+        rows.append(j if j is not None and old_embeds[j] is l.embed else -1)
+    return np.array(rows, dtype=np.int64)
+
+class SimilarityCache:
+    # distance matrix between transcript and minutes lines kept between autoaligns;
+    # lines are matched to the previous state by identity, only rows and columns of
+    # new lines and lines whose embedding changed (edits, re-embedding) are recomputed
+    def __init__(self):
+        self.das = []
+        self.minutes = []
+        self._da_embeds = []
+        self._min_embeds = []
+        self.transcript = np.zeros((0, 0), dtype=np.float32)
+        self.transcript_valid = np.zeros(0, dtype=bool)
+        self.minutes_matrix = np.zeros((0, 0), dtype=np.float32)
+        self.minutes_valid = np.zeros(0, dtype=bool)
+        self.dist = np.ones((0, 0), dtype=np.float32)
+        self.recomputed = (0, 0) # rows and columns recomputed by the last update
+        self._best = None
+
+    @staticmethod
+    def _dim(lines):
+        return next((len(l.embed) for l in lines if isinstance(l.embed, np.ndarray)), 0)
+
+    @staticmethod
+    def _moved(rows, old_count):
+        # lines were inserted, removed or reordered since the previous state
+        kept = np.flatnonzero(rows >= 0)
+        return len(rows) != old_count or not np.array_equal(rows[kept], kept)
+
+    @staticmethod
+    def _vectors(lines, rows, moved, old_matrix, old_valid, dim):
+        # normalized embeddings of lines, reused from the previous state where unchanged
+        kept = rows >= 0
+        changed = np.flatnonzero(~kept)
+        if not moved:
+            # changed rows are overwritten in place
+            matrix, valid = old_matrix, old_valid
+        else:
+            matrix = np.zeros((len(lines), dim), dtype=np.float32)
+            valid = np.zeros(len(lines), dtype=bool)
+            matrix[kept] = old_matrix[rows[kept]]
+            valid[kept] = old_valid[rows[kept]]
+        if len(changed):
+            matrix[changed], valid[changed] = normalize([lines[i].embed for i in changed], dim)
+        return matrix, valid, changed
+
+    def update(self, das, minutes):
+        dim = self._dim(das) or self._dim(minutes)
+        if dim != self.transcript.shape[1] or dim != self.minutes_matrix.shape[1]:
+            # embedded by another model, nothing can be reused
+            self.das, self.minutes = [], []
+            self._da_embeds, self._min_embeds = [], []
+            self.transcript = np.zeros((0, dim), dtype=np.float32)
+            self.minutes_matrix = np.zeros((0, dim), dtype=np.float32)
+        rows = _unchanged(das, self.das, self._da_embeds)
+        cols = _unchanged(minutes, self.minutes, self._min_embeds)
+        rows_moved = self._moved(rows, len(self.das))
+        cols_moved = self._moved(cols, len(self.minutes))
+        transcript, t_valid, new_rows = self._vectors(das, rows, rows_moved, self.transcript, self.transcript_valid, dim)
+        minutes_matrix, m_valid, new_cols = self._vectors(minutes, cols, cols_moved, self.minutes_matrix, self.minutes_valid, dim)
+
+        if not rows_moved and not cols_moved:
+            # only the changed rows and columns are overwritten below
+            dist = self.dist
+        else:
+            dist = np.ones((len(das), len(minutes)), dtype=np.float32)
+            kept_rows = np.flatnonzero(rows >= 0)
+            kept_cols = np.flatnonzero(cols >= 0)
+            if cols_moved:
+                dist[np.ix_(kept_rows, kept_cols)] = self.dist[np.ix_(rows[kept_rows], cols[kept_cols])]
+            else:
+                dist[kept_rows] = self.dist[rows[kept_rows]]
+        if len(new_rows):
+            block = 1.0 - transcript[new_rows] @ minutes_matrix.T
+            block[~t_valid[new_rows]] = 1.0
+            block[:, ~m_valid] = 1.0
+            dist[new_rows] = block
+        if len(new_cols):
+            block = 1.0 - transcript @ minutes_matrix[new_cols].T
+            block[~t_valid] = 1.0
+            block[:, ~m_valid[new_cols]] = 1.0
+            dist[:, new_cols] = block
+
+        self.das, self.minutes = list(das), list(minutes)
+        self._da_embeds = [l.embed for l in das]
+        self._min_embeds = [l.embed for l in minutes]
+        self.transcript, self.transcript_valid = transcript, t_valid
+        self.minutes_matrix, self.minutes_valid = minutes_matrix, m_valid
+        if dist is not self.dist or len(new_rows) or len(new_cols):
+            self._best = None
+        self.dist = dist
+        self.recomputed = (len(new_rows), len(new_cols))
+        return dist
+
+    def best(self):
+        # closest minute and its distance for every row, kept until the matrix changes
+        if self._best is None:
+            n, m = self.dist.shape
+            if m == 0:
+                self._best = (np.zeros(n, dtype=np.int64), np.ones(n, dtype=np.float32))
+            else:
+                idx = self.dist.argmin(axis=1)
+                self._best = (idx, self.dist[np.arange(n), idx])
+        return self._best
+
+    def preview(self, threshold):
+        # 1-based minute per row an autoalign with threshold would pick, 0 for none
+        idx, dist = self.best()
+        return np.where(dist < threshold, idx + 1, 0)
+
 class Aligner:
     @staticmethod
-    def align(transcript_das, minutes, transcript_emb, minutes_emb, threshold = 0.5, disregard_existing_align = False, final=False):
-        alignments = np.zeros(len(transcript_emb))
-        for i, te in enumerate(transcript_emb):
-            sims = np.zeros(len(minutes_emb))
-            for j, se in enumerate(minutes_emb):
-                sims[j] = cosine(te, se)
-            if sims.min() < threshold:
-                alignments[i] = np.argmin(sims) + 1
-        for i, alignment in enumerate(alignments):
-            if transcript_das[i].minute == None or not transcript_das[i].is_final or disregard_existing_align:
-                if alignment == 0:
-                    transcript_das[i].minute = None
-                    transcript_das[i].is_final = True
-                else:
-                    transcript_das[i].minute = minutes[alignment-1]
-                    transcript_das[i].is_fianl = final
-          
-    @staticmethod          
-    def align_inbuilt(transcript_das, minutes, threshold = 0.5, disregard_existing_align = False, final=False):
-        alignments = np.zeros(len(transcript_das))
-        for i, da in enumerate(transcript_das):
-            te = da.embed
-            if not isinstance(te, np.ndarray):
-                continue
-            sims = np.ones(len(minutes))
-            for j, min in enumerate(minutes):
-                if isinstance(min.embed, np.ndarray):
-                    sims[j] = cosine(te, min.embed)
-            if sims.min() < threshold:
-                alignments[i] = np.argmin(sims) + 1
-        for i, alignment in enumerate(alignments):
-            if transcript_das[i].minute == None or not transcript_das[i].is_final or disregard_existing_align:
+    def apply(transcript_das, minutes, alignments, disregard_existing_align = False, final=False):
+        for da, alignment in zip(transcript_das, alignments):
+            if da.minute == None or not da.is_final or disregard_existing_align:
                 if alignment == 0:
-                    transcript_das[i].minute = None
-                    transcript_das[i].is_final = True
+                    da.minute = None
+                    da.is_final = True
                 else:
-                    transcript_das[i].minute = minutes[int(alignment)-1]
-                    transcript_das[i].is_final = final
-    
-    @staticmethod       
-    def align(transcript_emb, minutes_emb, threshold = 0.5):
-        alignments = np.zeros(len(transcript_emb))
-        for i, te in enumerate(transcript_emb):
-            sims = np.zeros(len(minutes_emb))
-            for j, se in enumerate(minutes_emb):
-                sims[j] = cosine(te, se)
-            if sims.min() < threshold:
-                alignments[i] = np.argmin(sims) + 1
-        return alignments
-            
\ No newline at end of file
+                    da.minute = minutes[int(alignment)-1]
+                    da.is_final = final
+
+    @staticmethod
+    def align_inbuilt(transcript_das, minutes, threshold = 0.5, disregard_existing_align = False, final=False, monotonic = False, back_jumps = 2, band = 0.25):
+        alignments = Aligner.align([da.embed for da in transcript_das], [m.embed for m in minutes], threshold, monotonic, back_jumps, band)
+        Aligner.apply(transcript_das, minutes, alignments, disregard_existing_align, final)
+
+    @staticmethod
+    def align_cached(cache, transcript_das, minutes, threshold = 0.5, disregard_existing_align = False, final=False, monotonic = False, back_jumps = 2, band = 0.25):
+        # same as align_inbuilt, the distances come from (and update) a SimilarityCache
+        dist = cache.update(transcript_das, minutes)
+        if monotonic:
+            alignments = monotonic_path(dist, threshold, back_jumps, band)
+        else:
+            alignments = cache.preview(threshold)
+        Aligner.apply(transcript_das, minutes, alignments, disregard_existing_align, final)
+
+    @staticmethod
+    def align_distances(dist, threshold = 0.5, monotonic = False, back_jumps = 2, band = 0.25):
+        if monotonic:
+            return monotonic_path(dist, threshold, back_jumps, band)
+        return best_alignment(dist, threshold)
+
+    @staticmethod
+    def align(transcript_emb, minutes_emb, threshold = 0.5, monotonic = False, back_jumps = 2, band = 0.25):
+        engine = AlignmentEngine(minutes_emb)
+        if monotonic:
+            return engine.align_monotonic(transcript_emb, threshold, back_jumps, band)
+        return engine.align(transcript_emb, threshold)
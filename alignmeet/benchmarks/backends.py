@@ -0,0 +1,69 @@
+import argparse
+import time
+
+import numpy as np
+
+from ..autoalign import AlignmentEngine
+from ..embed_service import DEFAULT_MODEL, LEXICAL_MODEL, EmbeddingService
+from .synthetic import generate
+
+# speed and alignment agreement of embedding backends on a synthetic meeting:
+#   python -m alignmeet.benchmarks.backends --minutes 50 --das-per-minute 20
+
+def encode(model, texts):
+    # (embeddings, seconds spent encoding); loading the model is not counted
+    service = EmbeddingService.get(model)
+    service.wait()
+    start = time.perf_counter()
+    embeds = np.asarray(service.encode(texts), dtype=np.float32)
+    return embeds, time.perf_counter() - start
+
+def accuracy(alignments, gold):
+    return float(np.mean(np.asarray(alignments) == np.asarray(gold)))
+
+def run(models, thresholds, meeting, monotonic = False):
+    results = dict()
+    texts = meeting.minutes + meeting.transcript
+    for model, thr in zip(models, thresholds):
+        try:
+            embeds, seconds = encode(model, texts)
+        except Exception as e:
+            print(f'{model}: unavailable ({e})')
+            continue
+        engine = AlignmentEngine(embeds[:len(meeting.minutes)])
+        transcript = embeds[len(meeting.minutes):]
+        best, _ = engine.best(transcript)
+        if monotonic:
+            alignments = engine.align_monotonic(transcript, thr)
+        else:
+            alignments = engine.align(transcript, thr)
+        results[model] = dict(seconds=seconds, best=best, alignments=alignments)
+        print(f'{model}: {len(texts)} lines in {seconds:.3f} s ({len(texts) / max(seconds, 1e-9):.0f} lines/s), '
+              f'dim {embeds.shape[1]}, accuracy {accuracy(alignments, meeting.gold):.3f} at threshold {thr}')
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.backends', description='Compares embedding backends on a synthetic meeting.')
+    parser.add_argument('--models', nargs='+', default=[LEXICAL_MODEL, DEFAULT_MODEL])
+    parser.add_argument('--thr', type=float, nargs='+', default=[0.75, 0.5], help='Alignment threshold per model.')
+    parser.add_argument('--minutes', type=int, default=30)
+    parser.add_argument('--das-per-minute', dest='das_per_minute', type=int, default=10)
+    parser.add_argument('--monotonic', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    thresholds = args.thr + args.thr[-1:] * (len(args.models) - len(args.thr))
+
+    meeting = generate(args.minutes, args.das_per_minute, seed=args.seed)
+    print(f'Synthetic meeting: {len(meeting.minutes)} minutes, {len(meeting.transcript)} DAs')
+    results = run(args.models, thresholds, meeting, args.monotonic)
+
+    models = list(results)
+    for i, a in enumerate(models):
+        for b in models[i + 1:]:
+            ra, rb = results[a], results[b]
+            print(f'{a} vs {b}: {rb["seconds"] / max(ra["seconds"], 1e-9):.0f}x time ratio, '
+                  f'closest minute agrees on {np.mean(ra["best"] == rb["best"]):.3f}, '
+                  f'alignment agrees on {np.mean(ra["alignments"] == rb["alignments"]):.3f} of DAs')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import os
+import tempfile
+import time
+
+# frame times while scrolling the transcript table offscreen in small steps, with the
+# row height cache (heights measured once, in idle-time batches) and without it (every
+# visible row resized on every scroll tick):
+#   python -m alignmeet.benchmarks.frames --rows 50000
+#   python -m alignmeet.benchmarks.frames --rows 50000 --max-frame-ms 16
+
+def scroll(app, view, frames, step, cached):
+    from PySide2.QtGui import QImage
+    view.cache_heights = cached
+    image = QImage(view.viewport().size(), QImage.Format_ARGB32)
+    scrollbar = view.verticalScrollBar()
+    scrollbar.setValue(0)
+    app.processEvents()
+    times = []
+    for i in range(frames):
+        start = time.perf_counter()
+        scrollbar.setValue(min(scrollbar.maximum(), (i + 1) * step))
+        app.processEvents()
+        view.viewport().render(image)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.frames', description='Times frames while scrolling the transcript table.')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--step', type=int, default=3, help='Rows scrolled per frame.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-frame-ms', dest='max_frame_ms', type=float, default=None, help='Exit with an error if the p95 frame with the cache is slower.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide2.QtWidgets import QApplication
+    from ..annotation import Annotation
+    from ..transcripts.transcripts import Transcripts
+    from .scroll import write_meeting
+
+    app = QApplication.instance() or QApplication([])
+    with tempfile.TemporaryDirectory() as folder:
+        write_meeting(folder, args.rows, args.seed)
+        annotation = Annotation(None)
+        annotation.set_path(folder)
+        transcripts = Transcripts(annotation)
+        transcripts.resize(1000, 800)
+        transcripts.show()
+        annotation.open_transcript('transcript.txt')
+        annotation.open_minutes('minutes.txt')
+        transcripts.model.update()
+        app.processEvents()
+        view = transcripts.transcript
+
+        print(f'{args.rows} rows, {args.frames} frames of {args.step} rows')
+        results = dict()
+        for cached in (False, True):
+            times = scroll(app, view, args.frames, args.step, cached)
+            results[cached] = times
+            over = sum(t > 0.016 for t in times) / len(times)
+            print(f'{"cached " if cached else "uncached"}: median {times[len(times) // 2] * 1000:.1f} ms, '
+                f'p95 {times[int(len(times) * 0.95)] * 1000:.1f} ms, max {times[-1] * 1000:.1f} ms, '
+                f'{over:.1%} frames over 16 ms')
+        annotation.jobs.cancel_all()
+        transcripts.close()
+
+    p95 = results[True][int(len(results[True]) * 0.95)] * 1000
+    if args.max_frame_ms is not None and p95 > args.max_frame_ms:
+        raise SystemExit(f'p95 frame slower than {args.max_frame_ms} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from ..annotation import DialogAct, Minute, replay_journal
+from ..journal import Journal
+from .synthetic import generate
+
+# time to recover a session from its edit journal (read and replay) after a crash:
+#   python -m alignmeet.benchmarks.journal --records 10000
+
+def write_journal(journal, das, minutes, records, seed = 0):
+    # a mix of alignment, text, insert/remove and evaluation edits valid on the meeting
+    rng = random.Random(seed)
+    rows, count = len(das), len(minutes)
+    for i in range(records):
+        r = rng.random()
+        if r < 0.6 or rows < 2:
+            journal.append(['d', rng.randrange(rows), f'edited {i}', 'Anna', rng.randrange(count), True, None])
+        elif r < 0.75:
+            journal.append(['d', rng.randrange(rows), f'rewritten {i}', '', None, False, 'Other'])
+        elif r < 0.8:
+            journal.append(['d+', rng.randrange(rows + 1), f'split {i}', 'Tom', None, True, None])
+            rows += 1
+        elif r < 0.85:
+            journal.append(['d-', rng.randrange(rows - 1), 1])
+            rows -= 1
+        elif r < 0.95:
+            journal.append(['m', rng.randrange(count), f'minute {i}', 3, 4, 5, 1.0])
+        else:
+            journal.append(['e', 4, 4, 3, 5])
+    journal.sync()
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.journal', description='Times reading and replaying an edit journal.')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--minutes', type=int, default=50)
+    parser.add_argument('--das-per-minute', dest='das_per_minute', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-seconds', dest='max_seconds', type=float, default=None, help='Exit with an error if recovering takes longer.')
+    args = parser.parse_args()
+
+    meeting = generate(args.minutes, args.das_per_minute, seed=args.seed)
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, '.meeting.journal')
+        journal = Journal(filename, [])
+        minutes = [Minute(text) for text in meeting.minutes]
+        das = [DialogAct(text, speaker) for text, speaker in zip(meeting.transcript, meeting.speakers)]
+        write_journal(journal, das, minutes, args.records, args.seed)
+        journal.close()
+        size = os.path.getsize(filename)
+
+        start = time.perf_counter()
+        records = Journal(filename, []).read()
+        read = time.perf_counter() - start
+        edited, _, _ = replay_journal(records, das, minutes)
+        total = time.perf_counter() - start
+    print(f'Journal: {len(records)} records, {size / 2**10:.0f} KiB, meeting of {len(meeting.transcript)} DAs and {len(minutes)} minutes')
+    print(f'Read in {read * 1000:.1f} ms, replayed in {(total - read) * 1000:.1f} ms ({len(edited)} lines edited)')
+    print(f'Recovery: {total * 1000:.1f} ms ({len(records) / total:.0f} records/s)')
+    if args.max_seconds is not None and total > args.max_seconds:
+        raise SystemExit(f'Recovery slower than {args.max_seconds} s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import tempfile
+import time
+
+# row heights and repaints of the transcript table offscreen, with the delegates' cache of
+# laid out documents and without it (every call lays the HTML out again):
+#   python -m alignmeet.benchmarks.layout --rows 10000
+
+def run(app, view, model, pages, cached):
+    from PySide2.QtGui import QImage
+    from ..htmldelegate import DOCUMENT_CACHE_SIZE, DocumentCache
+    delegates = [view.itemDelegateForColumn(c) for c in range(model.columnCount())]
+    delegates = [d for d in delegates if d is not None]
+    for d in delegates:
+        d.documents = DocumentCache(DOCUMENT_CACHE_SIZE if cached else 0)
+    image = QImage(view.viewport().size(), QImage.Format_ARGB32)
+    scrollbar = view.verticalScrollBar()
+
+    start = time.perf_counter()
+    view.resizeRowsToContents()
+    heights = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(2): # painted and repainted
+        for page in range(pages):
+            scrollbar.setValue(scrollbar.maximum() * page // max(1, pages - 1))
+            app.processEvents()
+            view.viewport().render(image)
+    paints = time.perf_counter() - start
+    hits = sum(d.documents.hits for d in delegates)
+    misses = sum(d.documents.misses for d in delegates)
+    return heights, paints, hits, misses
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.layout', description='Times row heights and repaints of the transcript table.')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--pages', type=int, default=200, help='Pages painted, spread over the whole transcript.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide2.QtWidgets import QApplication
+    from ..annotation import Annotation
+    from ..transcripts.transcripts import Transcripts
+    from .scroll import write_meeting
+
+    app = QApplication.instance() or QApplication([])
+    with tempfile.TemporaryDirectory() as folder:
+        write_meeting(folder, args.rows, args.seed)
+        annotation = Annotation(None)
+        annotation.set_path(folder)
+        transcripts = Transcripts(annotation)
+        transcripts.resize(1000, 800)
+        transcripts.show()
+        annotation.open_transcript('transcript.txt')
+        annotation.open_minutes('minutes.txt')
+        transcripts.model.update()
+        app.processEvents()
+        view = transcripts.transcript
+
+        print(f'{args.rows} rows, {args.pages} pages painted twice')
+        results = dict()
+        for cached in (False, True):
+            heights, paints, hits, misses = run(app, view, transcripts.model, args.pages, cached)
+            results[cached] = heights + paints
+            print(f'{"cached " if cached else "uncached"}: row heights {heights:.2f} s, paints {paints:.2f} s, '
+                f'{misses} layouts ({hits} reused)')
+        print(f'Speedup: {results[False] / results[True]:.1f}x')
+        annotation.jobs.cancel_all()
+        transcripts.close()
+
+if __name__ == '__main__':
+    main()
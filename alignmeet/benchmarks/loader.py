@@ -0,0 +1,81 @@
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+from ..annotation import DialogAct, SEPARATOR, read_transcript
+from .synthetic import generate
+
+# transcript loading speed of read_transcript against the former readlines() loader:
+#   python -m alignmeet.benchmarks.loader --lines 500000
+
+def legacy_read_transcript(full_path):
+    # the loader before iter_transcript, kept for comparison
+    data = []
+    with open(full_path, 'r', encoding='utf-8') as f:
+        for line in f.readlines():
+            if line is None or len(line) < 1 or not any(map(lambda x: x.isalpha(), list(line))):
+                continue
+            line = line[:-1] #remove newline
+            s = line.split(SEPARATOR)
+            text, speaker = s[0], s[1] if len(s) > 1 else ''
+            if len(speaker) < 1:
+                for f in re.findall(r'^\s*\([^)]+\)', text):
+                    speaker = f[1:-1]
+                    text = text.replace(f, '', 1)
+                    break
+            data.append(DialogAct(text, speaker, *s[2:]))
+    return data
+
+def write_transcript(filename, lines, seed = 0):
+    # ASR-like transcript: '(speaker) text' lines, some with times, some empty or without words
+    rng = random.Random(seed)
+    meeting = generate(minutes=50, das_per_minute=20, seed=seed)
+    with open(filename, 'w', encoding='utf-8') as f:
+        for i in range(lines):
+            j = i % len(meeting.transcript)
+            r = rng.random()
+            if r < 0.02:
+                f.write('\n' if r < 0.01 else '...\n')
+            elif r < 0.2:
+                f.write(f'{meeting.transcript[j]}{SEPARATOR}{meeting.speakers[j]}{SEPARATOR}{i * 2.0}{SEPARATOR}{i * 2.0 + 1.5}\n')
+            else:
+                f.write(f'({meeting.speakers[j]}) {meeting.transcript[j]}\n')
+
+def timed(fn, filename, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        das = fn(filename)
+        best = min(best, time.perf_counter() - start)
+    return das, best
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.loader', description='Compares transcript loaders on a synthetic transcript.')
+    parser.add_argument('--lines', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-speedup', dest='min_speedup', type=float, default=None, help='Exit with an error if read_transcript is not this many times faster.')
+    args = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        write_transcript(filename, args.lines, args.seed)
+        size = os.path.getsize(filename)
+        print(f'Synthetic transcript: {args.lines} lines, {size / 2**20:.1f} MiB')
+        old, t_old = timed(legacy_read_transcript, filename, args.repeat)
+        new, t_new = timed(read_transcript, filename, args.repeat)
+        assert [(d.text, d.speaker, d.start, d.end) for d in old] == [(d.text, d.speaker, d.start, d.end) for d in new]
+        print(f'readlines loader: {len(old)} DAs in {t_old:.3f} s ({len(old) / t_old:.0f} lines/s)')
+        print(f'read_transcript:  {len(new)} DAs in {t_new:.3f} s ({len(new) / t_new:.0f} lines/s)')
+        print(f'Speedup: {t_old / t_new:.1f}x')
+        if args.min_speedup is not None and t_old / t_new < args.min_speedup:
+            raise SystemExit(f'Speedup below {args.min_speedup}x')
+    finally:
+        os.remove(filename)
+
+if __name__ == '__main__':
+    main()
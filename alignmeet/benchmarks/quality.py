@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from ..autoalign import AlignmentEngine
+from ..corpus import NOT_SCORED, gold_pairs
+from ..embed_service import DEFAULT_MODEL, LEXICAL_MODEL
+from .backends import encode
+from .synthetic import generate, write_meeting
+
+# alignment quality and speed of registered aligners against gold (final) alignments,
+# on synthetic meetings or on annotated meeting folders embedded by -ec:
+#   python -m alignmeet.benchmarks.quality --synthetic 10 --json before.json
+#   python -m alignmeet.benchmarks.quality path/to/meetings --model stsb-mpnet-base-v2
+
+def _closest(transcript_emb, minutes_emb, threshold):
+    return AlignmentEngine(minutes_emb).align(transcript_emb, threshold)
+
+def _monotonic(transcript_emb, minutes_emb, threshold):
+    return AlignmentEngine(minutes_emb).align_monotonic(transcript_emb, threshold)
+
+# aligner name -> fn(transcript_emb, minutes_emb, threshold) returning the 1-based
+# minute index per row, 0 for rows left unaligned (as Aligner.align)
+ALIGNERS = {
+    'closest': _closest,
+    'monotonic': _monotonic,
+}
+
+def register_aligner(name, fn):
+    ALIGNERS[name] = fn
+
+class Case:
+    # one transcript x minutes pair with its gold alignment
+    def __init__(self, name, transcript_emb, minutes_emb, gold):
+        self.name = name
+        self.transcript_emb = transcript_emb
+        self.minutes_emb = minutes_emb
+        self.gold = np.asarray(gold, dtype=np.int64)
+
+def synthetic_cases(count, model, minutes = 30, das_per_minute = 10, seed = 0, folder = None):
+    cases = []
+    for i in range(count):
+        meeting = generate(minutes, das_per_minute, seed=seed + i)
+        if folder is not None:
+            write_meeting(meeting, os.path.join(folder, f'meeting{i:03d}'))
+        embeds, _ = encode(model, meeting.minutes + meeting.transcript)
+        cases.append(Case(f'synthetic-{seed + i}', embeds[len(meeting.minutes):], embeds[:len(meeting.minutes)], meeting.gold))
+    return cases
+
+def corpus_cases(paths, model, out = print):
+    # pairs with a final alignment in annotations/, embeddings from the .embed sidecars
+    return [Case(os.path.relpath(annotation), t_emb, m_emb, gold) for _, annotation, t_emb, m_emb, gold in gold_pairs(paths, model, out)]
+
+def score(alignments, gold):
+    # (correct, predicted, relevant) counts over the scored rows
+    alignments = np.asarray(alignments)
+    scored = gold != NOT_SCORED
+    alignments, gold = alignments[scored], gold[scored]
+    correct = int(np.sum((alignments == gold) & (gold != 0)))
+    return correct, int(np.sum(alignments != 0)), int(np.sum(gold != 0))
+
+def metrics(correct, predicted, relevant):
+    precision = correct / predicted if predicted else 0.0
+    recall = correct / relevant if relevant else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return dict(precision=round(precision, 4), recall=round(recall, 4), f1=round(f1, 4))
+
+def measure(fn, case, threshold):
+    # timed run first, then a second run under tracemalloc (which slows it down) for the peak memory
+    start = time.perf_counter()
+    alignments = fn(case.transcript_emb, case.minutes_emb, threshold)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        fn(case.transcript_emb, case.minutes_emb, threshold)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return alignments, seconds, peak
+
+def run(cases, aligners, thresholds, out = print):
+    results = dict()
+    for name, thr in zip(aligners, thresholds):
+        fn = ALIGNERS[name]
+        meetings, totals = [], np.zeros(3, dtype=np.int64)
+        seconds, rows, peak = 0.0, 0, 0
+        for case in cases:
+            alignments, t, p = measure(fn, case, thr)
+            counts = score(alignments, case.gold)
+            totals += counts
+            seconds += t
+            rows += len(case.gold)
+            peak = max(peak, p)
+            meetings.append(dict(name=case.name, rows=len(case.gold), seconds=round(t, 6),
+                rows_per_s=round(len(case.gold) / max(t, 1e-9), 1), peak_bytes=p, **metrics(*counts)))
+        overall = dict(rows=rows, seconds=round(seconds, 6), rows_per_s=round(rows / max(seconds, 1e-9), 1),
+            peak_bytes=peak, **metrics(*totals.tolist()))
+        results[name] = dict(threshold=thr, meetings=meetings, overall=overall)
+        out(f'{name} (threshold {thr}): P {overall["precision"]:.3f} R {overall["recall"]:.3f} F1 {overall["f1"]:.3f}, '
+            f'{rows} rows in {seconds * 1000:.1f} ms ({overall["rows_per_s"]:.0f} rows/s), peak {peak / 2**20:.1f} MiB')
+    return results
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.quality', description='Scores aligners against gold alignments.')
+    parser.add_argument('paths', nargs='*', help='Directories or globs with annotated meetings (embedded by -ec); synthetic meetings if none.')
+    parser.add_argument('--aligners', nargs='+', default=list(ALIGNERS), choices=list(ALIGNERS))
+    parser.add_argument('--thr', type=float, nargs='+', default=[0.75], help='Alignment threshold per aligner.')
+    parser.add_argument('--model', default=None, help=f'Embedding model (default {LEXICAL_MODEL} for synthetic meetings, {DEFAULT_MODEL} otherwise).')
+    parser.add_argument('--synthetic', type=int, default=5, help='Number of synthetic meetings.')
+    parser.add_argument('--minutes', type=int, default=30)
+    parser.add_argument('--das-per-minute', dest='das_per_minute', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--write', metavar='Folder', default=None, help='Also save the synthetic meetings as meeting folders.')
+    parser.add_argument('--json', metavar='Filename', default=None, help='Write the results as JSON ("-" for stdout).')
+    args = parser.parse_args()
+    thresholds = args.thr + args.thr[-1:] * (len(args.aligners) - len(args.thr))
+    # with the JSON on stdout, the report goes to stderr
+    out = (lambda s: print(s, file=sys.stderr)) if args.json == '-' else print
+
+    if args.paths:
+        model = args.model or DEFAULT_MODEL
+        cases = corpus_cases(args.paths, model, out)
+    else:
+        model = args.model or LEXICAL_MODEL
+        cases = synthetic_cases(args.synthetic, model, args.minutes, args.das_per_minute, args.seed, args.write)
+    out(f'{len(cases)} meetings, {sum(len(c.gold) for c in cases)} rows, model {model}')
+    if not cases:
+        return
+    results = run(cases, args.aligners, thresholds, out)
+
+    if args.json:
+        report = dict(commit=_commit(), model=model, source=args.paths or 'synthetic', aligners=results)
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=1)
+            print()
+        else:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import os
+import tempfile
+import time
+
+# scrolls the transcript table through a long synthetic meeting offscreen, editing the
+# top row after every page, and reports the scroll latency, the editor widgets alive and
+# the memory; --persistent opens a persistent editor for every painted cell as the
+# delegates once did, for comparison:
+#   python -m alignmeet.benchmarks.scroll --rows 50000
+#   python -m alignmeet.benchmarks.scroll --rows 50000 --persistent
+
+def rss():
+    # resident memory in bytes (peak where /proc is missing)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, AttributeError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def write_meeting(folder, rows, seed = 0):
+    from ..annotation import MINUTES_FOLDER, TRANSCRIPT_FOLDER
+    from .loader import write_transcript
+    from .synthetic import generate
+    os.makedirs(os.path.join(folder, TRANSCRIPT_FOLDER))
+    os.makedirs(os.path.join(folder, MINUTES_FOLDER))
+    write_transcript(os.path.join(folder, TRANSCRIPT_FOLDER, 'transcript.txt'), rows, seed)
+    with open(os.path.join(folder, MINUTES_FOLDER, 'minutes.txt'), 'w', encoding='utf-8') as f:
+        f.writelines(m + '\n' for m in generate(50, 1, seed=seed).minutes)
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.scroll', description='Scrolls the transcript table offscreen.')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--pages', type=int, default=500, help='Pages scrolled, spread over the whole transcript.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--persistent', action='store_true', help='Open a persistent editor for every painted cell.')
+    parser.add_argument('--max-editors', dest='max_editors', type=int, default=None, help='Exit with an error if more editors are alive at the end.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide2.QtCore import QCoreApplication, QEvent
+    from PySide2.QtWidgets import QAbstractItemView, QApplication, QComboBox, QTextEdit
+    from ..annotation import Annotation
+    from ..transcripts.dialog_act_editor import DialogActEditor
+    from ..transcripts.transcripts import Transcripts
+
+    class PersistentEditors(DialogActEditor):
+        def paint(self, painter, option, index):
+            if isinstance(self.parent(), QAbstractItemView):
+                self.parent().openPersistentEditor(index)
+            super().paint(painter, option, index)
+
+    app = QApplication.instance() or QApplication([])
+    with tempfile.TemporaryDirectory() as folder:
+        write_meeting(folder, args.rows, args.seed)
+        annotation = Annotation(None)
+        annotation.set_path(folder)
+        transcripts = Transcripts(annotation)
+        view = transcripts.transcript
+        if args.persistent:
+            editor = PersistentEditors(view)
+            view.setItemDelegateForColumn(1, editor)
+        transcripts.resize(1000, 800)
+        transcripts.show()
+        annotation.open_transcript('transcript.txt')
+        annotation.open_minutes('minutes.txt')
+        transcripts.model.update()
+        transcripts.edit.setChecked(True)
+        app.processEvents()
+
+        def editors():
+            QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+            return len(view.viewport().findChildren(QTextEdit)) + len(view.viewport().findChildren(QComboBox))
+
+        scrollbar = view.verticalScrollBar()
+        start_rss, start_editors = rss(), editors()
+        latencies = []
+        for page in range(args.pages):
+            start = time.perf_counter()
+            scrollbar.setValue(scrollbar.maximum() * page // max(1, args.pages - 1))
+            app.processEvents()
+            row = max(0, view.rowAt(0))
+            view.setCurrentIndex(transcripts.model.index(row, 1)) # opens its editor
+            app.processEvents()
+            latencies.append(time.perf_counter() - start)
+        end_editors = editors()
+        end_rss = rss()
+        annotation.jobs.cancel_all()
+        annotation.saver.wait()
+        transcripts.close()
+
+    latencies.sort()
+    print(f'{args.rows} rows, {args.pages} pages scrolled ({"persistent editors" if args.persistent else "editors on demand"})')
+    print(f'Latency per page: median {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+        f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms')
+    print(f'Editors alive: {start_editors} before, {end_editors} after')
+    print(f'Memory: {start_rss / 2**20:.1f} MiB before, {end_rss / 2**20:.1f} MiB after ({(end_rss - start_rss) / 2**20:+.1f} MiB)')
+    if args.max_editors is not None and end_editors > args.max_editors:
+        raise SystemExit(f'More than {args.max_editors} editors alive')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import tempfile
+import time
+
+# types a query into the transcript search box offscreen, one key per --key-interval ms,
+# and reports the time the GUI thread spends per keystroke, its longest stall while the
+# search runs in the background, and the time from the last key to the final count:
+#   python -m alignmeet.benchmarks.search --rows 100000 --query "the meeting"
+#   python -m alignmeet.benchmarks.search --rows 100000 --max-stall-ms 50
+
+def spin(app, seconds, stalls):
+    # runs the event loop for seconds, recording the time each turn takes
+    end = time.perf_counter() + seconds
+    while True:
+        start = time.perf_counter()
+        app.processEvents()
+        stalls.append(time.perf_counter() - start)
+        if start >= end:
+            return
+        time.sleep(0.001)
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.search', description='Times typing into the transcript search.')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--query', default='the meeting')
+    parser.add_argument('--key-interval', dest='key_interval', type=float, default=80, help='ms between two keys.')
+    parser.add_argument('--only-matches', dest='only_matches', action='store_true', help='Hide the rows not matching.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-stall-ms', dest='max_stall_ms', type=float, default=None, help='Exit with an error if the event loop stalls longer.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide2.QtWidgets import QApplication
+    from ..annotation import Annotation
+    from ..transcripts.transcripts import Transcripts
+    from .scroll import write_meeting
+
+    app = QApplication.instance() or QApplication([])
+    with tempfile.TemporaryDirectory() as folder:
+        write_meeting(folder, args.rows, args.seed)
+        annotation = Annotation(None)
+        annotation.set_path(folder)
+        transcripts = Transcripts(annotation)
+        transcripts.resize(1000, 800)
+        transcripts.show()
+        annotation.open_transcript('transcript.txt')
+        annotation.open_minutes('minutes.txt')
+        transcripts.model.update()
+        transcripts.only_matches.setChecked(args.only_matches)
+        app.processEvents()
+
+        done = []
+        transcripts.search_engine.finished.connect(lambda: done.append(time.perf_counter()))
+        keys, stalls = [], []
+        for c in args.query:
+            start = time.perf_counter()
+            transcripts.search.insert(c)
+            last_key = time.perf_counter()
+            keys.append(last_key - start)
+            spin(app, args.key_interval / 1000, stalls)
+        while not [t for t in done if t > last_key]:
+            spin(app, 0.01, stalls)
+        result = [t for t in done if t > last_key][0] - last_key
+        matches = len(transcripts.matches)
+        annotation.jobs.cancel_all()
+        annotation.jobs.wait()
+        transcripts.close()
+
+    keys.sort()
+    stalls.sort()
+    print(f'{args.rows} rows, query {args.query!r} typed at {args.key_interval:.0f} ms per key: {matches} matches')
+    print(f'Per keystroke: median {keys[len(keys) // 2] * 1000:.1f} ms, max {keys[-1] * 1000:.1f} ms')
+    print(f'Event loop turns: p95 {stalls[int(len(stalls) * 0.95)] * 1000:.1f} ms, max {stalls[-1] * 1000:.1f} ms')
+    print(f'Final count {result * 1000:.0f} ms after the last key')
+    if args.max_stall_ms is not None and stalls[-1] * 1000 > args.max_stall_ms:
+        raise SystemExit(f'Event loop stalled longer than {args.max_stall_ms} ms')
+
+if __name__ == '__main__':
+    main()
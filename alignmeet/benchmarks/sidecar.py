@@ -0,0 +1,63 @@
+import argparse
+import os
+import pickle
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from ..autoalign import Embedder
+from ..embed_file import EmbedFile
+from .synthetic import generate
+
+# restoring the embeddings of a transcript from its .embed sidecar, from a pickled
+# sidecar of older versions (which is migrated to the current format on the way) and
+# from the current one; checks both restore the vectors written:
+#   python -m alignmeet.benchmarks.sidecar --lines 100000 --dim 384
+
+MODEL = 'benchmark'
+
+def make_lines(count, seed):
+    meeting = generate(minutes=50, das_per_minute=20, seed=seed)
+    return [SimpleNamespace(text=f'{meeting.transcript[i % len(meeting.transcript)]} {i}', embed=None) for i in range(count)]
+
+def restore(lines, filename):
+    start = time.perf_counter()
+    stale = Embedder.restore(lines, filename, MODEL)
+    return stale, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m alignmeet.benchmarks.sidecar', description='Times restoring embeddings from .embed sidecars.')
+    parser.add_argument('--lines', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    lines = make_lines(args.lines, args.seed)
+    vectors = list(np.random.default_rng(args.seed).standard_normal((args.lines, args.dim), dtype=np.float32))
+    fd, filename = tempfile.mkstemp(suffix='.embed')
+    os.close(fd)
+    try:
+        with open(filename, 'wb') as f:
+            pickle.dump(vectors, f)
+        size = os.path.getsize(filename)
+        stale, t_legacy = restore(lines, filename)
+        assert not stale and all(np.array_equal(l.embed, v) for l, v in zip(lines, vectors))
+        ef = EmbedFile.read(filename)
+        assert not ef.legacy and ef.model == MODEL and len(ef) == args.lines, 'pickled sidecar not migrated'
+        del ef
+        print(f'{args.lines} lines of {args.dim} dims')
+        print(f'pickled sidecar ({size / 2**20:.1f} MiB): restored and migrated in {t_legacy:.3f} s')
+
+        stale, t_current = restore(lines, filename)
+        assert not stale and all(np.array_equal(l.embed, v) for l, v in zip(lines, vectors))
+        print(f'current sidecar ({os.path.getsize(filename) / 2**20:.1f} MiB): restored in {t_current:.3f} s')
+        lines[0].text += ' edited'
+        stale, _ = restore(lines, filename)
+        assert stale == [0] and lines[0].embed is None and np.array_equal(lines[1].embed, vectors[1])
+    finally:
+        os.remove(filename)
+
+if __name__ == '__main__':
+    main()
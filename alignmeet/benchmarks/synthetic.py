@@ -0,0 +1,90 @@
+import os
+import random
+
+# synthetic meetings: minutes are short summaries built from topic words, the
+# transcript paraphrases them in order (with some jumps back) and mixes in chit-chat
+TOPICS = {
+    'budget': 'budget cost invoice funding expenses spending money grant payment quarter report finance',
+    'hiring': 'hiring candidate interview position salary contract offer recruiter onboarding team role applicant',
+    'release': 'release version deploy server bug fix testing build package update rollout production',
+    'dataset': 'dataset corpus annotation labels recordings transcripts speakers quality samples format cleaning split',
+    'training': 'training model epochs gpu cluster checkpoint loss learning rate batch evaluation baseline',
+    'paper': 'paper deadline submission reviewers draft experiments figures conference abstract related work',
+    'workshop': 'workshop venue schedule speakers registration catering room program invitations travel',
+    'website': 'website page design menu logo content links hosting domain analytics visitors',
+    'meeting': 'meeting agenda calendar slot weekly call invite notes chair time zone',
+    'hardware': 'hardware laptop microphone headset camera cable monitor order delivery warranty',
+    'security': 'security password access account login permissions audit backup encryption policy',
+    'customer': 'customer feedback complaint support ticket request feature demo contract pricing',
+}
+NAMES = ['Peter', 'Anna', 'Tom', 'Eva', 'Jan', 'Maria', 'Ondrej', 'Lucie']
+VERBS = ['will check', 'prepares', 'sends', 'reviews', 'discussed', 'agreed on', 'updates', 'is responsible for']
+FILLERS = [
+    'yeah', 'okay', 'so', 'um', 'right', 'I think', 'you know', 'well', 'exactly', 'sure',
+    'let me see', 'hmm', 'yes yes', 'good', 'I mean', 'sorry', 'can you hear me', 'one second',
+]
+
+class Meeting:
+    def __init__(self, minutes, transcript, speakers, gold):
+        self.minutes = minutes # minute texts
+        self.transcript = transcript # DA texts
+        self.speakers = speakers # speaker of every DA
+        self.gold = gold # 1-based minute index per DA, 0 if not aligned
+
+def _minute(rng, topic_words):
+    words = rng.sample(topic_words, 4)
+    return f'{rng.choice(NAMES)} {rng.choice(VERBS)} the {words[0]} {words[1]} and {words[2]} {words[3]}', words
+
+def _da(rng, minute_words, topic_words):
+    words = rng.sample(minute_words, rng.randint(1, len(minute_words))) + rng.sample(topic_words, rng.randint(0, 2))
+    rng.shuffle(words)
+    filler = [rng.choice(FILLERS) for _ in range(rng.randint(0, 3))]
+    split = rng.randint(0, len(filler))
+    return ' '.join(filler[:split] + words + filler[split:])
+
+def generate(minutes = 30, das_per_minute = 10, chit_chat = 0.3, back_jumps = 2, seed = 0):
+    # random but reproducible meeting; DAs about one minute come in runs, a few runs
+    # return to an earlier minute, a chit_chat fraction of DAs belongs to no minute
+    rng = random.Random(seed)
+    topics = list(TOPICS.values())
+    minute_texts, minute_words, minute_topics = [], [], []
+    for i in range(minutes):
+        topic_words = topics[(i * len(topics)) // max(1, minutes)].split()
+        text, words = _minute(rng, topic_words)
+        minute_texts.append(text)
+        minute_words.append(words)
+        minute_topics.append(topic_words)
+
+    order = list(range(minutes))
+    for _ in range(min(back_jumps, minutes - 1)):
+        at = rng.randint(1, minutes - 1)
+        order.insert(at + 1, rng.randint(0, at - 1))
+
+    transcript, speakers, gold = [], [], []
+    runs = das_per_minute * minutes / len(order)
+    for m in order:
+        for _ in range(max(1, round(rng.gauss(runs, runs / 3)))):
+            speakers.append(rng.choice(NAMES))
+            if rng.random() < chit_chat:
+                transcript.append(' '.join(rng.choice(FILLERS) for _ in range(rng.randint(1, 4))))
+                gold.append(0)
+            else:
+                transcript.append(_da(rng, minute_words[m], minute_topics[m]))
+                gold.append(m + 1)
+    return Meeting(minute_texts, transcript, speakers, gold)
+
+def write_meeting(meeting, folder, name = 'meeting'):
+    # meeting folder as the GUI opens it, the gold alignment saved as final annotation
+    for sub in ('transcripts', 'minutes', 'annotations'):
+        os.makedirs(os.path.join(folder, sub), exist_ok=True)
+    transcript, minutes = f'{name}.txt', f'{name}_minutes.txt'
+    with open(os.path.join(folder, 'transcripts', transcript), 'w', encoding='utf-8') as f:
+        for speaker, text in zip(meeting.speakers, meeting.transcript):
+            f.write(f'({speaker}) {text}\n')
+    with open(os.path.join(folder, 'minutes', minutes), 'w', encoding='utf-8') as f:
+        for text in meeting.minutes:
+            f.write(text + '\n')
+    with open(os.path.join(folder, 'annotations', f'{transcript}+{minutes}'), 'w', encoding='utf-8') as f:
+        for i, m in enumerate(meeting.gold):
+            if m:
+                f.write(f'{i + 1} {m} None\n')
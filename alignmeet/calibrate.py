@@ -0,0 +1,93 @@
+import os
+
+from PySide2.QtCore import QSettings
+
+from .embed_service import DEFAULT_MODEL, LEXICAL_MODEL
+
+# the GUI only reads the thresholds (default_threshold), numpy and the alignment stack
+# are imported by the functions computing them
+FALLBACK_THRESHOLD = 0.5 # before any calibration
+FALLBACK_THRESHOLDS = {LEXICAL_MODEL: 0.75} # of models whose distances run higher
+CANDIDATES = 401 # thresholds tried by calibrate, evenly spaced over [0, 1]
+THRESHOLD_KEY = 'autoalign/threshold' # thresholds are stored per model (distances of models differ)
+
+def meeting_type(meeting):
+    # meetings are grouped by the folder holding them (e.g. the language or the series)
+    return os.path.basename(os.path.dirname(os.path.normpath(os.path.abspath(meeting))))
+
+def f1_curve(dist, correct, relevant, candidates):
+    # F1 of aligning rows to their closest minute at every candidate threshold at once:
+    # a row is predicted if its best distance is below the threshold, and correct if
+    # that minute is the gold one, so counting both is a search in the sorted distances
+    import numpy as np
+    predicted = np.searchsorted(np.sort(dist), candidates, side='left')
+    hits = np.searchsorted(np.sort(dist[correct]), candidates, side='left')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f1 = np.where(predicted + relevant > 0, 2 * hits / (predicted + relevant), 0.0)
+    return f1
+
+def calibrate(cases, candidates = None):
+    # cases are (type, transcript_emb, minutes_emb, gold) with the 1-based gold minute
+    # per row (0 for none, NOT_SCORED for rows not scored); returns {type or None for all:
+    # (threshold, F1, rows)} of the F1-optimal threshold; the distances are computed
+    # once per case, not per candidate
+    import numpy as np
+    from .autoalign import AlignmentEngine
+    from .corpus import NOT_SCORED
+    if candidates is None:
+        candidates = np.linspace(0, 1, CANDIDATES)
+    dists, hits, relevant = dict(), dict(), dict()
+    for kind, transcript_emb, minutes_emb, gold in cases:
+        gold = np.asarray(gold)
+        idx, dist = AlignmentEngine(minutes_emb).best(transcript_emb)
+        scored = gold != NOT_SCORED
+        correct = ((idx + 1) == gold) & (gold > 0)
+        for key in (kind, None):
+            dists.setdefault(key, []).append(dist[scored])
+            hits.setdefault(key, []).append(correct[scored])
+            relevant[key] = relevant.get(key, 0) + int(np.sum(gold > 0))
+
+    result = dict()
+    for kind in dists:
+        dist, correct = np.concatenate(dists[kind]), np.concatenate(hits[kind])
+        f1 = f1_curve(dist, correct, relevant[kind], candidates)
+        best = int(np.argmax(f1))
+        result[kind] = (round(float(candidates[best]), 4), float(f1[best]), len(dist))
+    return result
+
+def threshold_key(model):
+    # settings key of the model's thresholds ('/' separates settings groups)
+    name = model.replace('/', '_').replace('\\', '_')
+    return f'{THRESHOLD_KEY}/{name}'
+
+def store_thresholds(result, model = DEFAULT_MODEL):
+    s = QSettings()
+    key = threshold_key(model)
+    for kind, (threshold, _, _) in result.items():
+        s.setValue(key if kind is None else f'{key}/{kind}', threshold)
+
+def default_threshold(meeting = None, model = DEFAULT_MODEL):
+    # threshold calibrated with the model for the type of the meeting, else its global one
+    s = QSettings()
+    key = threshold_key(model)
+    value = None
+    if meeting:
+        value = s.value(f'{key}/{meeting_type(meeting)}')
+    if value is None:
+        value = s.value(key, FALLBACK_THRESHOLDS.get(model, FALLBACK_THRESHOLD))
+    return float(value)
+
+def calibrate_corpus(paths, model = DEFAULT_MODEL, store = True, out = print):
+    from .corpus import gold_pairs
+    cases = [(meeting_type(meeting), t_emb, m_emb, gold) for meeting, _, t_emb, m_emb, gold in gold_pairs(paths, model, out)]
+    result = calibrate(cases)
+    if not result:
+        out('No meetings with a final alignment and embeddings found')
+        return result
+    for kind in sorted(result, key=lambda k: (k is not None, k or '')):
+        threshold, f1, rows = result[kind]
+        out(f'{"all meetings" if kind is None else kind}: threshold {threshold:.4f} (F1 {f1:.3f} on {rows} rows)')
+    if store:
+        store_thresholds(result, model)
+        out(f'Stored as the default autoalign thresholds of {model}')
+    return result
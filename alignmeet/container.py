@@ -0,0 +1,281 @@
+import fnmatch
+import os
+import sqlite3
+import threading
+import time
+
+from .annotation import TRANSCRIPT_FOLDER, MINUTES_FOLDER, ANNOTATIONS_FOLDER, EVALUATIONS_FOLDER, DialogAct, Minute, \
+    file_bytes, parse_alignment, parse_minutes, parse_transcript, text_lines, write_atomic
+from .embed_file import EmbedFile
+
+# a meeting folder in a single SQLite file: every file of the folder layout is kept byte
+# for byte (what is exported back, so that the folder and its git history stay as they
+# are), transcripts, minutes and alignments are also split into indexed rows (what
+# opening a meeting reads); paths of the folder are '/' separated, relative to it, and
+# the meeting is opened by the GUI as a folder with paths under the container file:
+#   python -m alignmeet --pack path/to/meeting meeting.alignmeet
+#   python -m alignmeet --unpack meeting.alignmeet path/to/meeting
+CONTAINER_SUFFIX = '.alignmeet'
+SCHEMA_VERSION = 1
+TRANSCRIPT = 'transcript'
+MINUTES = 'minutes'
+ALIGNMENT = 'alignment'
+EVALUATION = 'evaluation'
+EMBEDDINGS = 'embeddings'
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    content BLOB NOT NULL,
+    mtime_ns INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS das (
+    file TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    speaker TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    PRIMARY KEY (file, row)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS das_speaker ON das (file, speaker);
+CREATE TABLE IF NOT EXISTS minutes (
+    file TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (file, row)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alignments (
+    file TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    minute INTEGER,
+    final INTEGER NOT NULL,
+    problem INTEGER,
+    remark TEXT,
+    PRIMARY KEY (file, row)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS alignments_minute ON alignments (file, minute);
+CREATE INDEX IF NOT EXISTS alignments_problem ON alignments (file, problem);
+CREATE INDEX IF NOT EXISTS alignments_remark ON alignments (file, remark);
+'''
+
+def is_container(p):
+    return p.endswith(CONTAINER_SUFFIX) and os.path.isfile(p)
+
+def text_file_kind(path):
+    # transcript/minutes file by the meeting layout (see Annotation._refresh_files), None otherwise
+    name = os.path.basename(path)
+    if name.startswith('.') or name.endswith('.embed') or name.endswith('.tmp'):
+        return None
+    folder = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    if folder == TRANSCRIPT_FOLDER:
+        return TRANSCRIPT
+    if folder == MINUTES_FOLDER:
+        return MINUTES
+    if name.endswith('.txt'):
+        if name.startswith('transcript'):
+            return TRANSCRIPT
+        if name.startswith('minutes'):
+            return MINUTES
+    return None
+
+def file_kind(path):
+    # as text_file_kind, also for alignment, evaluation and embedding files
+    name = os.path.basename(path)
+    if name.startswith('.') or name.endswith('.tmp'):
+        return None
+    if name.endswith('.embed'):
+        return EMBEDDINGS if text_file_kind(path[:-len('.embed')]) is not None else None
+    folder = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    if folder == ANNOTATIONS_FOLDER or name.startswith('alignment+'):
+        return ALIGNMENT
+    if folder == EVALUATIONS_FOLDER or name.startswith('evaluation+'):
+        return EVALUATION
+    return text_file_kind(path)
+
+class Container:
+    # paths passed to the methods are under the container file (as if it was the folder)
+    def __init__(self, filename):
+        self.filename = os.path.normpath(os.path.abspath(filename))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.filename, check_same_thread=False)
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version > SCHEMA_VERSION:
+            self._db.close()
+            raise ValueError(f'{filename}: unsupported container version {version}')
+        self._db.executescript(SCHEMA)
+        self._db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def owns(self, full_path):
+        rel = os.path.relpath(os.path.abspath(full_path), self.filename)
+        return rel != os.curdir and not rel.startswith(os.pardir)
+
+    def relpath(self, full_path):
+        rel = os.path.relpath(os.path.abspath(full_path), self.filename)
+        if rel.startswith(os.pardir):
+            raise ValueError(f'{full_path} is not in {self.filename}')
+        return '' if rel == os.curdir else rel.replace(os.sep, '/')
+
+    def _query(self, sql, params = ()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # files of the folder layout
+
+    def exists(self, full_path):
+        rel = self.relpath(full_path)
+        if not rel:
+            return True
+        # the file, or a file in the folder ('0' follows '/')
+        return bool(self._query('SELECT 1 FROM files WHERE path = ? OR (path > ? AND path < ?) LIMIT 1',
+            (rel, rel + '/', rel + '0')))
+
+    def listdir(self, full_path):
+        rel = self.relpath(full_path)
+        prefix = rel + '/' if rel else ''
+        if rel:
+            rows = self._query('SELECT path FROM files WHERE path > ? AND path < ?', (rel + '/', rel + '0'))
+        else:
+            rows = self._query('SELECT path FROM files')
+        return sorted({p[len(prefix):].split('/')[0] for p, in rows})
+
+    def glob(self, full_pattern):
+        # as glob.glob in the folder of the pattern (without ** or patterns in folder names)
+        rel = self.relpath(full_pattern)
+        depth = rel.count('/')
+        return [os.path.join(self.filename, *p.split('/')) for p, in self._query('SELECT path FROM files ORDER BY path')
+            if p.count('/') == depth and fnmatch.fnmatchcase(p, rel)]
+
+    def read_file(self, full_path):
+        rows = self._query('SELECT content FROM files WHERE path = ?', (self.relpath(full_path),))
+        if not rows:
+            raise FileNotFoundError(full_path)
+        return bytes(rows[0][0])
+
+    def stat(self, full_path):
+        # [size, mtime] as journal.file_stat
+        rows = self._query('SELECT LENGTH(content), mtime_ns FROM files WHERE path = ?', (self.relpath(full_path),))
+        return list(rows[0]) if rows else None
+
+    def files(self):
+        # (path, content, mtime) of every file
+        return [(p, bytes(content), mtime) for p, content, mtime in self._query('SELECT path, content, mtime_ns FROM files ORDER BY path')]
+
+    def store(self, files):
+        # [(path in the folder, content, mtime)] in one transaction, rows reindexed
+        with self._lock:
+            with self._db:
+                for rel, data, mtime in files:
+                    self._db.execute('INSERT OR REPLACE INTO files (path, content, mtime_ns) VALUES (?, ?, ?)', (rel, data, mtime))
+                    self._index(rel, data)
+
+    def write_files(self, files):
+        # [(full path, text content)] as Annotation.save writes them; returns bytes written
+        data = [(self.relpath(full_path), file_bytes(content), time.time_ns()) for full_path, content in files]
+        self.store(data)
+        return sum(len(d) for _, d, _ in data)
+
+    def _index(self, rel, data):
+        for table in ('das', 'minutes', 'alignments'):
+            self._db.execute(f'DELETE FROM {table} WHERE file = ?', (rel,))
+        # classified by the path the file has in the folder
+        kind = file_kind(os.path.join(self.filename, *rel.split('/')))
+        if kind == TRANSCRIPT:
+            self._db.executemany('INSERT INTO das (file, row, text, speaker, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)',
+                ((rel, i, da.text, da.speaker, da.start, da.end) for i, da in enumerate(parse_transcript(data.decode('utf-8')))))
+        elif kind == MINUTES:
+            self._db.executemany('INSERT INTO minutes (file, row, text) VALUES (?, ?, ?)',
+                ((rel, i, m.text) for i, m in enumerate(parse_minutes(text_lines(data)))))
+        elif kind == ALIGNMENT:
+            # a DA listed twice keeps its last line, as when it is opened
+            self._db.executemany('INSERT OR REPLACE INTO alignments (file, row, minute, final, problem, remark) VALUES (?, ?, ?, ?, ?, ?)',
+                ((rel, idx, minute, final, None if isinstance(problem, str) else problem, problem if isinstance(problem, str) else None)
+                    for idx, minute, final, problem in parse_alignment(text_lines(data))))
+
+    # rows of the indexed files
+
+    def read_das(self, full_path, start = 0, count = None):
+        # DialogActs of a transcript (rows start to start + count), without parsing it
+        rows = self._query('SELECT text, speaker, start_time, end_time FROM das WHERE file = ? AND row >= ? ORDER BY row LIMIT ?',
+            (self.relpath(full_path), start, -1 if count is None else count))
+        fast = DialogAct.fast
+        das, speakers = [], set()
+        for text, speaker, begin, end in rows:
+            das.append(fast(text, speaker, begin, end))
+            speakers.add(speaker)
+        DialogAct.speakers.update(speakers)
+        return das
+
+    def count_das(self, full_path):
+        return self._query('SELECT COUNT(*) FROM das WHERE file = ?', (self.relpath(full_path),))[0][0]
+
+    def das_of_speaker(self, full_path, speaker):
+        # rows of a transcript said by the speaker
+        return [r for r, in self._query('SELECT row FROM das WHERE file = ? AND speaker = ? ORDER BY row', (self.relpath(full_path), speaker))]
+
+    def read_minutes(self, full_path):
+        return [Minute(text) for text, in self._query('SELECT text FROM minutes WHERE file = ? ORDER BY row', (self.relpath(full_path),))]
+
+    def read_alignment(self, full_path):
+        # as annotation.read_alignment
+        rows = self._query('SELECT row, minute, final, problem, remark FROM alignments WHERE file = ? ORDER BY row', (self.relpath(full_path),))
+        return [(row, minute, bool(final), remark if remark is not None else problem) for row, minute, final, problem, remark in rows]
+
+    def das_of_minute(self, full_path, minute):
+        # rows aligned to the minute (0-based index) by an alignment file
+        return [r for r, in self._query('SELECT row FROM alignments WHERE file = ? AND minute = ? ORDER BY row', (self.relpath(full_path), minute))]
+
+    def das_with_problem(self, full_path, problem):
+        # rows of an alignment file with the problem (index to PROBLEMS or a custom remark)
+        column = 'remark' if isinstance(problem, str) else 'problem'
+        return [r for r, in self._query(f'SELECT row FROM alignments WHERE file = ? AND {column} = ? ORDER BY row', (self.relpath(full_path), problem))]
+
+    # embeddings, kept as their .embed sidecars
+
+    def read_embed(self, full_path):
+        return EmbedFile.frombytes(self.read_file(full_path), full_path)
+
+    def write_embed(self, full_path, embeds, model, hashes):
+        self.store([(self.relpath(full_path), EmbedFile.tobytes(embeds, model, hashes), time.time_ns())])
+
+def import_folder(folder, filename, out = print):
+    # stores the files of a meeting folder in the container (created if missing); files
+    # outside the layout (audio, dot files, ...) are left out
+    files, skipped = [], []
+    for root, dirs, names in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(names):
+            full_path = os.path.join(root, name)
+            rel = os.path.relpath(full_path, folder).replace(os.sep, '/')
+            if file_kind(full_path) is None:
+                skipped.append(rel)
+                continue
+            with open(full_path, 'rb') as f:
+                files.append((rel, f.read(), os.stat(full_path).st_mtime_ns))
+    container = Container(filename)
+    try:
+        container.store(files)
+    finally:
+        container.close()
+    out(f'{len(files)} files ({sum(len(d) for _, d, _ in files) / 2**20:.1f} MiB) stored in {filename}')
+    if skipped:
+        out(f'Not part of the meeting layout, left out: {", ".join(skipped)}')
+    return len(files)
+
+def export_folder(filename, folder, out = print):
+    # writes the files of the container to the folder as they were imported or saved;
+    # other files of the folder are kept
+    if not is_container(filename):
+        raise FileNotFoundError(filename)
+    container = Container(filename)
+    try:
+        files = container.files()
+    finally:
+        container.close()
+    for rel, data, mtime in files:
+        full_path = os.path.join(folder, *rel.split('/'))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        write_atomic(full_path, data)
+        os.utime(full_path, ns=(mtime, mtime))
+    out(f'{len(files)} files written to {folder}')
+    return len(files)
@@ -0,0 +1,354 @@
+import glob
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from .embed_service import DEFAULT_MODEL
+from .embed_file import EmbedFile
+from .embed_service import EmbeddingService
+from .embed_store import EmbedStore, normalize_text, text_hash
+
+PROGRESS_FILE = '.alignmeet-embed-progress.json'
+ALIGN_PROGRESS_FILE = '.alignmeet-align-progress.json'
+NOT_SCORED = -1 # gold of rows with a tentative alignment
+POOL_LINES = 100000 # lines pooled (and held in memory) before their sidecars are written
+
+def find_files(paths):
+    # expands directories (recursively) and globs into [(path, kind)]
+    from .container import text_file_kind
+    found = dict()
+    for p in paths:
+        matches = glob.glob(p, recursive=True) if any(c in p for c in '*?[') else [p]
+        for m in sorted(matches):
+            if os.path.isdir(m):
+                for root, dirs, files in os.walk(m):
+                    dirs.sort()
+                    for f in sorted(files):
+                        path = os.path.join(root, f)
+                        kind = text_file_kind(path)
+                        if kind is not None:
+                            found[os.path.normpath(path)] = kind
+            elif os.path.isfile(m):
+                kind = text_file_kind(m)
+                if kind is not None:
+                    found[os.path.normpath(m)] = kind
+    return list(found.items())
+
+def read_lines(path, kind):
+    from .annotation import read_transcript, read_minutes
+    from .container import TRANSCRIPT
+    lines = read_transcript(path) if kind == TRANSCRIPT else read_minutes(path)
+    return [normalize_text(l.text) for l in lines]
+
+class Progress:
+    # resume manifest: finished outputs with a stamp (sizes and mtimes of the inputs
+    # and the parameters used) taken when they were written
+    def __init__(self, path):
+        self.path = path
+        self.files = dict()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f).get('files', dict())
+
+    @staticmethod
+    def stamp(*files, **params):
+        stamp = []
+        for file in files:
+            st = os.stat(file)
+            stamp += [st.st_size, st.st_mtime_ns]
+        return stamp + [params[k] for k in sorted(params)]
+
+    def done(self, key, stamp):
+        entry = self.files.get(os.path.abspath(key))
+        return entry is not None and entry['stamp'] == stamp
+
+    def finish(self, key, stamp, **info):
+        info['stamp'] = stamp
+        self.files[os.path.abspath(key)] = info
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files}, f, indent=1)
+        os.replace(tmp, self.path)
+
+def _sidecar_of(path, model):
+    # path has a sidecar of model's embeddings (it may have been replaced since it was stamped)
+    try:
+        return EmbedFile.read_model(path + '.embed') == model
+    except (OSError, ValueError):
+        return False
+
+def _init_worker(model, threads):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    EmbeddingService.get(model).prewarm()
+
+def _encode_bucket(task):
+    model, hashes, texts = task
+    return hashes, np.asarray(EmbeddingService.get(model).encode(texts), dtype=np.float32)
+
+def length_buckets(texts, batch_size):
+    # [(hashes, texts)] of similar length, so that padding within a batch is minimal
+    items = sorted(texts.items(), key=lambda x: len(x[1]))
+    for i in range(0, len(items), batch_size):
+        chunk = items[i:i + batch_size]
+        yield [h for h, _ in chunk], [t for _, t in chunk]
+
+def embed_corpus(paths, workers = 1, batch_size = 64, dtype = 'float32', progress_file = PROGRESS_FILE, model = DEFAULT_MODEL, store = None, pool_lines = POOL_LINES, out = print):
+    store = store if store is not None else EmbedStore.default()
+    progress = Progress(progress_file)
+    files = find_files(paths)
+    todo = [(f, k) for f, k in files if not (progress.done(f, Progress.stamp(f, model=model, dtype=dtype)) and _sidecar_of(f, model))]
+    out(f'{len(files)} files found, {len(files) - len(todo)} already embedded, {len(todo)} to embed')
+    if not todo:
+        return
+
+    pool = None
+    if workers > 1:
+        threads = max(1, (os.cpu_count() or workers) // workers)
+        pool = multiprocessing.get_context('spawn').Pool(workers, _init_worker, (model, threads))
+    else:
+        EmbeddingService.get(model).prewarm()
+
+    start = time.perf_counter()
+    total_lines = 0
+    total_encoded = 0
+    try:
+        window = []
+        window_lines = 0
+        for f, kind in todo:
+            t = time.perf_counter()
+            texts = read_lines(f, kind)
+            window.append((f, texts, time.perf_counter() - t))
+            window_lines += len(texts)
+            if window_lines >= pool_lines:
+                total_encoded += _embed_window(window, pool, batch_size, dtype, model, store, progress, out)
+                total_lines += window_lines
+                window, window_lines = [], 0
+        if window:
+            total_encoded += _embed_window(window, pool, batch_size, dtype, model, store, progress, out)
+            total_lines += window_lines
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - start
+    stats = store.stats()
+    out(f'Embedded {len(todo)} files ({total_lines} lines, {total_encoded} encoded, {stats["hits"]} from store) in {elapsed:.1f} s')
+
+def _embed_window(window, pool, batch_size, dtype, model, store, progress, out):
+    # pools the lines of all files in the window, encodes unseen ones in length buckets,
+    # then writes the sidecars; returns the number of encoded lines
+    hashes = {f: [text_hash(t) for t in texts] for f, texts, _ in window}
+    vectors = store.get_many(model, [h for hs in hashes.values() for h in hs])
+    missing = dict()
+    for f, texts, _ in window:
+        for h, t in zip(hashes[f], texts):
+            if h not in vectors:
+                missing[h] = t
+
+    start = time.perf_counter()
+    tasks = [(model, hs, ts) for hs, ts in length_buckets(missing, batch_size)]
+    results = pool.imap_unordered(_encode_bucket, tasks) if pool is not None else map(_encode_bucket, tasks)
+    done = 0
+    for hs, embeds in results:
+        computed = dict(zip(hs, embeds))
+        store.put_many(model, computed)
+        vectors.update(computed)
+        done += len(hs)
+        out(f'  encoded {done}/{len(missing)} new lines', end='\r')
+    if missing:
+        out('')
+    encode_time = time.perf_counter() - start
+
+    for f, texts, parse_time in window:
+        t = time.perf_counter()
+        new = sum(1 for h in set(hashes[f]) if h in missing)
+        EmbedFile.write(f + '.embed', [vectors[h] for h in hashes[f]], model, hashes[f], dtype)
+        # encoding time is shared by the files in proportion to their new lines
+        seconds = parse_time + time.perf_counter() - t + (encode_time * new / len(missing) if missing else 0.0)
+        progress.finish(f, Progress.stamp(f, model=model, dtype=dtype), lines=len(texts), encoded=new, seconds=round(seconds, 3))
+        progress.save()
+        out(f'{f}: {len(texts)} lines ({new} new) in {seconds:.2f} s')
+    return len(missing)
+
+def find_meetings(paths):
+    # meeting folders (with transcripts/ and minutes/, see Annotations.open_existing) under paths
+    from .annotation import TRANSCRIPT_FOLDER, MINUTES_FOLDER
+    found = []
+    for p in paths:
+        matches = glob.glob(p, recursive=True) if any(c in p for c in '*?[') else [p]
+        for m in sorted(matches):
+            for root, dirs, files in os.walk(m):
+                dirs.sort()
+                if TRANSCRIPT_FOLDER in dirs and MINUTES_FOLDER in dirs:
+                    found.append(os.path.normpath(root))
+                    dirs[:] = [] # the meeting's own folders hold no meetings
+    return list(dict.fromkeys(found))
+
+def meeting_pairs(meeting):
+    # (transcript, minutes, annotation) paths of every transcript x minutes pair of a meeting
+    from .annotation import TRANSCRIPT_FOLDER, MINUTES_FOLDER, ANNOTATIONS_FOLDER
+    from .container import text_file_kind
+    def listing(folder):
+        folder = os.path.join(meeting, folder)
+        return sorted(f for f in os.listdir(folder) if text_file_kind(os.path.join(folder, f)) is not None)
+    for t in listing(TRANSCRIPT_FOLDER):
+        for m in listing(MINUTES_FOLDER):
+            yield (os.path.join(meeting, TRANSCRIPT_FOLDER, t),
+                os.path.join(meeting, MINUTES_FOLDER, m),
+                os.path.join(meeting, ANNOTATIONS_FOLDER, f'{t}+{m}'))
+
+def has_final_alignment(annotation_path):
+    from .annotation import read_alignment
+    if not os.path.exists(annotation_path):
+        return False
+    return any(minute is not None and final for _, minute, final, _ in read_alignment(annotation_path))
+
+def sidecar_embeddings(path, lines, model):
+    # embeddings of lines from the (memory-mapped) sidecar, None for lines it lacks
+    from .embed_file import EmbedFile
+    ef = EmbedFile.read(path + '.embed')
+    rows = ef.rows([text_hash(l.text) for l in lines], model)
+    if rows == list(range(len(ef))):
+        return ef.matrix, 0
+    return [ef.matrix[r] if r is not None else None for r in rows], rows.count(None)
+
+def gold_pairs(paths, model = DEFAULT_MODEL, out = print):
+    # (meeting, annotation, transcript embeddings, minutes embeddings, gold) of every pair
+    # with a final alignment and embeddings; gold is the 1-based minute of each DA, 0 if
+    # it has none, NOT_SCORED if it is aligned only tentatively
+    from .annotation import read_transcript, read_minutes, read_alignment
+    for meeting in find_meetings(paths):
+        for transcript, minutes_path, annotation in meeting_pairs(meeting):
+            if not has_final_alignment(annotation):
+                continue
+            if not (os.path.exists(transcript + '.embed') and os.path.exists(minutes_path + '.embed')):
+                out(f'Skipping {annotation}: no embeddings, run -ec first')
+                continue
+            das = read_transcript(transcript)
+            minutes = read_minutes(minutes_path)
+            gold = np.zeros(len(das), dtype=np.int64)
+            for idx, minute, final, _ in read_alignment(annotation):
+                if 0 <= idx < len(das) and minute is not None and 0 <= minute < len(minutes):
+                    gold[idx] = minute + 1 if final else NOT_SCORED
+            t_emb, t_missing = sidecar_embeddings(transcript, das, model)
+            m_emb, m_missing = sidecar_embeddings(minutes_path, minutes, model)
+            if t_missing + m_missing:
+                out(f'{annotation}: {t_missing + m_missing} lines without {model} embedding')
+            yield meeting, annotation, t_emb, m_emb, gold
+
+def _align_pair(task):
+    # worker: aligns one pair, keeping final alignments and remarks already in the
+    # annotation file, and writes the file
+    from .annotation import read_transcript, read_minutes, read_alignment, write_alignment
+    from .autoalign import Aligner
+    transcript, minutes_path, annotation, model, params = task
+    start = time.perf_counter()
+    das = read_transcript(transcript)
+    minutes = read_minutes(minutes_path)
+    t_emb, t_missing = sidecar_embeddings(transcript, das, model)
+    m_emb, m_missing = sidecar_embeddings(minutes_path, minutes, model)
+    if os.path.exists(annotation):
+        for idx, minute, final, problem in read_alignment(annotation):
+            if 0 <= idx < len(das):
+                das[idx].problem = problem
+                das[idx].is_final = final
+                das[idx].minute = minutes[minute] if minute is not None and 0 <= minute < len(minutes) else None
+    alignments = Aligner.align(t_emb, m_emb, params['threshold'], params['monotonic'], params['back_jumps'], params['band'])
+    Aligner.apply(das, minutes, alignments, False, params['final'])
+
+    index = {m: i for i, m in enumerate(minutes)}
+    index[None] = None
+    os.makedirs(os.path.dirname(annotation), exist_ok=True)
+    write_alignment(annotation, das, index)
+    return dict(
+        annotation=annotation,
+        rows=len(das),
+        aligned=sum(1 for d in das if d.minute is not None),
+        missing=t_missing + m_missing,
+        seconds=time.perf_counter() - start,
+    )
+
+def align_corpus(paths, workers = 1, threshold = None, monotonic = False, back_jumps = 2, band = 0.25, final = True,
+        progress_file = ALIGN_PROGRESS_FILE, dry_run = False, model = DEFAULT_MODEL, out = print):
+    # without a threshold, each meeting is aligned with the calibrated one of its type
+    if threshold is None:
+        from .calibrate import default_threshold
+    progress = Progress(progress_file)
+    meetings = find_meetings(paths)
+    todo, aligned, resumed, unembedded = [], 0, 0, []
+    for meeting in meetings:
+        thr = threshold if threshold is not None else default_threshold(meeting, model)
+        params = dict(threshold=thr, monotonic=monotonic, back_jumps=back_jumps, band=band, final=final)
+        for transcript, minutes, annotation in meeting_pairs(meeting):
+            if not (os.path.exists(transcript + '.embed') and os.path.exists(minutes + '.embed')):
+                unembedded.append(annotation)
+            elif has_final_alignment(annotation):
+                aligned += 1
+            elif progress.done(annotation, Progress.stamp(transcript, minutes, transcript + '.embed', minutes + '.embed', **params)):
+                resumed += 1
+            else:
+                todo.append((transcript, minutes, annotation, model, params))
+    out(f'{len(meetings)} meetings: {aligned} pairs with a final alignment, {resumed} aligned in a previous run, '
+        f'{len(unembedded)} without embeddings, {len(todo)} to align')
+    if dry_run:
+        from .annotation import read_transcript
+        for annotation in unembedded:
+            out(f'  no embeddings: {annotation}')
+        rows = 0
+        for transcript, _, annotation, _, _ in todo:
+            n = len(read_transcript(transcript))
+            rows += n
+            out(f'  to align: {annotation} ({n} rows)')
+        out(f'{len(todo)} pairs, {rows} rows would be aligned')
+        return
+    if not todo:
+        return
+
+    pool = None
+    if workers > 1 and len(todo) > 1:
+        # the cores are split between the workers (cpu_count // workers BLAS threads
+        # each, at least one), set before the workers start and import numpy
+        threads = str(max(1, (os.cpu_count() or workers) // workers))
+        saved = {k: os.environ.get(k) for k in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')}
+        os.environ.update({k: threads for k in saved})
+        try:
+            pool = multiprocessing.get_context('spawn').Pool(min(workers, len(todo)))
+        finally:
+            for k, v in saved.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+    start = time.perf_counter()
+    stamps = {t[2]: Progress.stamp(t[0], t[1], t[0] + '.embed', t[1] + '.embed', **t[4]) for t in todo}
+    done, rows = 0, 0
+    try:
+        results = pool.imap_unordered(_align_pair, todo) if pool is not None else map(_align_pair, todo)
+        for result in results:
+            annotation = result['annotation']
+            progress.finish(annotation, stamps[annotation], rows=result['rows'], aligned=result['aligned'], seconds=round(result['seconds'], 3))
+            progress.save()
+            done += 1
+            rows += result['rows']
+            missing = f', {result["missing"]} lines without embedding' if result['missing'] else ''
+            out(f'[{done}/{len(todo)}] {annotation}: {result["aligned"]}/{result["rows"]} rows aligned in {result["seconds"]:.2f} s{missing}')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    out(f'Aligned {done} pairs ({rows} rows) in {elapsed:.1f} s: {done / elapsed:.2f} pairs/s, {rows / elapsed:.0f} rows/s')
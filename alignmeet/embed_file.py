@@ -0,0 +1,121 @@
+import json
+import os
+import pickle
+import struct
+
+import numpy as np
+
+# .embed sidecar layout:
+#   MAGIC, uint32 version, uint32 header length, JSON header, padding to ALIGNMENT,
+#   then a contiguous count x dim matrix of the header's dtype
+# the header stores the model name and a hash of every embedded line
+MAGIC = b'ALNMEMB\0'
+VERSION = 1
+ALIGNMENT = 64
+PREFIX = struct.Struct('<8sII')
+
+class EmbedFile:
+    def __init__(self, matrix, model = None, hashes = None, legacy = False):
+        self.matrix = matrix
+        self.model = model
+        self.hashes = hashes
+        self.legacy = legacy
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1] if len(self.matrix) else 0
+
+    @staticmethod
+    def tobytes(embeds, model, hashes, dtype = np.float32):
+        # content of the sidecar of embeds
+        matrix = np.asarray(np.stack(list(embeds)) if len(embeds) else np.zeros((0, 0)), dtype=dtype)
+        if len(hashes) != len(matrix):
+            raise ValueError('one hash per embedded line expected')
+        header = json.dumps({
+            'model': model,
+            'count': matrix.shape[0],
+            'dim': matrix.shape[1],
+            'dtype': matrix.dtype.name,
+            'hashes': list(hashes),
+        }).encode('utf-8')
+        offset = PREFIX.size + len(header)
+        padding = b'\0' * (-offset % ALIGNMENT)
+        return b''.join([PREFIX.pack(MAGIC, VERSION, len(header)), header, padding, matrix.tobytes()])
+
+    @staticmethod
+    def write(filename, embeds, model, hashes, dtype = np.float32):
+        data = EmbedFile.tobytes(embeds, model, hashes, dtype)
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, filename)
+
+    @staticmethod
+    def _header(prefix, name):
+        # (header, offset of the matrix) after the prefix, None for a pickled sidecar
+        if len(prefix) < PREFIX.size or prefix[:len(MAGIC)] != MAGIC:
+            return None
+        _, version, header_length = PREFIX.unpack(prefix[:PREFIX.size])
+        if version > VERSION:
+            raise ValueError(f'{name}: unsupported embedding file version {version}')
+        header = json.loads(prefix[PREFIX.size:PREFIX.size + header_length].decode('utf-8'))
+        offset = PREFIX.size + header_length
+        return header, offset + -offset % ALIGNMENT
+
+    @staticmethod
+    def _read_prefix(f):
+        # prefix and JSON header of an open sidecar, None for a pickled one
+        prefix = f.read(PREFIX.size)
+        if len(prefix) < PREFIX.size or prefix[:len(MAGIC)] != MAGIC:
+            return None
+        return prefix + f.read(PREFIX.unpack(prefix)[2])
+
+    @staticmethod
+    def read(filename):
+        with open(filename, 'rb') as f:
+            prefix = EmbedFile._read_prefix(f)
+            if prefix is None:
+                # pickled list of vectors written by older versions
+                f.seek(0)
+                return EmbedFile(pickle.load(f), legacy=True)
+        header, offset = EmbedFile._header(prefix, filename)
+        shape = (header['count'], header['dim'])
+        if shape[0] == 0 or shape[1] == 0:
+            matrix = np.zeros(shape, dtype=header['dtype'])
+        else:
+            matrix = np.memmap(filename, dtype=header['dtype'], mode='r', offset=offset, shape=shape)
+        return EmbedFile(matrix, header['model'], header['hashes'])
+
+    @staticmethod
+    def read_model(filename):
+        # model of a sidecar from its header alone, None for a pickled sidecar
+        with open(filename, 'rb') as f:
+            prefix = EmbedFile._read_prefix(f)
+        return None if prefix is None else EmbedFile._header(prefix, filename)[0]['model']
+
+    @staticmethod
+    def frombytes(data, name = 'embeddings'):
+        # as read, from the content of a sidecar (e.g. held in a meeting container)
+        parsed = EmbedFile._header(data, name)
+        if parsed is None:
+            return EmbedFile(pickle.loads(data), legacy=True)
+        header, offset = parsed
+        shape = (header['count'], header['dim'])
+        matrix = np.frombuffer(data, dtype=header['dtype'], count=shape[0] * shape[1], offset=offset).reshape(shape)
+        return EmbedFile(matrix, header['model'], header['hashes'])
+
+    def rows(self, hashes, model):
+        # row of the stored matrix holding each line's embedding, None if the line
+        # is new, was edited or was embedded with another model
+        if self.legacy:
+            # no record of the text, trust it only if the number of lines matches
+            if len(self.matrix) == len(hashes):
+                return list(range(len(hashes)))
+            return [None] * len(hashes)
+        if self.model != model:
+            return [None] * len(hashes)
+        stored = {h: i for i, h in enumerate(self.hashes)}
+        return [stored.get(h) for h in hashes]
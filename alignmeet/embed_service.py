@@ -0,0 +1,111 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+MAX_BATCH = 512 # lines encoded by one model call
+DEFAULT_MODEL = 'stsb-mpnet-base-v2'
+LEXICAL_MODEL = 'lexical-ngram-v1' # see lexical.LexicalEncoder, bump when its features change
+
+def _lexical():
+    from .lexical import LexicalEncoder
+    return LexicalEncoder()
+
+# model name -> factory of an object with encode(texts) -> vectors;
+# names not listed here are loaded as SentenceTransformer models
+BACKENDS = {LEXICAL_MODEL: _lexical}
+
+def register_backend(model, factory):
+    BACKENDS[model] = factory
+
+class EmbeddingService:
+    # one model per process, loaded once (optionally pre-warmed in the background)
+    # and shared by all embedders; requests are queued and encoded in batches
+    _services = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, model):
+        self.model_name = model
+        self._model = None
+        self._error = None
+        self._loaded = threading.Event()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    @staticmethod
+    def get(model):
+        with EmbeddingService._lock:
+            service = EmbeddingService._services.get(model)
+            if service is None:
+                service = EmbeddingService(model)
+                EmbeddingService._services[model] = service
+            return service
+
+    @property
+    def loaded(self):
+        return self._loaded.is_set()
+
+    def prewarm(self):
+        # starts loading the model without waiting for it
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f'embedding service ({self.model_name})', daemon=True)
+                self._worker.start()
+        return self
+
+    def wait(self, timeout = None):
+        self.prewarm()
+        return self._loaded.wait(timeout)
+
+    def submit(self, texts):
+        future = Future()
+        self.prewarm()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts):
+        return self.submit(texts).result()
+
+    def _load(self):
+        factory = BACKENDS.get(self.model_name)
+        if factory is not None:
+            return factory()
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(self.model_name)
+
+    def _run(self):
+        try:
+            self._model = self._load()
+        except Exception as e:
+            self._error = e
+        self._loaded.set()
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            while size < MAX_BATCH:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._encode(batch)
+
+    def _encode(self, batch):
+        batch = [(texts, future) for texts, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        if self._error is not None:
+            for _, future in batch:
+                future.set_exception(self._error)
+            return
+        try:
+            embeds = self._model.encode([t for texts, _ in batch for t in texts])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        start = 0
+        for texts, future in batch:
+            future.set_result(list(embeds[start:start + len(texts)]))
+            start += len(texts)
@@ -0,0 +1,147 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'alignmeet', 'embeddings.sqlite')
+DEFAULT_LIMIT = 1024 ** 3 # bytes of vectors kept before least recently used ones are evicted
+CHUNK = 500 # sqlite host parameters per query
+
+def normalize_text(text):
+    return ' '.join(text.split())
+
+def text_hash(text):
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+class EmbedStore:
+    # persistent cache of embeddings keyed by (model name, normalized text hash),
+    # shared by all files and meetings
+    _default = None
+
+    def __init__(self, path = DEFAULT_PATH, limit = DEFAULT_LIMIT):
+        self.path = path
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # (model, hash): time of lookups not yet written to the used column, lookups
+        # do not write (nor commit): they are written with the next put_many or flush
+        self._touched = dict()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS embeds (
+            model TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            dtype TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            used REAL NOT NULL,
+            PRIMARY KEY (model, hash))''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS embeds_used ON embeds (used)')
+        self._db.commit()
+        self._size = self._db.execute('SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeds').fetchone()[0]
+
+    @staticmethod
+    def default():
+        if EmbedStore._default is None:
+            EmbedStore._default = EmbedStore(os.environ.get('ALIGNMEET_EMBED_STORE', DEFAULT_PATH))
+            atexit.register(EmbedStore._default.close)
+        return EmbedStore._default
+
+    @property
+    def size(self):
+        return self._size
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'evicted': self.evicted,
+            'bytes': self._size,
+        }
+
+    def get_many(self, model, hashes):
+        # returns {hash: vector} for the hashes present in the store
+        hashes = list(set(hashes))
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), CHUNK):
+                chunk = hashes[i:i + CHUNK]
+                rows = self._db.execute(
+                    'SELECT hash, dtype, vector FROM embeds WHERE model = ? AND hash IN ({})'.format(','.join('?' * len(chunk))),
+                    [model] + chunk
+                ).fetchall()
+                for h, dtype, vector in rows:
+                    found[h] = np.frombuffer(vector, dtype=dtype).copy()
+            now = time.time()
+            self._touched.update(((model, h), now) for h in found)
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model, vectors):
+        # vectors: {hash: vector}
+        now = time.time()
+        rows = []
+        for h, v in vectors.items():
+            v = np.ascontiguousarray(v)
+            rows.append((model, h, v.dtype.str, v.tobytes(), now))
+        with self._lock:
+            for row in rows:
+                old = self._db.execute('SELECT LENGTH(vector) FROM embeds WHERE model = ? AND hash = ?', row[:2]).fetchone()
+                self._size += len(row[3]) - (old[0] if old else 0)
+            self._write_touched()
+            self._db.executemany('INSERT OR REPLACE INTO embeds (model, hash, dtype, vector, used) VALUES (?, ?, ?, ?, ?)', rows)
+            self._db.commit()
+            if self._size > self.limit:
+                self._evict()
+
+    def flush(self):
+        # writes when the vectors looked up since the last write were used
+        with self._lock:
+            if self._touched:
+                self._write_touched()
+                self._db.commit()
+
+    def _write_touched(self):
+        self._db.executemany('UPDATE embeds SET used = ? WHERE model = ? AND hash = ?',
+            [(used, model, h) for (model, h), used in self._touched.items()])
+        self._touched.clear()
+
+    def _evict(self):
+        # drop least recently used vectors until the store is 10% below its limit
+        target = int(self.limit * 0.9)
+        while self._size > target:
+            rows = self._db.execute('SELECT rowid, LENGTH(vector) FROM embeds ORDER BY used LIMIT ?', (CHUNK,)).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            drop = []
+            for rowid, size in rows:
+                drop.append((rowid,))
+                self._size -= size
+                if self._size <= target:
+                    break
+            self._db.executemany('DELETE FROM embeds WHERE rowid = ?', drop)
+            self.evicted += len(drop)
+        self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM embeds')
+            self._db.commit()
+            self._size = 0
+            self._touched.clear()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
@@ -1,6 +1,8 @@
 from PySide2.QtWidgets import QWidget, QVBoxLayout, QLabel, QHBoxLayout, QDoubleSpinBox
 from PySide2.QtCore import Slot
 
+from .annotation import EVALUATION_FILE
+
 class Evaluation(QWidget):
     was_playing = False
 
@@ -73,7 +75,8 @@ class Evaluation(QWidget):
         self.annotation._fluency = self.items[2].value()
         self.annotation._relevance= self.items[3].value()
 
-        self.annotation.modified = True
+        self.annotation.journal_evaluation()
+        self.annotation.mark_modified(EVALUATION_FILE)
         self.prevent = False
 
     @Slot(bool)
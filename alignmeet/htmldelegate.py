@@ -1,11 +1,53 @@
+from collections import OrderedDict
+
 from PySide2.QtCore import *
 from PySide2.QtWidgets import *
 from PySide2.QtGui import *
 
+DOCUMENT_CACHE_SIZE = 2048 # laid out documents kept by a delegate
+
+class DocumentCache:
+    # laid out QTextDocuments of cell HTML for the paint and sizeHint of rich text delegates,
+    # keyed by the HTML, the text width (None for no wrapping) and the font; the HTML
+    # changes with every edit of a line and only for the lines a new search highlights,
+    # so these get new entries while the others keep theirs; the least recently used
+    # entries are dropped beyond size
+    def __init__(self, size = DOCUMENT_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._docs = OrderedDict()
+
+    def document(self, html, width, font):
+        key = (html, width, font.key())
+        doc = self._docs.get(key)
+        if doc is not None:
+            self._docs.move_to_end(key)
+            self.hits += 1
+            return doc
+        self.misses += 1
+        doc = QTextDocument()
+        doc.setDefaultFont(font)
+        option = QTextOption(doc.defaultTextOption())
+        option.setWrapMode(QTextOption.WordWrap)
+        doc.setDefaultTextOption(option)
+        doc.setHtml(html)
+        if width is not None:
+            doc.setTextWidth(width)
+        doc.size() # laid out here, once
+        if self.size > 0:
+            self._docs[key] = doc
+            if len(self._docs) > self.size:
+                self._docs.popitem(last=False)
+        return doc
+
+    def clear(self):
+        self._docs.clear()
+
 class HTMLDelegate(QStyledItemDelegate):
     def __init__(self, parent=None):
         super().__init__()
-        self.doc = QTextDocument(self)
+        self.documents = DocumentCache()
 
     def paint(self, painter, option, index):
         painter.save()
@@ -13,7 +55,7 @@ class HTMLDelegate(QStyledItemDelegate):
         options = QStyleOptionViewItem(option)
 
         self.initStyleOption(options, index)
-        self.doc.setHtml(options.text)
+        doc = self.documents.document(options.text, None, options.font)
         options.text = ""
 
         style = QApplication.style() if options.widget is None \
@@ -42,10 +84,13 @@ class HTMLDelegate(QStyledItemDelegate):
 
         painter.translate(textRect.topLeft())
         painter.setClipRect(textRect.translated(-textRect.topLeft()))
-        self.doc.documentLayout().draw(painter, ctx)
+        doc.documentLayout().draw(painter, ctx)
 
         painter.restore()
 
     def sizeHint(self, option, index):
-        return QSize(self.doc.idealWidth(), self.doc.size().height())
+        options = QStyleOptionViewItem(option)
+        self.initStyleOption(options, index)
+        doc = self.documents.document(options.text, None, options.font)
+        return QSize(doc.idealWidth(), doc.size().height())
         
\ No newline at end of file
@@ -0,0 +1,124 @@
+import threading
+
+from PySide2.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+
+# priorities of QThreadPool.start, higher runs first
+LOW = -1
+NORMAL = 0
+HIGH = 1
+
+class Cancelled(Exception):
+    pass
+
+class CancelToken:
+    # checked by the job between steps, cancelling never interrupts a step
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+class JobSignals(QObject):
+    progress = Signal(int, int) # done, total
+    finished = Signal(object, int) # result, generation of the document it was computed for
+    failed = Signal(object)
+    ended = Signal()
+
+class Job(QRunnable):
+    # runs fn(token, progress, *args) on the pool; a result is only delivered if the
+    # job was not cancelled, tagged with the generation it was submitted with
+    def __init__(self, key, ident, fn, args, generation):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.key = key
+        self.ident = ident
+        self.fn = fn
+        self.args = args
+        self.generation = generation
+        self.token = CancelToken()
+        self.signals = JobSignals()
+
+    def cancel(self):
+        self.token.cancel()
+
+    def _progress(self, done, total):
+        self.token.check()
+        self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            self.token.check()
+            result = self.fn(self.token, self._progress, *self.args)
+            if not self.token.cancelled:
+                self.signals.finished.emit(result, self.generation)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.signals.failed.emit(e)
+        finally:
+            self.signals.ended.emit()
+
+class JobScheduler(QObject):
+    # background jobs of the open document (embedding, alignment, search, ...)
+    # identified by key: only one job per key is alive, submitting a different job
+    # under the same key cancels the previous one, an identical one (same ident)
+    # is not started again
+    progress = Signal(str, int, int) # key, done, total
+
+    def __init__(self, parent = None, threads = None):
+        super(JobScheduler, self).__init__(parent)
+        self.pool = QThreadPool(self)
+        if threads:
+            self.pool.setMaxThreadCount(threads)
+        self._jobs = dict()
+        self._alive = set() # keeps cancelled jobs referenced until they return
+
+    def submit(self, key, fn, *args, ident = None, priority = NORMAL, generation = 0, finished = None, failed = None):
+        # finished(result, generation) and failed(exception) are called in the thread of
+        # the scheduler, connected before the job starts so that none is missed
+        job = self._jobs.get(key)
+        if job is not None and not job.token.cancelled:
+            if ident is not None and job.ident == ident:
+                return job
+            job.cancel()
+        job = Job(key, ident, fn, args, generation)
+        if finished is not None:
+            job.signals.finished.connect(finished)
+        if failed is not None:
+            job.signals.failed.connect(failed)
+        job.signals.progress.connect(lambda done, total, key=key: self.progress.emit(key, done, total))
+        job.signals.ended.connect(lambda job=job: self._ended(job))
+        self._jobs[key] = job
+        self._alive.add(job)
+        self.pool.start(job, priority)
+        return job
+
+    def running(self, key):
+        job = self._jobs.get(key)
+        return job is not None and not job.token.cancelled
+
+    def cancel(self, key):
+        job = self._jobs.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self):
+        for key in list(self._jobs):
+            self.cancel(key)
+
+    def wait(self, msecs = -1):
+        return self.pool.waitForDone(msecs)
+
+    @Slot()
+    def _ended(self, job):
+        self._alive.discard(job)
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
@@ -0,0 +1,117 @@
+import json
+import os
+
+from PySide2.QtCore import QObject, QTimer
+
+SYNC_DELAY = 1000 # ms after an edit before the journal is fsynced
+SYNC_RECORDS = 64 # records after which it is fsynced without waiting
+
+# a record is a JSON array on its own line, rows are indices at the time of the edit;
+# the first line is a header with the sizes and mtimes of the saved files the records
+# apply to, a journal of other versions of them (saved after the journal) is dropped:
+#   ['h', stamp]
+#   ['d', row, text, speaker, minute, final, problem]   DA changed (minute is an index or None)
+#   ['d+', row, text, speaker, minute, final, problem]  DA inserted
+#   ['d-', row, count]                                  DAs removed
+#   ['m', row, text, adequacy, grammaticality, fluency, relevance]  minute changed
+#   ['m+', row, text, adequacy, grammaticality, fluency, relevance] minute inserted
+#   ['m-', row, count]                                  minutes removed
+#   ['e', adequacy, grammaticality, fluency, relevance] evaluation of the whole minutes
+
+def file_stat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+class Journal(QObject):
+    # append-only log of the edits of an opened meeting made since it was last saved;
+    # every record is flushed to the OS at once, fsyncs are batched
+    def __init__(self, filename, files, stat = None, parent = None):
+        super(Journal, self).__init__(parent)
+        self.filename = filename
+        self.files = files # the saved files
+        self.stat = stat or file_stat # [size, mtime] of a saved file, None if missing
+        self.count = 0 # records in the file, the header aside
+        self._file = None
+        self._unsynced = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(SYNC_DELAY)
+        self._timer.timeout.connect(self.sync)
+
+    def stamp(self):
+        return [self.stat(f) for f in self.files]
+
+    def _header(self):
+        return json.dumps(['h', self.stamp()], separators=(',', ':')) + '\n'
+
+    def read(self):
+        # records in the file; a record cut short by a crash ends the journal
+        records = []
+        if not os.path.exists(self.filename):
+            return records
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        if not records or records[0][0] != 'h' or records[0][1] != self.stamp():
+            self.discard()
+            return []
+        self.count = len(records) - 1
+        return records[1:]
+
+    def append(self, record):
+        if self._file is None:
+            exists = os.path.exists(self.filename)
+            self._file = open(self.filename, 'a', encoding='utf-8')
+            if not exists:
+                self._file.write(self._header())
+                self.count = 0
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._file.flush()
+        self.count += 1
+        self._unsynced += 1
+        if self._unsynced >= SYNC_RECORDS:
+            self.sync()
+        elif not self._timer.isActive():
+            self._timer.start()
+
+    def sync(self):
+        self._timer.stop()
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def compact(self, saved):
+        # drops the first saved records, which are in the saved files now, and stamps
+        # the rest with the files just saved
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if saved >= self.count:
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            self.count = 0
+            return
+        from .annotation import write_atomic
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            lines = f.readlines()[1 + saved:1 + self.count]
+        write_atomic(self.filename, self._header() + ''.join(lines))
+        self.count = len(lines)
+
+    def close(self):
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.count = 0
@@ -0,0 +1,51 @@
+import numpy as np
+
+from .embed_store import normalize_text
+
+DIM = 1024 # hashed feature buckets
+NGRAMS = (3, 4, 5)
+CHUNK = 4096 # lines vectorized at once, bounds the dense count matrix
+_PRIME = np.uint64(1099511628211)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+class LexicalEncoder:
+    # dependency-free stand-in for a SentenceTransformer: every line becomes a
+    # vector of sublinear counts of its hashed character n-grams (word boundaries
+    # included), so lines sharing words and word stems end up close in cosine distance;
+    # the vector of a line depends on its text only, so it can be stored like any other
+    def __init__(self, dim = DIM, ngrams = NGRAMS):
+        self.dim = dim
+        self.ngrams = tuple(ngrams)
+
+    def encode(self, texts):
+        texts = list(texts)
+        embeds = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), CHUNK):
+            embeds[start:start + CHUNK] = self._encode_chunk(texts[start:start + CHUNK])
+        return embeds
+
+    def _encode_chunk(self, texts):
+        # all lines are concatenated into one byte buffer and the n-grams of the whole
+        # buffer are hashed at once; n-grams spanning two lines are dropped
+        docs = [(' ' + normalize_text(t).lower() + ' ').encode('utf-8') for t in texts]
+        lengths = np.fromiter((len(d) for d in docs), dtype=np.int64, count=len(docs))
+        buf = np.frombuffer(b''.join(docs), dtype=np.uint8).astype(np.uint64)
+        owner = np.repeat(np.arange(len(docs)), lengths)
+        counts = np.zeros(len(docs) * self.dim, dtype=np.float32)
+        for n in self.ngrams:
+            grams = len(buf) - n + 1
+            if grams <= 0:
+                continue
+            h = np.zeros(grams, dtype=np.uint64)
+            for k in range(n):
+                h = h * _PRIME + buf[k:k + grams]
+            h = (h ^ (h >> np.uint64(31))) * _MIX
+            bucket = (h >> np.uint64(32)) % np.uint64(self.dim)
+            inside = owner[:grams] == owner[n - 1:]
+            index = owner[:grams][inside] * self.dim + bucket[inside].astype(np.int64)
+            counts += np.bincount(index, minlength=len(counts)).astype(np.float32)
+        embeds = np.log1p(counts.reshape(len(docs), self.dim))
+        norms = np.linalg.norm(embeds, axis=1)
+        nonzero = norms > 0
+        embeds[nonzero] /= norms[nonzero, None]
+        return embeds
@@ -7,9 +7,10 @@ from PySide2 import QtWidgets
 from PySide2.QtGui import QIcon, QKeyEvent
 
 from .minutes_model import MinutesModel
-from ..annotation import Annotation, Minute
+from ..annotation import Annotation, Minute, MINUTES_FILE, TEXT_ROLES
 from ..transcripts.transcript import Transcript
 from .minutes_editor import MinutesEditor
+from .suggestions import Suggestions
 from ..transcripts.dialog_act_editor import DialogActEditor
 from ..combobox import ComboBox
 
@@ -115,6 +116,9 @@ class Minutes(QWidget):
 
         layout.addWidget(minutes_view)
 
+        self.suggestions = Suggestions(self.annotation, self)
+        layout.addWidget(self.suggestions)
+
         right = QAction('Indent right', minutes_view)
         right.setShortcuts(['alt+R', 'alt+Del'])
         right.triggered.connect(self._right_triggered)
@@ -147,8 +151,9 @@ class Minutes(QWidget):
         for idx in r:
             m = self.annotation.get_minute(idx)
             m.text = f'{self.indent}{m.text}'
-        self.annotation.modified = True
-        self.model.update()
+        self.annotation.mark_changed([self.annotation.get_minute(idx) for idx in r], TEXT_ROLES)
+        self.annotation.journal_lines([self.annotation.get_minute(idx) for idx in r])
+        self.annotation.mark_modified(MINUTES_FILE)
 
     @Slot()
     def _left_triggered(self):
@@ -156,8 +161,9 @@ class Minutes(QWidget):
         for idx in r:
             m = self.annotation.get_minute(idx)
             m.text = m.text.replace(self.indent, '', 1)
-        self.annotation.modified = True
-        self.model.update()
+        self.annotation.mark_changed([self.annotation.get_minute(idx) for idx in r], TEXT_ROLES)
+        self.annotation.journal_lines([self.annotation.get_minute(idx) for idx in r])
+        self.annotation.mark_modified(MINUTES_FILE)
 
     @Slot()
     def _insert_triggered(self):
@@ -287,6 +293,7 @@ class InsertCommand(QUndoCommand):
 
     def redo(self):
         self.minutes.model.insertRow(self.row_index, self.new_minute)
+        self.minutes.annotation.mark_dirty([self.new_minute])
 
     def undo(self):
         self.minutes.model.removeRows(self.row_index, 1)
@@ -316,12 +323,15 @@ class JoinUpCommand(QUndoCommand):
         self.first_old_line = copy(self.minutes.annotation.get_minute(self.to))
         self.second_old_line = copy(self.minutes.annotation.get_minute(self.what))
         self.minutes.annotation.get_minute(self.to).text = f"{self.first_old_line.text} {self.second_old_line.text}"
-        self.minutes.annotation.remove_minutes(self.what, 1)
+        self.minutes.model.removeRows(self.what, 1)
+        self.minutes.annotation.mark_dirty([self.minutes.annotation.get_minute(self.to)])
 
     def undo(self):
-        self.minutes.annotation.remove_minutes(self.to, 1)
-        self.minutes.annotation.insert_minute(self.to, self.first_old_line)
-        self.minutes.annotation.insert_minute(self.what, self.second_old_line)
+        self.minutes.model.removeRows(self.to, 1)
+        self.minutes.model.insertRow(self.to, self.first_old_line)
+        self.minutes.model.insertRow(self.what, self.second_old_line)
+        # the copies keep their embeddings unless those were still pending
+        self.minutes.annotation.mark_dirty([l for l in (self.first_old_line, self.second_old_line) if l.embed is None])
 
 class JoinDownCommand(QUndoCommand):
     def __init__(self, minutes, what, to, text):
@@ -333,10 +343,13 @@ class JoinDownCommand(QUndoCommand):
     def redo(self):
         self.first_old_line = copy(self.minutes.annotation.get_minute(self.what))
         self.second_old_line = copy(self.minutes.annotation.get_minute(self.to))
-        self.minutes.annotation.get_minute(self.to).text = f"{self.first_old_line.text} {self.second_old_line.text}"
-        self.minutes.annotation.remove_minutes(self.what, 1)
+        line_to_ref = self.minutes.annotation.get_minute(self.to)
+        line_to_ref.text = f"{self.first_old_line.text} {self.second_old_line.text}"
+        self.minutes.model.removeRows(self.what, 1)
+        self.minutes.annotation.mark_dirty([line_to_ref])
 
     def undo(self):
-        self.minutes.annotation.remove_minutes(self.what, 1)
-        self.minutes.annotation.insert_minute(self.what, self.first_old_line)
-        self.minutes.annotation.insert_minute(self.to, self.second_old_line)
\ No newline at end of file
+        self.minutes.model.removeRows(self.what, 1)
+        self.minutes.model.insertRow(self.what, self.first_old_line)
+        self.minutes.model.insertRow(self.to, self.second_old_line)
+        self.minutes.annotation.mark_dirty([l for l in (self.first_old_line, self.second_old_line) if l.embed is None])
\ No newline at end of file
@@ -4,11 +4,6 @@ class MinutesEditor(QtWidgets.QStyledItemDelegate):
     def __init__(self, owner):
         super().__init__(owner)
 
-    def paint(self, painter, option, index):
-        if isinstance(self.parent(), QtWidgets.QAbstractItemView):
-            self.parent().openPersistentEditor(index)
-        super(MinutesEditor, self).paint(painter, option, index)
-
     def createEditor(self, parent, option, index):
         editor = QtWidgets.QPlainTextEdit(parent)
         self.editor = editor
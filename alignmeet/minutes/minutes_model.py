@@ -1,14 +1,15 @@
 from PySide2 import QtCore
 from PySide2.QtCore import Qt, QModelIndex, Slot
 
+from ..annotation import MINUTES_FILE, EVALUATION_FILE, TEXT_ROLES, changed_ranges
+
 class MinutesModel(QtCore.QAbstractTableModel): 
 
     def __init__(self, annotation, parent=None, *args): 
         super(MinutesModel, self).__init__()
         self.annotation = annotation
-        self.annotation.modified_changed.connect(self.update)
+        self.annotation.lines_changed.connect(self._lines_changed)
         self.setHeaderData(0, QtCore.Qt.Horizontal, "Minutes")
-        self.annotation.visible_minutes_changed.connect(self.update)
         self._evaluation_mode = False
 
     def set_evaluation_mode(self, evaluation):
@@ -20,9 +21,23 @@ class MinutesModel(QtCore.QAbstractTableModel):
         self.layoutAboutToBeChanged.emit()
         self.layoutChanged.emit()
 
+    @Slot(object, object)
+    def _lines_changed(self, das, minutes):
+        # only the rows changed are repainted, all of them when the minutes were replaced
+        if minutes is None:
+            self.update()
+            return
+        lines = list(minutes)
+        rows = {row: minutes[line] for row, line in zip(self.annotation.minute_rows(lines), lines) if row is not None}
+        for first, last, roles in changed_ranges(rows):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, self.columnCount() - 1), roles)
+
     def rowCount(self, parent=QtCore.QModelIndex()):
         return self.annotation.minutes_count() 
 
+    def line(self, i):
+        return self.annotation.get_minute(i)
+
     def columnCount(self, parent=QtCore.QModelIndex()):
         return 5 if self._evaluation_mode else 1
 
@@ -70,7 +85,10 @@ class MinutesModel(QtCore.QAbstractTableModel):
                         val = m.relevance
                         m.relevance = data
                 if val != data:
-                    self.annotation.modified = True
+                    self.annotation.mark_changed([m], TEXT_ROLES)
+                    if j > 0:
+                        self.annotation.journal_lines([m]) # text edits are journaled by mark_dirty
+                    self.annotation.mark_modified(MINUTES_FILE if j == 0 else EVALUATION_FILE)
                 return True
         return False
         
@@ -96,7 +114,7 @@ class MinutesModel(QtCore.QAbstractTableModel):
         if role == Qt.DisplayRole or role == Qt.EditRole:
             if j == 0:
                 return m.text
-            if any([d.minute == m for d in self.annotation._das]):
+            if self.annotation.is_minute_aligned(m):
                 if j == 1:
                     return m.adequacy
                 if j == 2:
@@ -0,0 +1,53 @@
+from PySide2.QtWidgets import QWidget, QVBoxLayout, QLabel, QListWidget, QListWidgetItem, QAction, QSizePolicy
+from PySide2.QtCore import Slot
+
+from ..annotation import Annotation
+
+SUGGESTIONS = 5
+
+class Suggestions(QWidget):
+    # minutes closest to the selected transcript rows, Alt+1 to Alt+5 aligns the selection to one of them
+    def __init__(self, annotation : Annotation, *args, **kwargs):
+        super(Suggestions, self).__init__(*args, **kwargs)
+        self.annotation = annotation
+        self.annotation.selection_changed.connect(self.refresh)
+        self.annotation.modified_changed.connect(self.refresh)
+        self.suggested = []
+        self._gui_setup()
+
+    def _gui_setup(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        label = QLabel('Suggested minutes:', self)
+        label.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Fixed)
+        layout.addWidget(label)
+
+        suggestions = QListWidget(self)
+        suggestions.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        suggestions.setFixedHeight(suggestions.fontMetrics().height() * (SUGGESTIONS + 1) + 2 * suggestions.frameWidth())
+        suggestions.itemActivated.connect(lambda item: self.accept(suggestions.row(item)))
+        layout.addWidget(suggestions)
+        self.list = suggestions
+
+        for i in range(SUGGESTIONS):
+            a = QAction(f'Accept suggestion {i + 1}', self)
+            a.setShortcut(f'Alt+{i + 1}')
+            a.triggered.connect(lambda checked=False, i=i: self.accept(i))
+            self.addAction(a)
+
+        self.setLayout(layout)
+
+    @Slot()
+    def refresh(self):
+        self.suggested = self.annotation.suggest_minutes(SUGGESTIONS)
+        self.list.clear()
+        for i, (minute, score) in enumerate(self.suggested):
+            item = QListWidgetItem(f'Alt+{i + 1}   {score:.2f}   {minute.text.strip()}')
+            item.setBackground(self.annotation.get_minute_color(minute))
+            item.setForeground(self.annotation.get_minute_text_color(minute))
+            self.list.addItem(item)
+
+    def accept(self, i):
+        if i < len(self.suggested):
+            self.annotation.set_minute(self.suggested[i][0])
@@ -0,0 +1,71 @@
+import builtins
+import sys
+import time
+from importlib.util import resolve_name
+
+class StartupProfile:
+    # measures import time per module (self time, children excluded) and the
+    # phases between process start and the first painted window
+    def __init__(self, start = None):
+        self.start = start if start is not None else time.perf_counter()
+        self.modules = dict()
+        self.phases = []
+        self._last = self.start
+        self._stack = []
+        self._import = None
+
+    def install(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+        return self
+
+    def uninstall(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = name
+        if level > 0:
+            try:
+                module = resolve_name('.' * level + name, (globals or {}).get('__package__'))
+            except (ImportError, ValueError):
+                pass
+        if module in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.modules[module] = self.modules.get(module, 0.0) + elapsed - children
+
+    def phase(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def packages(self):
+        # import time summed per top-level package (alignmeet modules are kept separate)
+        totals = dict()
+        for name, t in self.modules.items():
+            key = name if name.startswith('alignmeet') else name.split('.')[0]
+            totals[key] = totals.get(key, 0.0) + t
+        return sorted(totals.items(), key=lambda x: -x[1])
+
+    def report(self, top = 25, file = sys.stderr):
+        total = self._last - self.start
+        print(f'Time to first window: {total * 1000:.1f} ms', file=file)
+        print('\nPhases:', file=file)
+        for name, t in self.phases:
+            print(f'  {t * 1000:9.1f} ms  {name}', file=file)
+        print(f'\nImports by package (top {top}):', file=file)
+        for name, t in self.packages()[:top]:
+            print(f'  {t * 1000:9.1f} ms  {name}', file=file)
+        heavy = [m for m in ('torch', 'sentence_transformers', 'scipy', 'numpy') if m in sys.modules]
+        if heavy:
+            print('\nLoaded before the first window: ' + ', '.join(heavy), file=file)
@@ -4,7 +4,11 @@ from typing import KeysView
 from PySide2 import QtCore, QtGui, QtWidgets
 from PySide2.QtCore import Signal
 
+from ..htmldelegate import DocumentCache
+
 class DialogActEditor(QtWidgets.QStyledItemDelegate):
+    # rows are painted by the delegate; an editor only exists for the cell being edited,
+    # the view creates it on an edit trigger and destroys it once editing ends
     end_editing = Signal()
     remove_row = Signal()
 
@@ -14,11 +18,7 @@ class DialogActEditor(QtWidgets.QStyledItemDelegate):
         self.textToSplit = None
         self.last_val = None
         self.owner = owner
-
-    def paint(self, painter, option, index):
-        if isinstance(self.parent(), QtWidgets.QAbstractItemView):
-            self.parent().openPersistentEditor(index)
-        super(DialogActEditor, self).paint(painter, option, index)
+        self.documents = DocumentCache()
 
     def createEditor(self, parent, option, index):
         editor = QtWidgets.QTextEdit(parent)
@@ -79,12 +79,7 @@ class DialogActEditor(QtWidgets.QStyledItemDelegate):
         else:
             style = QtWidgets.QApplication.style()
 
-        doc = QtGui.QTextDocument()
-        option = QtGui.QTextOption(doc.defaultTextOption())
-        option.setWrapMode(QtGui.QTextOption.WordWrap)
-        doc.setDefaultTextOption(option)
-        doc.setHtml(options.text)
-        doc.setTextWidth(options.rect.width())
+        doc = self.documents.document(options.text, options.rect.width(), options.font)
         options.text = ''
 
         style.drawControl(QtWidgets.QStyle.CE_ItemViewItem, options, painter)
@@ -105,9 +100,7 @@ class DialogActEditor(QtWidgets.QStyledItemDelegate):
         options = QtWidgets.QStyleOptionViewItem(option)
         self.initStyleOption(options, index)
 
-        doc = QtGui.QTextDocument()
-        doc.setHtml(options.text)
-        doc.setTextWidth(options.rect.width())
+        doc = self.documents.document(options.text, options.rect.width(), options.font)
 
         return QtCore.QSize(doc.idealWidth(), doc.size().height())
 
@@ -122,12 +115,16 @@ class EditTextCommand(QtWidgets.QUndoCommand):
     def redo(self):
         self.old_data = self.model.data(self.index)
         self.model.setData(self.index, self.value[:self.textToSplit], QtCore.Qt.EditRole)
+        edited = [self.model.line(self.index.row())]
         if self.textToSplit is not None:
-            row = copy(self.model.annotation.get_dialog_act(self.index.row()))
+            row = copy(edited[0])
             row.text = self.value[self.textToSplit:]
             self.model.insertRow(self.index.row() + 1, row)
+            edited.append(row)
+        self.model.annotation.mark_dirty(edited)
 
     def undo(self):
         self.model.setData(self.index, self.old_data, QtCore.Qt.EditRole)
         if self.textToSplit is not None:
-            self.model.removeRows(self.index.row()+1, 1)
\ No newline at end of file
+            self.model.removeRows(self.index.row()+1, 1)
+        self.model.annotation.mark_dirty([self.model.line(self.index.row())])
\ No newline at end of file
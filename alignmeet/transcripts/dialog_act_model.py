@@ -4,13 +4,14 @@ from PySide2 import QtCore
 from PySide2.QtCore import Qt, QModelIndex, Slot, QAbstractTableModel
 
 from ..problems import PROBLEMS
-from ..annotation import Annotation
+from ..annotation import Annotation, TRANSCRIPT_FILE, COLOR_ROLES, TEXT_ROLES, changed_ranges
 
 class DAModel(QtCore.QAbstractTableModel): 
     def __init__(self, annotation : Annotation, parent=None, *args): 
         super(DAModel, self).__init__()
         self.annotation = annotation
-        self.annotation.modified_changed.connect(self.update)
+        self.annotation.lines_changed.connect(self._lines_changed)
+        self.annotation.preview_changed.connect(self._preview_changed)
         self.setHeaderData(0, Qt.Horizontal, "Speaker")
         self.setHeaderData(1, Qt.Horizontal, "Transcript")
         self.setHeaderData(2, Qt.Horizontal, "Remark")
@@ -21,9 +22,34 @@ class DAModel(QtCore.QAbstractTableModel):
         self.layoutAboutToBeChanged.emit()
         self.layoutChanged.emit()
 
+    @Slot(object, object)
+    def _lines_changed(self, das, minutes):
+        # only the rows changed are repainted, all of them when the DAs were replaced
+        if das is None:
+            self.update()
+            return
+        lines = list(das)
+        rows = {row: das[line] for row, line in zip(self.annotation.da_rows(lines), lines) if row is not None}
+        for first, last, roles in changed_ranges(rows):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, self.columnCount() - 1), roles)
+
+    @Slot()
+    def _preview_changed(self):
+        if self.rowCount() > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, self.columnCount() - 1), [int(r) for r in COLOR_ROLES])
+
+    def set_highlight(self, highlight, rows):
+        # highlight: regular expression of the search (or None), rows: the rows where
+        # it matches now or matched before
+        self.highlight = highlight
+        self.annotation.mark_changed([self.annotation.get_dialog_act(i) for i in rows], (Qt.DisplayRole,))
+
     def rowCount(self, parent=QtCore.QModelIndex()):
         return self.annotation.das_count()
 
+    def line(self, i):
+        return self.annotation.get_dialog_act(i)
+
     def columnCount(self, parent=QtCore.QModelIndex()):
         return 3
 
@@ -64,7 +90,10 @@ class DAModel(QtCore.QAbstractTableModel):
                     val = d.text
                     d.text = data
                 if val != data:
-                    self.annotation.modified = True
+                    self.annotation.mark_changed([d], TEXT_ROLES)
+                    if j == 0:
+                        self.annotation.journal_lines([d]) # text edits are journaled by mark_dirty
+                    self.annotation.mark_modified(TRANSCRIPT_FILE)
                 return True
         return False
         
@@ -107,14 +136,18 @@ class DAModel(QtCore.QAbstractTableModel):
                 else:
                     return PROBLEMS[d.problem]
         elif role == Qt.BackgroundRole or role == Qt.ForegroundRole:
-            if d.minute is None:
+            minute, final = d.minute, d.is_final
+            if self.annotation.preview is not None and (minute is None or not final):
+                # threshold preview: rows autoalign would change, shown as tentative
+                minute, final = self.annotation.preview_minute(i), False
+            if minute is None:
                 return None
             else:
                 if role == Qt.ForegroundRole:
-                    return self.annotation.get_minute_text_color(d.minute)
+                    return self.annotation.get_minute_text_color(minute)
                 else:
-                    if d.is_final or j == 0:
-                        return self.annotation.get_minute_color(d.minute)
+                    if final or j == 0:
+                        return self.annotation.get_minute_color(minute)
                     else:
                         return None
 
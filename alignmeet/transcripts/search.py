@@ -0,0 +1,120 @@
+import re
+
+from PySide2.QtCore import QObject, QTimer, Signal, Slot
+
+SEARCH_JOB = 'Searching'
+SEARCH_DELAY = 200 # ms after the last keystroke before the search starts
+SEARCH_CHUNK = 4096 # DAs scanned between two reports of the matches
+_SPECIAL = set('.^$*+?{}[]\\|()') # a query without these matches literally
+
+def search_job(token, progress, ex, texts, speakers, rows, found):
+    # background job (see jobs.JobScheduler): the rows (indices into texts and speakers)
+    # whose text or speaker ex matches, reported by found(scanned, matched) in chunks
+    search = ex.search
+    total = len(rows)
+    for start in range(0, total, SEARCH_CHUNK):
+        token.check()
+        scanned = rows[start:start + SEARCH_CHUNK]
+        found(scanned, [i for i in scanned if search(texts[i]) is not None or search(speakers[i]) is not None])
+        progress(start + len(scanned), total)
+    return total
+
+def _narrows(old, new):
+    # every line new matches is matched by old too
+    return new == old or (old in new and not _SPECIAL & set(old + new))
+
+class Search(QObject):
+    # the transcript search: typing is debounced, the DAs are scanned by a background job
+    # in chunks, a query extending the previous one only scans what that one matched
+    started = Signal(object, bool) # compiled query (None if empty or invalid), valid
+    found = Signal(object, object) # rows scanned, those of them matching
+    finished = Signal()
+    _found = Signal(int, object, object) # from the job: generation, rows scanned, matching
+
+    def __init__(self, annotation, parent = None):
+        super(Search, self).__init__(parent)
+        self.annotation = annotation
+        self.annotation.modified_changed.connect(self.reset)
+        self._found.connect(self._chunk_found)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(SEARCH_DELAY)
+        self._timer.timeout.connect(self.run)
+        self._text = ''
+        self._flags = 0
+        self._generation = 0
+        self._running = False # a search job of the current query has not finished yet
+        self._lines = None # texts and speakers of the DAs, taken again after edits
+        self._query = None # (text, flags) of the last search, None if it cannot be narrowed
+        self._rows = range(0) # rows it scans, in order
+        self._done = 0 # of them scanned
+        self._matched = [] # rows matching among those scanned
+
+    def search(self, text, flags, delay = True):
+        self._text, self._flags = text, flags
+        if delay:
+            self._timer.start()
+        else:
+            self.run()
+
+    def pending(self):
+        return self._timer.isActive()
+
+    def running(self):
+        return self._running
+
+    @Slot()
+    def reset(self):
+        # the DAs changed (or the rows shown), the next search scans all of them
+        self._lines = None
+        self._query = None
+
+    @Slot()
+    def run(self):
+        self._timer.stop()
+        self._generation += 1
+        self._running = False
+        self.annotation.jobs.cancel(SEARCH_JOB)
+        text, flags = self._text, self._flags
+        try:
+            ex = re.compile(text, flags)
+        except re.error:
+            ex = None
+        if not text or ex is None:
+            # everything matches
+            self._query = None
+            rows = range(self.annotation.das_count())
+            self.started.emit(None, ex is not None)
+            self.found.emit(rows, rows)
+            self.finished.emit()
+            return
+        if self._query is not None and self._query[1] == flags and _narrows(self._query[0], text):
+            # matched + rows not scanned yet stay in order
+            rows = self._matched + list(self._rows[self._done:])
+        else:
+            rows = range(self.annotation.das_count())
+        if self._lines is None:
+            das = [self.annotation.get_dialog_act(i) for i in range(self.annotation.das_count())]
+            self._lines = [d.text for d in das], [d.speaker for d in das]
+        self._query = text, flags
+        self._rows, self._done, self._matched = rows, 0, []
+        self.started.emit(ex, True)
+        generation = self._generation
+        self._running = True
+        self.annotation.jobs.submit(SEARCH_JOB, search_job, ex, *self._lines, rows,
+            lambda scanned, matched: self._found.emit(generation, scanned, matched),
+            generation=generation, finished=self._finished, failed=lambda e: self._finished(None, generation))
+
+    @Slot(int, object, object)
+    def _chunk_found(self, generation, scanned, matched):
+        if generation != self._generation:
+            return
+        self._done += len(scanned)
+        self._matched.extend(matched)
+        self.found.emit(scanned, matched)
+
+    def _finished(self, total, generation):
+        # (a failed search ends with the matches found until then)
+        if generation == self._generation:
+            self._running = False
+            self.finished.emit()
@@ -1,16 +1,13 @@
 from PySide2 import QtCore, QtGui, QtWidgets
 
 from ..annotation import DialogAct
+from ..htmldelegate import DocumentCache
 
 class SpeakerEditor(QtWidgets.QStyledItemDelegate):
 
     def __init__(self, owner):
         super().__init__(owner)
-
-    def paint(self, painter, option, index):
-        if isinstance(self.parent(), QtWidgets.QAbstractItemView):
-            self.parent().openPersistentEditor(index)
-        super(SpeakerEditor, self).paint(painter, option, index)
+        self.documents = DocumentCache()
 
     def createEditor(self, parent, option, index):
         editor = QtWidgets.QComboBox(parent)
@@ -50,8 +47,7 @@ class SpeakerEditor(QtWidgets.QStyledItemDelegate):
         else:
             style = QtWidgets.QApplication.style()
 
-        doc = QtGui.QTextDocument()
-        doc.setHtml(options.text)
+        doc = self.documents.document(options.text, options.rect.width(), options.font)
         options.text = ''
 
         style.drawControl(QtWidgets.QStyle.CE_ItemViewItem, options, painter)
@@ -72,8 +68,6 @@ class SpeakerEditor(QtWidgets.QStyledItemDelegate):
         options = QtWidgets.QStyleOptionViewItem(option)
         self.initStyleOption(options, index)
 
-        doc = QtGui.QTextDocument()
-        doc.setHtml(options.text)
-        doc.setTextWidth(options.rect.width())
+        doc = self.documents.document(options.text, options.rect.width(), options.font)
 
         return QtCore.QSize(doc.idealWidth(), doc.size().height())
\ No newline at end of file
@@ -1,13 +1,27 @@
-from PySide2.QtWidgets import QTableView
-from PySide2.QtCore import Signal
+import time
+import weakref
+
+from PySide2.QtWidgets import QAbstractItemView, QTableView
+from PySide2.QtCore import Signal, Qt, QTimer
+
+HEIGHT_BUDGET = 0.008 # s of row height computation per idle batch, to keep frames under 16 ms
 
 class Transcript(QTableView):
     visible_rows_changed = Signal(tuple)
 
     def __init__(self, parent=None):
         super().__init__(parent=parent)
-        _visible_rows = -1, -1
+        self._visible_rows = -1, -1
         self.setWordWrap(True)
+        # line -> (cells, widths, font, height) of the height computed for its row; rows
+        # whose cells or column widths changed are measured again, in idle-time batches
+        self._heights = weakref.WeakKeyDictionary()
+        self._pending = []
+        self._height_timer = QTimer(self)
+        self._height_timer.setSingleShot(True)
+        self._height_timer.setInterval(0)
+        self._height_timer.timeout.connect(self._resize_pending)
+        self.cache_heights = True # False resizes every visible row on every change (for comparison)
 
     @property
     def visible_rows(self):
@@ -16,8 +30,11 @@ class Transcript(QTableView):
     @visible_rows.setter
     def visible_rows(self, value):
         self._visible_rows = value
-        for r in range(*value):
-            self.resizeRowToContents(r)
+        if self.cache_heights:
+            self._resize_visible(value)
+        else:
+            for r in range(*value):
+                self.resizeRowToContents(r)
         self.visible_rows_changed.emit(value)
 
     def get_visible_rows(self):
@@ -27,14 +44,76 @@ class Transcript(QTableView):
             e = self.model().rowCount()
         return s, e
 
-    def dataChanged(self, QModelIndex, QModelIndex_, roles=[]):
-        self.visible_rows = self.get_visible_rows()
-        return super().dataChanged(self, QModelIndex, QModelIndex_, roles=roles)
+    def _height_key(self, row):
+        model = self.model()
+        cells = tuple(model.data(model.index(row, c), Qt.DisplayRole) for c in range(model.columnCount()) if not self.isColumnHidden(c))
+        widths = tuple(self.columnWidth(c) for c in range(model.columnCount()) if not self.isColumnHidden(c))
+        return cells, widths, self.font().key()
+
+    def _resize_visible(self, rows):
+        # cached heights are applied at once, the rows to measure are left for idle time
+        s, e = rows
+        if s < 0 or self.model() is None:
+            return
+        pending = []
+        for row in range(s, min(e + 1, self.model().rowCount())):
+            cached = self._heights.get(self.model().line(row))
+            if cached is not None and cached[:3] == self._height_key(row):
+                if self.rowHeight(row) != cached[3]:
+                    self.setRowHeight(row, cached[3])
+            else:
+                pending.append(row)
+        self._pending = pending
+        if pending:
+            self._height_timer.start()
+
+    def _resize_pending(self):
+        model = self.model()
+        start = time.perf_counter()
+        header = self.verticalHeader()
+        while self._pending and time.perf_counter() - start < HEIGHT_BUDGET:
+            row = self._pending.pop(0)
+            if row >= model.rowCount():
+                continue
+            key = self._height_key(row)
+            # as resizeRowToContents
+            height = max(self.sizeHintForRow(row), header.sectionSizeHint(row) if header.isVisible() else 0)
+            self._heights[model.line(row)] = key + (height,)
+            self.setRowHeight(row, height)
+        if self._pending:
+            self._height_timer.start()
+        else:
+            # rows moved into view by the new heights
+            self._resize_visible(self.get_visible_rows())
+
+    def dataChanged(self, topLeft, bottomRight, roles=[]):
+        # QAbstractItemView repaints the whole viewport for a range of cells but only the
+        # cell for a single one: the range is passed on cell by cell for the visible rows,
+        # rows out of view are painted once scrolled to; changes of the colors alone only
+        # repaint, an open editor keeps what is typed in it
+        s, e = self.get_visible_rows()
+        first, last = max(topLeft.row(), s), min(bottomRight.row(), e, self.model().rowCount() - 1)
+        rows = range(first, last + 1) if s >= 0 else range(0)
+        if rows:
+            self.visible_rows = s, e
+        model = self.model()
+        repaint = roles and Qt.EditRole not in roles
+        for row in rows:
+            for column in range(topLeft.column(), bottomRight.column() + 1):
+                index = model.index(row, column)
+                if repaint:
+                    self.update(index)
+                else:
+                    super().dataChanged(index, index, roles)
+        current = self.currentIndex()
+        if (not repaint and self.state() == QAbstractItemView.EditingState and current.row() not in rows
+                and topLeft.row() <= current.row() <= bottomRight.row() and topLeft.column() <= current.column() <= bottomRight.column()):
+            super().dataChanged(current, current, roles) # its editor, scrolled out of view
 
     def resizeEvent(self, event):
         self.visible_rows = self.get_visible_rows()
         return super().resizeEvent(event)
-    
+
     def verticalScrollbarValueChanged(self, i):
         self.visible_rows = self.get_visible_rows()
-        return super().verticalScrollbarValueChanged(i)
\ No newline at end of file
+        return super().verticalScrollbarValueChanged(i)
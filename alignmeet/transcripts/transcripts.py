@@ -10,6 +10,7 @@ from ..transcripts.dialog_act_model import DAModel
 from ..transcripts.speaker_editor import SpeakerEditor
 from ..transcripts.dialog_act_editor import DialogActEditor
 from ..transcripts.transcript import Transcript
+from ..transcripts.search import Search
 from ..annotation import Annotation, DialogAct
 from ..combobox import ComboBox
 
@@ -155,6 +156,12 @@ class Transcripts(QWidget):
 
         self.matches = []
         self.current = None
+        self._search_valid = True
+        self._pending_next = None # direction of a Next/Previous waiting for the search
+        self.search_engine = Search(self.annotation, self)
+        self.search_engine.started.connect(self._search_started)
+        self.search_engine.found.connect(self._search_found)
+        self.search_engine.finished.connect(self._search_finished)
         search = QLineEdit(self)
         search.returnPressed.connect(lambda: self.next(True))
         search.textChanged.connect(self.seach_changed)
@@ -183,15 +190,22 @@ class Transcripts(QWidget):
 
         self.only_matches = QCheckBox('show matches only')
         self.only_matches.setChecked(False)
-        self.only_matches.stateChanged.connect(lambda: self.seach_changed(search.text()))
+        self.only_matches.stateChanged.connect(self._only_matches_changed)
         search_options_layout.addWidget(self.only_matches)
 
         self.ignore_case = QCheckBox('ignore case')
         self.ignore_case.setChecked(True)
-        self.ignore_case.stateChanged.connect(lambda: self.seach_changed(search.text()))
+        self.ignore_case.stateChanged.connect(lambda: self.seach_changed(search.text(), False))
         search_options_layout.addWidget(self.ignore_case)
         
     def next(self, next):
+        if self.search_engine.pending():
+            self.search_engine.run()
+        if self.search_engine.running() and (not self.matches or not next):
+            # the first match (or the last one) is not known yet: the search moves
+            # there once it is
+            self._pending_next = next
+            return
         if len(self.matches) > 0:
             d = 1 if next else -1
             if self.current is None:
@@ -207,39 +221,68 @@ class Transcripts(QWidget):
                 self.search.setFocus(Qt.ShortcutFocusReason)
             self.search_status.setText('0 matches')
 
-    def seach_changed(self, text):
-        matches = []
+    def seach_changed(self, text, delay = True):
+        # searched in the background once typing stops, see search.Search
         flags = re.UNICODE
         if self.ignore_case.isChecked():
             flags |= re.IGNORECASE
-        valid = False
-        try:
-            ex = re.compile(text, flags)
-            valid = True
-        except:
-            ex = re.compile('', flags)
-        
-        for i in range(self.annotation.das_count()):
-            d = self.annotation.get_dialog_act(i)
-            if ex.search(d.text) is not None or ex.search(d.speaker) is not None:
-                matches.append(i)
-                self.transcript.setRowHidden(i, False)
-            else:
-                self.transcript.setRowHidden(i, self.only_matches.isChecked())
+        self.search_engine.search(text, flags, delay)
+
+    @Slot()
+    def _only_matches_changed(self):
+        # the rows not matching the last query are hidden or shown by a search of all rows
+        self.search_engine.reset()
+        self.seach_changed(self.search.text(), False)
+
+    @Slot(object, bool)
+    def _search_started(self, ex, valid):
         if valid:
-            self.search_status.setText(f'{len(matches)} matches')
+            self.search_status.setText('Searching...')
             self.search.setStyleSheet("")
-            
-            self.model.highlight = ex if len(text) > 0 else None
         else:
-            self.model.highlight = None
             self.search_status.setText(f'Invalid regular expression')
             self.search.setStyleSheet("QLineEdit { background-color: red }")
-
-        self.model.update()
-        self.matches = matches
+        # rows highlighted by the previous query
+        self.model.set_highlight(ex, self.matches if self.model.highlight is not None else [])
+        self._search_valid = valid
+        self.matches = []
         self.current = None
 
+    @Slot(object, object)
+    def _search_found(self, scanned, matched):
+        rows = self.annotation.das_count()
+        self.matches.extend(i for i in matched if i < rows)
+        if self.model.highlight is not None:
+            self.model.set_highlight(self.model.highlight, [i for i in matched if i < rows])
+        hide = self.only_matches.isChecked()
+        matched = set(matched)
+        for i in scanned:
+            if i >= rows:
+                break
+            hidden = hide and i not in matched
+            if self.transcript.isRowHidden(i) != hidden:
+                self.transcript.setRowHidden(i, hidden)
+        if self._search_valid:
+            self._show_search_status(True)
+        if self._pending_next is True and self.matches:
+            self._pending_next = None
+            self.next(True)
+
+    @Slot()
+    def _search_finished(self):
+        if self._search_valid:
+            self._show_search_status(False)
+        if self._pending_next is not None:
+            next, self._pending_next = self._pending_next, None
+            self.next(next)
+
+    def _show_search_status(self, running):
+        more = '...' if running else ''
+        if self.current is not None:
+            self.search_status.setText(f'Match {self.current + 1}/{len(self.matches)}{more}')
+        else:
+            self.search_status.setText(f'{len(self.matches)} matches{more}')
+
     def set_evaluation_mode(self, evaluation):
         self._evaluation_mode = evaluation
 
@@ -312,6 +355,7 @@ class Transcripts(QWidget):
     def _selection_changed(self):
         selected_rows = self.selected_rows()
         self.annotation.selected_das = selected_rows
+        self.annotation.selection_changed.emit()
         if self.edit.isChecked():
             self.deleteAction.setEnabled(len(selected_rows) > 0 and not self._evaluation_mode)
         self.resetAction.setEnabled(len(selected_rows) > 0 and not self._evaluation_mode)
@@ -393,6 +437,7 @@ class InsertCommand(QUndoCommand):
 
     def redo(self):
         self.transcripts.model.insertRow(self.row_index, self.new_da)
+        self.transcripts.annotation.mark_dirty([self.new_da])
 
     def undo(self):
         self.transcripts.model.removeRows(self.row_index, 1)
@@ -431,12 +476,15 @@ class JoinUpCommand(QUndoCommand):
         else:
             line_to_ref.speaker = self.second_old_line.speaker
         #remove old line
-        self.transctipts.annotation.remove_das(self.what, 1)
+        self.transctipts.model.removeRows(self.what, 1)
+        self.transctipts.annotation.mark_dirty([line_to_ref])
 
     def undo(self):
-        self.transctipts.annotation.remove_das(self.to, 1)
-        self.transctipts.annotation.insert_da(self.to, self.first_old_line)
-        self.transctipts.annotation.insert_da(self.what, self.second_old_line)
+        self.transctipts.model.removeRows(self.to, 1)
+        self.transctipts.model.insertRow(self.to, self.first_old_line)
+        self.transctipts.model.insertRow(self.what, self.second_old_line)
+        # the copies keep their embeddings unless those were still pending
+        self.transctipts.annotation.mark_dirty([l for l in (self.first_old_line, self.second_old_line) if l.embed is None])
 
 class JoinDownCommand(QUndoCommand):
     def __init__(self, transctipts, what, to, text):
@@ -457,9 +505,11 @@ class JoinDownCommand(QUndoCommand):
                 line_to_ref.speaker = f'{self.first_old_line.speaker},{line_to_ref.speaker}' #TODO: report error
         else:
             line_to_ref.speaker = self.first_old_line.speaker
-        self.transctipts.annotation.remove_das(self.what, 1)
+        self.transctipts.model.removeRows(self.what, 1)
+        self.transctipts.annotation.mark_dirty([line_to_ref])
 
     def undo(self):
-        self.transctipts.annotation.remove_das(self.what, 1)
-        self.transctipts.annotation.insert_da(self.what, self.first_old_line)
-        self.transctipts.annotation.insert_da(self.to, self.second_old_line)
+        self.transctipts.model.removeRows(self.what, 1)
+        self.transctipts.model.insertRow(self.what, self.first_old_line)
+        self.transctipts.model.insertRow(self.to, self.second_old_line)
+        self.transctipts.annotation.mark_dirty([l for l in (self.first_old_line, self.second_old_line) if l.embed is None])